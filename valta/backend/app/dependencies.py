@@ -0,0 +1,64 @@
+from fastapi import Depends, HTTPException, status
+from sqlalchemy.orm import Session, load_only
+
+from app.database import get_db
+from app.models.document import Document
+
+# Columns most endpoints need; the text/JSON blobs stay unloaded
+DOCUMENT_SUMMARY_COLUMNS = (
+    Document.id,
+    Document.filename,
+    Document.original_filename,
+    Document.file_path,
+    Document.file_size,
+    Document.mime_type,
+    Document.content_hash,
+    Document.status,
+    Document.processing_progress,
+    Document.created_at,
+)
+
+
+# Summary plus what /content serves; structured_data itself is read from its
+# pre-serialized copy
+DOCUMENT_CONTENT_COLUMNS = DOCUMENT_SUMMARY_COLUMNS + (
+    Document.raw_text,
+    Document.extracted_metrics,
+    Document.structured_data_json,
+)
+
+
+class DocumentLoader:
+    """Dependency that loads a document by id or raises 404 (and 400 if still processing)"""
+
+    def __init__(self, require_completed: bool = False, columns=DOCUMENT_SUMMARY_COLUMNS):
+        self.require_completed = require_completed
+        self.columns = columns
+
+    def __call__(self, document_id: int, db: Session = Depends(get_db)) -> Document:
+        return self.load(db, document_id)
+
+    def load(self, db: Session, document_id: int) -> Document:
+        query = db.query(Document)
+        if self.columns:
+            query = query.options(load_only(*self.columns))
+
+        document = query.filter(Document.id == document_id).first()
+        if not document:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Document not found"
+            )
+
+        if self.require_completed and document.status != "completed":
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Document is still being processed"
+            )
+
+        return document
+
+
+get_doc_or_404 = DocumentLoader()
+get_completed_doc_or_404 = DocumentLoader(require_completed=True)
+get_completed_doc_content_or_404 = DocumentLoader(require_completed=True, columns=DOCUMENT_CONTENT_COLUMNS)
@@ -1,3 +1,3 @@
-from .document import Document, DocumentChunk, Query
+from .document import Document, DocumentChunk, Query, AccountMapping, LLMCache
 
-__all__ = ["Document", "DocumentChunk", "Query"]
\ No newline at end of file
+__all__ = ["Document", "DocumentChunk", "Query", "AccountMapping", "LLMCache"]
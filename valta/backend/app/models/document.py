@@ -1,7 +1,11 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Float, Boolean, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Text, Float, Boolean, JSON, ForeignKey
+from sqlalchemy.ext.mutable import MutableDict
 from sqlalchemy.sql import func
 from app.database import Base
 
+# File extensions the P&L parser accepts (used to set Document.is_pl at upload)
+PL_FILE_EXTENSIONS = ('csv', 'xlsx', 'xls')
+
 class Document(Base):
     __tablename__ = "documents"
 
@@ -11,6 +15,9 @@ class Document(Base):
     file_path = Column(String, nullable=False)
     file_size = Column(Integer, nullable=False)
     mime_type = Column(String, nullable=False)
+    content_hash = Column(String(64), nullable=True)  # sha256 of the uploaded bytes
+    file_ext = Column(String(8), nullable=True)  # lower-case, without the dot
+    is_pl = Column(Boolean, nullable=True)  # CSV/Excel file the P&L parser can read
 
     # Processing status
     status = Column(String, default="uploaded")  # uploaded, processing, completed, failed
@@ -20,13 +27,16 @@ class Document(Base):
     # Extracted content
     raw_text = Column(Text, nullable=True)
     structured_data = Column(JSON, nullable=True)
+    structured_data_json = Column(Text, nullable=True)  # pre-serialized, NaN-free copy served by /content
+    rendered_content = Column(Text, nullable=True)  # render_structured_data() output used in AI prompts
     document_metadata = Column(JSON, nullable=True)
 
     # Financial metrics extracted
     extracted_metrics = Column(JSON, nullable=True)
 
     # Additional custom data (for startup metrics, commentary, etc.)
-    custom_data = Column(JSON, nullable=True)
+    # MutableDict so custom_data['key'] = ... marks the row dirty
+    custom_data = Column(MutableDict.as_mutable(JSON), nullable=True)
 
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -37,7 +47,7 @@ class DocumentChunk(Base):
     __tablename__ = "document_chunks"
 
     id = Column(Integer, primary_key=True, index=True)
-    document_id = Column(Integer, nullable=False)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), index=True, nullable=False)
     chunk_index = Column(Integer, nullable=False)
     content = Column(Text, nullable=False)
     embedding_id = Column(String, nullable=True)  # Pinecone vector ID
@@ -57,4 +67,30 @@ class Query(Base):
     confidence_score = Column(Float, nullable=True)
     processing_time = Column(Float, nullable=True)
 
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class AccountMapping(Base):
+    __tablename__ = "account_mapping_cache"
+
+    # Normalized account name + the model that categorized it
+    name_norm = Column(String, primary_key=True)
+    source = Column(String, primary_key=True)
+    category = Column(String, nullable=False)
+    subcategory = Column(String, nullable=True)
+    is_subtotal = Column(Boolean, default=False)
+    confidence = Column(Float, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class LLMCache(Base):
+    __tablename__ = "llm_cache"
+
+    # blake2b of the prompt inputs + the version of the prompt template
+    input_hash = Column(String(32), primary_key=True)
+    prompt_version = Column(String, primary_key=True)
+    response_json = Column(Text, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)  # naive UTC
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,17 +1,26 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, status
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session, load_only
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 import os
 import io
-
-from app.database import get_db
-from app.models.document import Document, Query
+import asyncio
+import uuid
+import numpy as np
+import orjson
+
+from app.database import get_db, SessionLocal
+from app.dependencies import get_doc_or_404, get_completed_doc_or_404, DOCUMENT_SUMMARY_COLUMNS
+from app.models.document import Document, DocumentChunk, Query
 from app.services.ai_analyzer import AIAnalyzer
 from app.services.pl_parser import PLParser
 from app.services.account_mapper import AccountMapper
 from app.services.waterfall_calculator import WaterfallCalculator
+from app.services.pl_cache import pl_cache
+from app.services.semantic_cache import SemanticAnswerCache, document_cache_key
+from app.services.document_content import render_structured_data_columnar
 
 router = APIRouter()
 
@@ -63,26 +72,60 @@ class WorkbookResponse(BaseModel):
 # Initialize AI analyzer
 ai_analyzer = AIAnalyzer()
 
+# Answers for repeated/near-identical questions, scoped by document content (see _cache_scope)
+answer_cache = SemanticAnswerCache(embed_fn=ai_analyzer.embed_texts)
+# Generated workbooks, scoped the same way
+workbook_cache = SemanticAnswerCache(embed_fn=ai_analyzer.embed_texts)
+
+# Workbook context size: spreadsheet data up to this many characters (the old
+# 10 text chunks' worth), text documents their leading chunks
+WORKBOOK_CONTEXT_CHARS = 10_000
+WORKBOOK_CONTEXT_CHUNKS = 10
+
+def _cache_scope(db: Session, document: Optional[Document]):
+    """
+    Answer cache scope: the document's content hash, or for all-documents
+    questions the set of completed documents' hashes (so it changes whenever
+    a document is added or removed)
+    """
+    if document is not None:
+        return document_cache_key(document)
+
+    rows = db.query(Document.id, Document.content_hash).filter(Document.status == "completed").all()
+    return frozenset(document_cache_key(row) for row in rows)
+
+def _record_query(document_id: Optional[int], question: str, result: Dict):
+    """Persist an answered question; runs as a background task after the response"""
+    db = SessionLocal()
+    try:
+        db.execute(insert(Query).values(
+            document_id=document_id,
+            question=question,
+            answer=result["answer"],
+            sources=result["sources"],
+            confidence_score=result["confidence_score"],
+            processing_time=result["processing_time"]
+        ))
+        db.commit()
+    finally:
+        db.close()
+
 @router.post("/ask", response_model=AnalysisResponse)
 async def ask_question(
     request: AnalysisRequest,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """Ask a question about one or more documents"""
 
     # Validate document exists if document_id provided
-    if request.document_id:
-        document = db.query(Document).filter(Document.id == request.document_id).first()
-        if not document:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Document not found"
-            )
-        if document.status != "completed":
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Document is still being processed"
-            )
+    document = get_completed_doc_or_404.load(db, request.document_id) if request.document_id else None
+
+    cache_scope = _cache_scope(db, document)
+    cached, question_embedding = await answer_cache.lookup(cache_scope, request.question)
+    if cached is not None:
+        background_tasks.add_task(_record_query, request.document_id, request.question, cached.model_dump())
+        return cached
 
     # Process the question using AI analyzer
     result = await ai_analyzer.analyze_question(
@@ -91,22 +134,75 @@ async def ask_question(
         db=db
     )
 
-    # Save query to database
-    query = Query(
-        document_id=request.document_id,
-        question=request.question,
-        answer=result["answer"],
-        sources=result["sources"],
-        confidence_score=result["confidence_score"],
-        processing_time=result["processing_time"]
+    # Save query to database once the response has been sent
+    background_tasks.add_task(_record_query, request.document_id, request.question, result)
+
+    response = _to_analysis_response(result)
+
+    # Only cache real model answers, not error/fallback text
+    if result.get("model_used"):
+        answer_cache.store(cache_scope, request.question, response, question_embedding)
+
+    return response
+
+@router.post("/ask/stream")
+async def ask_question_stream(
+    request: AnalysisRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
+    """
+    Ask a question and receive the answer as Server-Sent Events
+
+    Emits "delta" events with answer text as it is generated, then a single
+    "done" event with the full AnalysisResponse.
+    """
+
+    # Validate document exists if document_id provided
+    document = get_completed_doc_or_404.load(db, request.document_id) if request.document_id else None
+
+    cache_scope = _cache_scope(db, document)
+    cached, question_embedding = await answer_cache.lookup(cache_scope, request.question)
+
+    async def events():
+        if cached is not None:
+            background_tasks.add_task(_record_query, request.document_id, request.question, cached.model_dump())
+            yield _sse("delta", {"text": cached.answer})
+            yield _sse("done", cached.model_dump())
+            return
+
+        # The request's session may be closed before streaming finishes, so use our own
+        stream_db = SessionLocal()
+        try:
+            async for event in ai_analyzer.stream_question(request.question, request.document_id, stream_db):
+                if event["type"] == "delta":
+                    yield _sse("delta", {"text": event["text"]})
+                    continue
+
+                # Runs after the stream has been fully sent
+                background_tasks.add_task(_record_query, request.document_id, request.question, event)
+                response = _to_analysis_response(event)
+                if event.get("model_used"):
+                    answer_cache.store(cache_scope, request.question, response, question_embedding)
+                yield _sse("done", response.model_dump())
+        finally:
+            stream_db.close()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
-    db.add(query)
-    db.commit()
 
+def _sse(event: str, data: Dict) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+def _to_analysis_response(result: Dict) -> AnalysisResponse:
     return AnalysisResponse(
         answer=result["answer"],
+        # Sources are built internally by the analyzer, so skip per-item validation
         sources=[
-            SourceCitation(
+            SourceCitation.model_construct(
                 document_id=source["document_id"],
                 document_name=source["document_name"],
                 page_number=source.get("page_number"),
@@ -120,22 +216,13 @@ async def ask_question(
     )
 
 @router.get("/document/{document_id}/insights", response_model=DocumentInsights)
-async def get_document_insights(document_id: int, db: Session = Depends(get_db)):
+async def get_document_insights(
+    document_id: int,
+    document: Document = Depends(get_completed_doc_or_404),
+    db: Session = Depends(get_db)
+):
     """Get AI-generated insights for a specific document"""
 
-    document = db.query(Document).filter(Document.id == document_id).first()
-    if not document:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Document not found"
-        )
-
-    if document.status != "completed":
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Document is still being processed"
-        )
-
     # Generate insights using AI analyzer
     insights = await ai_analyzer.generate_document_insights(document_id, db)
 
@@ -155,13 +242,20 @@ async def get_document_insights(document_id: int, db: Session = Depends(get_db))
 async def get_recent_queries(limit: int = 10, db: Session = Depends(get_db)):
     """Get recent queries for the current user"""
 
-    queries = db.query(Query).order_by(Query.created_at.desc()).limit(limit).all()
+    # Truncate answers in SQL; one extra character tells us whether to add "..."
+    queries = db.query(
+        Query.id,
+        Query.question,
+        func.substr(Query.answer, 1, 201).label("answer"),
+        Query.confidence_score,
+        Query.created_at
+    ).order_by(Query.created_at.desc()).limit(limit).all()
 
     return [
         {
             "id": query.id,
             "question": query.question,
-            "answer": query.answer[:200] + "..." if len(query.answer) > 200 else query.answer,
+            "answer": query.answer[:200] + "..." if query.answer and len(query.answer) > 200 else query.answer,
             "confidence_score": query.confidence_score,
             "created_at": query.created_at.isoformat()
         }
@@ -186,27 +280,103 @@ class WaterfallRequest(BaseModel):
     top_n: int = 5
 
 
+CSV_EXPORT_BATCH_ROWS = 5000
+
+
+def _load_mapped_pl(
+    file_path: str,
+    user_hints: Optional[Dict] = None,
+    content_hash: Optional[str] = None
+):
+    """
+    Parse a P&L file and map its accounts, reusing a cached result when the
+    same file has already been processed with the same hints
+    """
+    cache_key = pl_cache.make_key(file_path, user_hints, content_hash)
+    cached = pl_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    parser = PLParser()
+    try:
+        parse_result = parser.parse_file(file_path, user_hints)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to parse P&L: {str(e)}")
+
+    # Map accounts using AI
+    mapper = AccountMapper(use_ai=True, ai_provider='claude')
+    account_col = parse_result['metadata']['columns']['account']
+
+    try:
+        mapped_df = mapper.batch_categorize_dataframe(parse_result['data'], account_col)
+    except Exception as e:
+        # If mapping fails, continue without it (and don't cache the unmapped result)
+        print(f"Account mapping failed: {e}")
+        return parse_result['data'], parse_result['metadata']
+
+    pl_cache.set(cache_key, mapped_df, parse_result['metadata'])
+    return mapped_df, parse_result['metadata']
+
+
+def _summarize_periods(mapped_df, account_col: str):
+    """Available periods, suggested comparison ranges and metric options for a P&L"""
+    calc = WaterfallCalculator(mapped_df, account_col)
+    available_periods = calc.get_available_periods()
+    suggested_periods = calc.suggest_period_ranges(available_periods)
+    return available_periods, suggested_periods, calc.get_metric_options()
+
+
+def _calculate_waterfall_data(
+    mapped_df,
+    account_col: str,
+    request: WaterfallRequest,
+    period1_cols: List[str],
+    period2_cols: List[str]
+) -> Dict:
+    """Run the waterfall calculation for the requested metric"""
+    calc = WaterfallCalculator(mapped_df, account_col)
+
+    # Check if metric is derived
+    if request.metric in ['gross_profit', 'operating_profit', 'net_profit']:
+        return calc.calculate_derived_metric(
+            request.metric,
+            period1_cols,
+            period2_cols,
+            request.top_n
+        )
+
+    # Map metric to category filter
+    metric_category_map = {
+        'revenue': 'Revenue',
+        'cogs': 'Cost of Goods Sold',
+        'opex': 'Operating Expenses'
+    }
+
+    metric_filter = metric_category_map.get(request.metric)
+
+    return calc.calculate_waterfall(
+        request.metric,
+        period1_cols,
+        period2_cols,
+        request.top_n,
+        metric_filter
+    )
+
+
 @router.post("/document/{document_id}/pl-parse")
 async def parse_pl_document(
-    document_id: int,
     request: PLParseRequest = None,
-    db: Session = Depends(get_db)
+    document: Document = Depends(get_doc_or_404)
 ):
     """
     Parse a P&L document and return structured data with account mappings
     """
-    document = db.query(Document).filter(Document.id == document_id).first()
-    if not document:
-        raise HTTPException(status_code=404, detail="Document not found")
-
     # Get file path
-    file_path = document.filename
+    file_path = document.file_path
 
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Document file not found")
 
-    # Parse P&L
-    parser = PLParser()
     user_hints = {}
 
     if request:
@@ -217,30 +387,16 @@ async def parse_pl_document(
         if request.date_columns:
             user_hints['date_columns'] = request.date_columns
 
-    try:
-        parse_result = parser.parse_file(file_path, user_hints if user_hints else None)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to parse P&L: {str(e)}")
-
-    # Map accounts using AI
-    mapper = AccountMapper(use_ai=True, ai_provider='claude')
-    account_col = parse_result['metadata']['columns']['account']
-
-    try:
-        mapped_df = mapper.batch_categorize_dataframe(
-            parse_result['data'],
-            account_col
-        )
-    except Exception as e:
-        # If mapping fails, continue without it
-        mapped_df = parse_result['data']
-        print(f"Account mapping failed: {e}")
+    # Parsing, AI mapping and pandas work are blocking; keep them off the event loop
+    mapped_df, parse_metadata = await asyncio.to_thread(
+        _load_mapped_pl, file_path, user_hints if user_hints else None, document.content_hash
+    )
+    account_col = parse_metadata['columns']['account']
 
     # Calculate available periods
-    calc = WaterfallCalculator(mapped_df, account_col)
-    available_periods = calc.get_available_periods()
-    suggested_periods = calc.suggest_period_ranges(available_periods)
-    metric_options = calc.get_metric_options()
+    available_periods, suggested_periods, metric_options = await asyncio.to_thread(
+        _summarize_periods, mapped_df, account_col
+    )
 
     # Get items needing review
     items_needing_review = []
@@ -251,8 +407,8 @@ async def parse_pl_document(
     return {
         "success": True,
         "metadata": {
-            "header_row": parse_result['metadata']['header_row'],
-            "columns": parse_result['metadata']['columns'],
+            "header_row": parse_metadata['header_row'],
+            "columns": parse_metadata['columns'],
             "total_accounts": len(mapped_df),
             "total_periods": len(available_periods),
             "available_periods": available_periods,
@@ -266,92 +422,51 @@ async def parse_pl_document(
 
 @router.post("/document/{document_id}/pl-waterfall")
 async def get_pl_waterfall(
-    document_id: int,
     request: WaterfallRequest,
-    db: Session = Depends(get_db)
+    document: Document = Depends(get_doc_or_404)
 ):
     """
     Generate waterfall bridge chart data for period comparison
     """
-    document = db.query(Document).filter(Document.id == document_id).first()
-    if not document:
-        raise HTTPException(status_code=404, detail="Document not found")
-
-    file_path = document.filename
+    file_path = document.file_path
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Document file not found")
 
-    # Re-parse document (in production, cache this)
-    parser = PLParser()
-    try:
-        parse_result = parser.parse_file(file_path)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to parse P&L: {str(e)}")
-
-    # Map accounts
-    mapper = AccountMapper(use_ai=True, ai_provider='claude')
-    account_col = parse_result['metadata']['columns']['account']
-
-    try:
-        mapped_df = mapper.batch_categorize_dataframe(parse_result['data'], account_col)
-    except:
-        mapped_df = parse_result['data']
+    mapped_df, parse_metadata = await asyncio.to_thread(
+        _load_mapped_pl, file_path, content_hash=document.content_hash
+    )
+    account_col = parse_metadata['columns']['account']
 
     # Find period columns
-    value_cols = parse_result['metadata']['columns']['values']
+    value_cols = parse_metadata['columns']['values']
     date_cols = [col for col in mapped_df.columns if col.endswith('_normalized')]
 
-    # Filter columns for requested periods
+    # Classify value columns into the requested periods using the first row's
+    # normalized dates (value_cols[i] pairs with date_cols[i])
     period1_cols = []
     period2_cols = []
 
-    for value_col in value_cols:
-        # Find corresponding date column
-        col_idx = value_cols.index(value_col)
-        if col_idx < len(date_cols):
-            date_col = date_cols[col_idx]
-
-            # Check if this column falls in period 1 or period 2
-            for idx, row in mapped_df.head(1).iterrows():
-                period_value = row.get(date_col)
-                if period_value:
-                    if request.period1_start <= period_value <= request.period1_end:
-                        period1_cols.append(value_col)
-                    elif request.period2_start <= period_value <= request.period2_end:
-                        period2_cols.append(value_col)
+    n_cols = min(len(value_cols), len(date_cols))
+    if n_cols and not mapped_df.empty:
+        first_row = mapped_df[date_cols[:n_cols]].iloc[0]
+        has_period = (first_row.notna() & (first_row != '')).to_numpy()
+        periods = np.where(has_period, first_row.astype(str).to_numpy(), '')
+
+        in_period1 = has_period & (periods >= request.period1_start) & (periods <= request.period1_end)
+        in_period2 = has_period & ~in_period1 & (periods >= request.period2_start) & (periods <= request.period2_end)
+
+        value_arr = np.asarray(value_cols[:n_cols], dtype=object)
+        period1_cols = value_arr[in_period1].tolist()
+        period2_cols = value_arr[in_period2].tolist()
 
     if not period1_cols or not period2_cols:
         raise HTTPException(status_code=400, detail="No data found for specified periods")
 
     # Calculate waterfall
-    calc = WaterfallCalculator(mapped_df, account_col)
-
     try:
-        # Check if metric is derived
-        if request.metric in ['gross_profit', 'operating_profit', 'net_profit']:
-            waterfall_data = calc.calculate_derived_metric(
-                request.metric,
-                period1_cols,
-                period2_cols,
-                request.top_n
-            )
-        else:
-            # Map metric to category filter
-            metric_category_map = {
-                'revenue': 'Revenue',
-                'cogs': 'Cost of Goods Sold',
-                'opex': 'Operating Expenses'
-            }
-
-            metric_filter = metric_category_map.get(request.metric)
-
-            waterfall_data = calc.calculate_waterfall(
-                request.metric,
-                period1_cols,
-                period2_cols,
-                request.top_n,
-                metric_filter
-            )
+        waterfall_data = await asyncio.to_thread(
+            _calculate_waterfall_data, mapped_df, account_col, request, period1_cols, period2_cols
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to calculate waterfall: {str(e)}")
 
@@ -366,34 +481,31 @@ async def get_pl_waterfall(
 
 
 @router.get("/document/{document_id}/pl-export")
-async def export_pl_data(document_id: int, db: Session = Depends(get_db)):
+async def export_pl_data(document_id: int, document: Document = Depends(get_doc_or_404)):
     """
     Export cleansed P&L data as CSV
     """
-    document = db.query(Document).filter(Document.id == document_id).first()
-    if not document:
-        raise HTTPException(status_code=404, detail="Document not found")
-
-    file_path = document.filename
+    file_path = document.file_path
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Document file not found")
 
     # Parse and map
-    parser = PLParser()
-    parse_result = parser.parse_file(file_path)
-
-    mapper = AccountMapper(use_ai=True, ai_provider='claude')
-    account_col = parse_result['metadata']['columns']['account']
-    mapped_df = mapper.batch_categorize_dataframe(parse_result['data'], account_col)
+    mapped_df, _ = await asyncio.to_thread(
+        _load_mapped_pl, file_path, content_hash=document.content_hash
+    )
 
-    # Convert to CSV
-    csv_buffer = io.StringIO()
-    mapped_df.to_csv(csv_buffer, index=False)
-    csv_buffer.seek(0)
+    # Stream CSV in row batches so the whole file is never held in memory
+    def generate_csv():
+        for start in range(0, max(len(mapped_df), 1), CSV_EXPORT_BATCH_ROWS):
+            csv_buffer = io.StringIO()
+            mapped_df.iloc[start:start + CSV_EXPORT_BATCH_ROWS].to_csv(
+                csv_buffer, header=(start == 0), index=False
+            )
+            yield csv_buffer.getvalue().encode()
 
     # Return as downloadable file
     return StreamingResponse(
-        io.BytesIO(csv_buffer.getvalue().encode()),
+        generate_csv(),
         media_type="text/csv",
         headers={
             "Content-Disposition": f"attachment; filename=pl_export_{document_id}.csv"
@@ -412,19 +524,16 @@ async def generate_workbook(
     Generate an Excel-style workbook based on user question and document data.
     Uses AI to analyze uploaded documents and create relevant financial tables.
     """
-    import uuid
-    import pandas as pd
-    from app.models.document import DocumentChunk
-
-    # Get all available documents or specific document
+    # Get all available documents or specific document (content columns aren't needed)
+    documents_query = db.query(Document).options(load_only(*DOCUMENT_SUMMARY_COLUMNS))
     if request.document_id:
-        documents = db.query(Document).filter(
+        documents = documents_query.filter(
             Document.id == request.document_id,
             Document.status == "completed"
         ).all()
     else:
         # Use all completed documents
-        documents = db.query(Document).filter(Document.status == "completed").all()
+        documents = documents_query.filter(Document.status == "completed").all()
 
     if not documents:
         raise HTTPException(
@@ -432,20 +541,15 @@ async def generate_workbook(
             detail="No completed documents found for analysis"
         )
 
-    # Get document chunks for context
-    document_ids = [doc.id for doc in documents]
-    chunks = db.query(DocumentChunk).filter(
-        DocumentChunk.document_id.in_(document_ids)
-    ).limit(50).all()  # Limit chunks for performance
-
-    # Create a mapping of document IDs to filenames
-    doc_map = {doc.id: doc.original_filename for doc in documents}
+    if request.document_id:
+        cache_scope = document_cache_key(documents[0])
+    else:
+        cache_scope = frozenset(document_cache_key(document) for document in documents)
+    workbook_data, question_embedding = await workbook_cache.lookup(cache_scope, request.question)
+    if workbook_data is not None:
+        return _to_workbook_response(workbook_data, str(uuid.uuid4()))
 
-    # Build context from chunks
-    context_text = "\n\n".join([
-        f"From {doc_map.get(chunk.document_id, 'Unknown')}:\n{chunk.content}"
-        for chunk in chunks[:10]  # Use top 10 chunks for initial context
-    ])
+    context_text = _build_workbook_context(db, documents)
 
     # Use AI to generate workbook based on question
     workbook_data = await ai_analyzer.generate_workbook(
@@ -455,8 +559,49 @@ async def generate_workbook(
         db=db
     )
 
-    conversation_id = str(uuid.uuid4())
+    # Only cache model-generated workbooks, not the offline fallback
+    if workbook_data.get("model_used"):
+        workbook_cache.store(cache_scope, request.question, workbook_data, question_embedding)
 
+    return _to_workbook_response(workbook_data, str(uuid.uuid4()))
+
+
+def _build_workbook_context(db: Session, documents: List[Document]) -> str:
+    """
+    Financial data context for workbook generation: spreadsheet rows in compact
+    columnar form, plus the leading text chunks of documents without sheets
+    """
+    parts = []
+    remaining = WORKBOOK_CONTEXT_CHARS
+    text_document_ids = []
+
+    structured_rows = db.query(Document.id, Document.original_filename, Document.structured_data_json).filter(
+        Document.id.in_([doc.id for doc in documents])
+    ).order_by(Document.id).all()
+    for row in structured_rows:
+        structured_data = orjson.loads(row.structured_data_json) if row.structured_data_json else None
+        if remaining > 0:
+            sheets_text = render_structured_data_columnar(structured_data, remaining)
+            if sheets_text:
+                parts.append(f"From {row.original_filename}:\n{sheets_text.rstrip()}")
+                remaining -= len(sheets_text)
+                continue
+        if not structured_data or not structured_data.get("sheets"):
+            text_document_ids.append(row.id)
+
+    if text_document_ids:
+        # Leading chunks for initial context, with each chunk's filename joined in
+        chunks = db.query(DocumentChunk.content, Document.original_filename).join(
+            Document, Document.id == DocumentChunk.document_id
+        ).filter(
+            DocumentChunk.document_id.in_(text_document_ids)
+        ).order_by(DocumentChunk.id).limit(WORKBOOK_CONTEXT_CHUNKS).all()
+        parts.extend(f"From {chunk.original_filename}:\n{chunk.content}" for chunk in chunks)
+
+    return "\n\n".join(parts)
+
+
+def _to_workbook_response(workbook_data: Dict, conversation_id: str) -> WorkbookResponse:
     return WorkbookResponse(
         title=workbook_data["title"],
         sheets=[
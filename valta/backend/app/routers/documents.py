@@ -1,15 +1,24 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, status
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, Query, BackgroundTasks, Request, status
+from fastapi.responses import FileResponse, Response, ORJSONResponse
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import os
 import uuid
 import shutil
+import hashlib
+import time
 from pathlib import Path
+import aiofiles
+import aiofiles.os
+import orjson
 
 from app.database import get_db
-from app.models.document import Document
+from app.dependencies import get_doc_or_404, get_completed_doc_content_or_404
+from app.models.document import Document, PL_FILE_EXTENSIONS
+from app.services.ai_analyzer import delete_embeddings
 from app.services.document_processor import DocumentProcessor
+from app.services.semantic_cache import document_cache_key, invalidate_document
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -30,16 +39,56 @@ class DocumentResponse(BaseModel):
 class DocumentListResponse(BaseModel):
     documents: List[DocumentResponse]
     total: int
+    next_cursor: Optional[int] = None
 
 # Create uploads directory
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024
+# Allowance for multipart boundaries/headers when checking Content-Length
+MULTIPART_OVERHEAD = 64 * 1024
+CONTENT_JSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
 # Initialize document processor
 document_processor = DocumentProcessor()
 
+# Cached document count for list_documents (reset on upload/delete)
+DOCUMENT_COUNT_TTL = 60
+_document_count = {"value": None, "expires_at": 0.0}
+
+def _count_documents(db: Session) -> int:
+    if _document_count["value"] is None or time.monotonic() >= _document_count["expires_at"]:
+        _document_count["value"] = db.query(func.count(Document.id)).scalar()
+        _document_count["expires_at"] = time.monotonic() + DOCUMENT_COUNT_TTL
+    return _document_count["value"]
+
+def _invalidate_document_count():
+    _document_count["value"] = None
+
+# Leading bytes each accepted type must start with (DOCX/XLSX are ZIP containers, XLS is OLE2)
+FILE_SIGNATURES = {
+    "application/pdf": (b"%PDF-",),
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": (b"PK\x03\x04",),
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": (b"PK\x03\x04",),
+    "application/vnd.ms-excel": (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", b"PK\x03\x04"),
+}
+
+async def limit_upload_size(request: Request, call_next):
+    """Reject oversized uploads from Content-Length before the body is read"""
+    if request.method == "POST" and request.url.path.endswith("/documents/upload"):
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD:
+            return ORJSONResponse(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                content={"detail": "File size must be less than 50MB"}
+            )
+    return await call_next(request)
+
 @router.post("/upload", response_model=DocumentResponse)
 async def upload_document(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     db: Session = Depends(get_db)
 ):
@@ -56,12 +105,12 @@ async def upload_document(
             detail="Only PDF, DOCX, and Excel files are supported"
         )
 
-    # Validate file size (max 50MB)
-    content = await file.read()
-    if len(content) > 50 * 1024 * 1024:
+    # Check the file's leading bytes actually match the claimed type
+    head = await file.read(UPLOAD_CHUNK_SIZE)
+    if not head.startswith(FILE_SIGNATURES[file.content_type]):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="File size must be less than 50MB"
+            detail="File contents do not match its declared type"
         )
 
     # Generate unique filename
@@ -69,26 +118,48 @@ async def upload_document(
     unique_filename = f"{uuid.uuid4()}{file_extension}"
     file_path = UPLOAD_DIR / unique_filename
 
-    # Save file
-    with open(file_path, "wb") as buffer:
-        buffer.write(content)
+    # Stream file to disk, validating size (max 50MB) as we go
+    file_size = 0
+    hasher = hashlib.sha256()
+    try:
+        async with aiofiles.open(file_path, "wb") as buffer:
+            chunk = head
+            while chunk:
+                file_size += len(chunk)
+                if file_size > MAX_UPLOAD_SIZE:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="File size must be less than 50MB"
+                    )
+                hasher.update(chunk)
+                await buffer.write(chunk)
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+    except Exception:
+        file_path.unlink(missing_ok=True)
+        raise
 
     # Create database record
+    file_ext = file_extension.lstrip('.').lower()[:8]
     document = Document(
         filename=unique_filename,
         original_filename=file.filename,
         file_path=str(file_path),
-        file_size=len(content),
+        file_size=file_size,
         mime_type=file.content_type,
+        content_hash=hasher.hexdigest(),
+        file_ext=file_ext,
+        is_pl=file_ext in PL_FILE_EXTENSIONS,
         status="uploaded"
     )
 
     db.add(document)
     db.commit()
     db.refresh(document)
+    _invalidate_document_count()
+    invalidate_document(document_cache_key(document))
 
-    # Start background processing
-    await document_processor.process_document_async(document.id, str(file_path))
+    # Process after the response is sent; clients poll /documents/{id} for status
+    background_tasks.add_task(document_processor.process_document_async, document.id, str(file_path))
 
     return DocumentResponse(
         id=document.id,
@@ -101,11 +172,34 @@ async def upload_document(
     )
 
 @router.get("/", response_model=DocumentListResponse)
-async def list_documents(db: Session = Depends(get_db)):
-    documents = db.query(Document).order_by(Document.created_at.desc()).all()
-
+async def list_documents(
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    # Only select the columns the list needs; skip the text/JSON blobs
+    query = db.query(
+        Document.id,
+        Document.filename,
+        Document.original_filename,
+        Document.file_size,
+        Document.status,
+        Document.processing_progress,
+        Document.created_at
+    ).order_by(Document.id.desc())  # Newest first; ids increase with upload time
+
+    # Keyset pagination (opt-in via limit): cursor is the id of the last document
+    # on the previous page. Without a limit every document is returned.
+    if cursor is not None:
+        query = query.filter(Document.id < cursor)
+    if limit is not None:
+        query = query.limit(limit)
+
+    documents = query.all()
+
+    # Rows come straight from the database; skip per-item validation
     document_responses = [
-        DocumentResponse(
+        DocumentResponse.model_construct(
             id=doc.id,
             filename=doc.filename,
             original_filename=doc.original_filename,
@@ -119,19 +213,12 @@ async def list_documents(db: Session = Depends(get_db)):
 
     return DocumentListResponse(
         documents=document_responses,
-        total=len(document_responses)
+        total=_count_documents(db),
+        next_cursor=documents[-1].id if limit is not None and len(documents) == limit else None
     )
 
 @router.get("/{document_id}", response_model=DocumentResponse)
-async def get_document(document_id: int, db: Session = Depends(get_db)):
-    document = db.query(Document).filter(Document.id == document_id).first()
-
-    if not document:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Document not found"
-        )
-
+async def get_document(document: Document = Depends(get_doc_or_404)):
     return DocumentResponse(
         id=document.id,
         filename=document.filename,
@@ -143,90 +230,65 @@ async def get_document(document_id: int, db: Session = Depends(get_db)):
     )
 
 @router.delete("/{document_id}")
-async def delete_document(document_id: int, db: Session = Depends(get_db)):
-    document = db.query(Document).filter(Document.id == document_id).first()
-
-    if not document:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Document not found"
-        )
-
+async def delete_document(
+    document: Document = Depends(get_doc_or_404),
+    db: Session = Depends(get_db)
+):
     # Delete file from filesystem
     try:
         os.remove(document.file_path)
     except FileNotFoundError:
         pass  # File already deleted
+    delete_embeddings(document.content_hash)
 
     # Delete from database
+    cache_key = document_cache_key(document)
     db.delete(document)
     db.commit()
+    _invalidate_document_count()
+    invalidate_document(cache_key)
 
     return {"message": "Document deleted successfully"}
 
 @router.get("/{document_id}/content")
-async def get_document_content(document_id: int, db: Session = Depends(get_db)):
+async def get_document_content(document: Document = Depends(get_completed_doc_content_or_404)):
     """Get document content for viewing"""
-    import math
-    import json
-
-    document = db.query(Document).filter(Document.id == document_id).first()
-
-    if not document:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Document not found"
-        )
-
-    if document.status != "completed":
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Document is still being processed"
-        )
-
-    # Clean NaN/Infinity values from structured_data
-    def clean_floats(obj):
-        if isinstance(obj, dict):
-            return {k: clean_floats(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [clean_floats(item) for item in obj]
-        elif isinstance(obj, float):
-            if math.isnan(obj) or math.isinf(obj):
-                return None
-            return obj
-        return obj
-
-    cleaned_structured_data = clean_floats(document.structured_data) if document.structured_data else None
-    cleaned_metrics = clean_floats(document.extracted_metrics) if document.extracted_metrics else None
-
-    return {
+    # orjson writes NaN/Infinity as null, so the stored JSON needs no cleaning pass
+    content = orjson.dumps({
         "id": document.id,
         "filename": document.original_filename,
         "content_type": "excel" if document.original_filename.endswith(('.xlsx', '.xls')) else "text",
-        "structured_data": cleaned_structured_data,
         "raw_text": document.raw_text,
-        "extracted_metrics": cleaned_metrics
-    }
+        "extracted_metrics": document.extracted_metrics or None
+    }, option=CONTENT_JSON_OPTIONS)
+
+    # Splice in structured_data as stored at ingest; older documents without the
+    # pre-serialized copy fall back to encoding the JSON column
+    if document.structured_data_json:
+        structured_data_json = document.structured_data_json.encode()
+    else:
+        structured_data_json = orjson.dumps(document.structured_data or None, option=CONTENT_JSON_OPTIONS)
+
+    return Response(
+        content=b'{"structured_data":' + structured_data_json + b',' + content[1:],
+        media_type="application/json"
+    )
 
 @router.get("/{document_id}/file")
-async def get_document_file(document_id: int, db: Session = Depends(get_db)):
+async def get_document_file(document: Document = Depends(get_doc_or_404)):
     """Serve the original document file for viewing in browser"""
-    document = db.query(Document).filter(Document.id == document_id).first()
-
-    if not document:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Document not found"
-        )
-
-    if not os.path.exists(document.file_path):
+    try:
+        file_stat = await aiofiles.os.stat(document.file_path)
+    except FileNotFoundError:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Document file not found on disk"
         )
 
+    # Pass the stat result through so FileResponse doesn't stat the file again
     return FileResponse(
         path=document.file_path,
         filename=document.original_filename,
-        media_type=document.mime_type
-    )
\ No newline at end of file
+        media_type=document.mime_type,
+        stat_result=file_stat
+    )
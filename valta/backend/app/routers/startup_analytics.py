@@ -8,21 +8,43 @@ API endpoints for startup-specific financial analysis:
 - /export - Export formatted reports
 """
 
-from fastapi import APIRouter, HTTPException, Depends, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import ORJSONResponse, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
-import pandas as pd
-
-from app.database import get_db
-from app.models.document import Document
+from typing import Optional, Dict, Any, Tuple
+from datetime import datetime
+import asyncio
+import hashlib
+import json
+import re
+
+from app.database import get_async_db
+from app.models.document import Document, PL_FILE_EXTENSIONS
 from app.services.pl_parser import PLParser
-from app.services.startup_metrics import StartupMetricsCalculator
-from app.services.commentary_generator import CommentaryGenerator
+from app.services.pl_cache import pl_cache, parsed_pl_cache
+from app.services.startup_metrics import StartupMetricsCalculator, calculate_runway
+from app.services.commentary_generator import CommentaryGenerator, get_commentary_generator
 
 
 router = APIRouter(prefix="/api/startup", tags=["startup-analytics"])
 
+# format -> (formatted_outputs key, media type, file extension) for /export
+EXPORT_FORMATS = {
+    'markdown': ('markdown', 'text/markdown', 'md'),
+    'text': ('plain_text', 'text/plain', 'txt'),
+    'json': ('json', 'application/json', 'json'),
+}
+
+# Period label patterns for _extract_period_label
+_YYYY_MM_RE = re.compile(r'(\d{4})-(\d{2})')
+_YEAR_RE = re.compile(r'20\d{2}')
+_MONTHS = {
+    month: month.title()
+    for month in ['january', 'february', 'march', 'april', 'may', 'june',
+                  'july', 'august', 'september', 'october', 'november', 'december']
+}
+
 
 class AnalyzeRequest(BaseModel):
     """Request model for analysis endpoint"""
@@ -42,7 +64,7 @@ class DashboardResponse(BaseModel):
 async def analyze_startup_metrics(
     document_id: int,
     request: AnalyzeRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Analyze P&L document and calculate startup metrics
@@ -55,38 +77,26 @@ async def analyze_startup_metrics(
         Calculated startup metrics including burn, runway, growth
     """
     # Get document from database
-    document = db.query(Document).filter(Document.id == document_id).first()
-    if not document:
-        raise HTTPException(status_code=404, detail="Document not found")
+    document = await _get_doc_or_404(db, document_id)
 
-    # Check if document is a P&L (check file extension)
-    file_ext = document.filename.lower().split('.')[-1]
-    if file_ext not in ['csv', 'xlsx', 'xls']:
-        raise HTTPException(
-            status_code=400,
-            detail="Document must be a P&L file (CSV or Excel)"
-        )
+    # Check if document is a P&L (flag set from the extension at upload)
+    _require_pl(document)
 
     try:
-        # Parse P&L document
-        parser = PLParser()
-        parsed_data = parser.parse_file(document.file_path)
-
-        # Calculate startup metrics
-        calculator = StartupMetricsCalculator(
-            df=parsed_data['line_items'],
-            metadata=parsed_data['metadata']
-        )
-
-        metrics = calculator.calculate_all_metrics(
-            cash_balance=request.cash_balance
+        # Parse P&L document (cached per file contents) and calculate startup
+        # metrics off the event loop
+        metrics = await asyncio.to_thread(
+            _calculate_startup_metrics,
+            document.file_path,
+            document.content_hash,
+            request.cash_balance
         )
 
         # Store metrics in document custom_data
         document.custom_data = document.custom_data or {}
         document.custom_data['startup_metrics'] = metrics
         document.custom_data['company_name'] = request.company_name
-        db.commit()
+        await db.commit()
 
         return {
             'success': True,
@@ -106,7 +116,8 @@ async def analyze_startup_metrics(
 async def generate_commentary(
     document_id: int,
     regenerate: bool = Query(False, description="Force regenerate commentary"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    generator: CommentaryGenerator = Depends(get_commentary_generator)
 ):
     """
     Generate AI-powered investor commentary
@@ -119,9 +130,7 @@ async def generate_commentary(
         AI-generated investor update commentary
     """
     # Get document from database
-    document = db.query(Document).filter(Document.id == document_id).first()
-    if not document:
-        raise HTTPException(status_code=404, detail="Document not found")
+    document = await _get_doc_or_404(db, document_id)
 
     # Check if metrics have been calculated
     if not document.custom_data or 'startup_metrics' not in document.custom_data:
@@ -141,22 +150,22 @@ async def generate_commentary(
 
     try:
         # Generate commentary
-        generator = CommentaryGenerator()
         metrics = document.custom_data['startup_metrics']
         company_name = document.custom_data.get('company_name')
 
         # Determine period label from document name or metadata
         period_label = _extract_period_label(document)
 
-        commentary = generator.generate_full_commentary(
+        commentary = await generator.generate_full_commentary(
             metrics=metrics,
             company_name=company_name,
-            period_label=period_label
+            period_label=period_label,
+            use_cache=not regenerate
         )
 
         # Cache commentary
         document.custom_data['ai_commentary'] = commentary
-        db.commit()
+        await db.commit()
 
         return {
             'success': True,
@@ -177,7 +186,8 @@ async def get_dashboard_data(
     document_id: int,
     cash_balance: Optional[float] = Query(None, description="Current cash balance"),
     company_name: Optional[str] = Query(None, description="Company name"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    generator: CommentaryGenerator = Depends(get_commentary_generator)
 ):
     """
     Get all data needed for startup dashboard in one call
@@ -194,60 +204,44 @@ async def get_dashboard_data(
         Complete dashboard data including metrics and commentary
     """
     # Get document from database
-    document = db.query(Document).filter(Document.id == document_id).first()
-    if not document:
-        raise HTTPException(status_code=404, detail="Document not found")
+    document = await _get_doc_or_404(db, document_id)
 
     try:
+        document.custom_data = document.custom_data or {}
+
         # Check if metrics already calculated
-        if document.custom_data and 'startup_metrics' in document.custom_data:
+        if 'startup_metrics' in document.custom_data:
             metrics = document.custom_data['startup_metrics']
 
             # Update cash balance if provided
             if cash_balance is not None:
-                calculator = StartupMetricsCalculator(
-                    df=pd.DataFrame(),  # Not needed for runway recalc
-                    metadata={}
-                )
                 burn_avg = metrics.get('burn_rate', {}).get('net_burn_avg', 0)
                 if burn_avg:
-                    runway = calculator._calculate_runway(cash_balance, burn_avg)
-                    metrics['runway'] = runway
+                    metrics['runway'] = calculate_runway(cash_balance, burn_avg)
 
         else:
             # Calculate metrics for the first time
-            file_ext = document.filename.lower().split('.')[-1]
-            if file_ext not in ['csv', 'xlsx', 'xls']:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Document must be a P&L file (CSV or Excel)"
-                )
-
-            parser = PLParser()
-            parsed_data = parser.parse_file(document.file_path)
-
-            calculator = StartupMetricsCalculator(
-                df=parsed_data['line_items'],
-                metadata=parsed_data['metadata']
-            )
+            _require_pl(document)
 
-            metrics = calculator.calculate_all_metrics(cash_balance=cash_balance)
+            metrics = await asyncio.to_thread(
+                _calculate_startup_metrics,
+                document.file_path,
+                document.content_hash,
+                cash_balance
+            )
 
-            # Store in database
-            document.custom_data = document.custom_data or {}
+            # Store in database (committed together with the commentary below)
             document.custom_data['startup_metrics'] = metrics
             if company_name:
                 document.custom_data['company_name'] = company_name
-            db.commit()
 
         # Generate or retrieve commentary
-        if document.custom_data and 'ai_commentary' in document.custom_data:
+        if 'ai_commentary' in document.custom_data:
             commentary = document.custom_data['ai_commentary']
         else:
-            generator = CommentaryGenerator()
             period_label = _extract_period_label(document)
 
-            commentary = generator.generate_full_commentary(
+            commentary = await generator.generate_full_commentary(
                 metrics=metrics,
                 company_name=company_name or document.custom_data.get('company_name'),
                 period_label=period_label
@@ -255,7 +249,8 @@ async def get_dashboard_data(
 
             # Cache commentary
             document.custom_data['ai_commentary'] = commentary
-            db.commit()
+
+        await db.commit()
 
         return {
             'success': True,
@@ -264,7 +259,7 @@ async def get_dashboard_data(
             'document_info': {
                 'id': document.id,
                 'name': document.filename,
-                'uploaded_at': document.created_at.isoformat() if document.created_at else None
+                'uploaded_at': document.created_at
             }
         }
 
@@ -279,7 +274,7 @@ async def get_dashboard_data(
 async def export_report(
     document_id: int,
     format: str = Query("markdown", description="Export format: markdown, text, or json"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Export formatted investor report
@@ -289,12 +284,10 @@ async def export_report(
         format: Export format (markdown, text, json)
 
     Returns:
-        Formatted report ready for download or copy
+        Raw report body (with a download filename) in the requested format
     """
     # Get document from database
-    document = db.query(Document).filter(Document.id == document_id).first()
-    if not document:
-        raise HTTPException(status_code=404, detail="Document not found")
+    document = await _get_doc_or_404(db, document_id)
 
     # Check if commentary exists
     if not document.custom_data or 'ai_commentary' not in document.custom_data:
@@ -303,31 +296,29 @@ async def export_report(
             detail="Please generate commentary first using /commentary endpoint"
         )
 
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid format. Use 'markdown', 'text', or 'json'"
+        )
+
     try:
         commentary = document.custom_data['ai_commentary']
         formatted_outputs = commentary.get('formatted_outputs', {})
+        output_key, content_type, extension = EXPORT_FORMATS[format]
+        headers = {
+            'Content-Disposition': f'attachment; filename="investor_update_{document_id}.{extension}"'
+        }
 
-        if format == 'markdown':
-            content = formatted_outputs.get('markdown', '')
-            content_type = 'text/markdown'
-        elif format == 'text':
-            content = formatted_outputs.get('plain_text', '')
-            content_type = 'text/plain'
-        elif format == 'json':
-            content = formatted_outputs.get('json', {})
-            content_type = 'application/json'
-        else:
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid format. Use 'markdown', 'text', or 'json'"
-            )
+        # Send the report body as-is rather than wrapped in a JSON envelope
+        if format == 'json':
+            return ORJSONResponse(formatted_outputs.get(output_key, {}), headers=headers)
 
-        return {
-            'success': True,
-            'format': format,
-            'content': content,
-            'content_type': content_type
-        }
+        return Response(
+            content=formatted_outputs.get(output_key, ''),
+            media_type=content_type,
+            headers=headers
+        )
 
     except Exception as e:
         raise HTTPException(
@@ -339,16 +330,17 @@ async def export_report(
 @router.get("/metrics-only/{document_id}")
 async def get_metrics_only(
     document_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get just the calculated metrics without commentary
 
-    Useful for quick metric checks or dashboard updates
+    Useful for quick metric checks or dashboard updates. Responds with an ETag
+    so polling clients can revalidate and get a 304 when nothing changed.
     """
-    document = db.query(Document).filter(Document.id == document_id).first()
-    if not document:
-        raise HTTPException(status_code=404, detail="Document not found")
+    document = await _get_doc_or_404(db, document_id)
 
     if not document.custom_data or 'startup_metrics' not in document.custom_data:
         raise HTTPException(
@@ -356,27 +348,84 @@ async def get_metrics_only(
             detail="Metrics not calculated. Use /analyze endpoint first"
         )
 
+    metrics = document.custom_data['startup_metrics']
+    digest = hashlib.sha1(json.dumps(metrics, sort_keys=True, default=str).encode()).hexdigest()
+    etag = f'"{digest}"'
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
     return {
         'success': True,
-        'metrics': document.custom_data['startup_metrics']
+        'metrics': metrics
     }
 
 
 # Helper functions
 
+async def _get_doc_or_404(db: AsyncSession, document_id: int) -> Document:
+    """Fetch a document by primary key (identity map first) or raise 404"""
+    document = await db.get(Document, document_id)
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return document
+
+
+def _require_pl(document: Document):
+    """Raise 400 unless the document is a CSV/Excel P&L"""
+    is_pl = document.is_pl
+    if is_pl is None:
+        # Uploaded before is_pl was recorded
+        is_pl = document.filename.lower().rsplit('.', 1)[-1] in PL_FILE_EXTENSIONS
+
+    if not is_pl:
+        raise HTTPException(
+            status_code=400,
+            detail="Document must be a P&L file (CSV or Excel)"
+        )
+
+
+def _parse_pl_line_items(file_path: str, content_hash: Optional[str]) -> Tuple[Any, Dict]:
+    """Parsed P&L line items and metadata, reused while the file contents are unchanged"""
+    cache_key = pl_cache.make_key(file_path, content_hash=content_hash)
+    cached = parsed_pl_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    parser = PLParser()
+    parsed_data = parser.parse_file(file_path)
+    parsed_pl_cache.set(cache_key, parsed_data['line_items'], parsed_data['metadata'])
+    return parsed_data['line_items'], parsed_data['metadata']
+
+
+def _calculate_startup_metrics(
+    file_path: str,
+    content_hash: Optional[str],
+    cash_balance: Optional[float]
+) -> Dict:
+    """Parse the P&L and calculate startup metrics (blocking; run in a worker thread)"""
+    line_items, pl_metadata = _parse_pl_line_items(file_path, content_hash)
+
+    calculator = StartupMetricsCalculator(
+        df=line_items,
+        metadata=pl_metadata
+    )
+
+    return calculator.calculate_all_metrics(cash_balance=cash_balance)
+
+
 def _extract_period_label(document: Document) -> str:
     """Extract period label from document name or metadata"""
     # Try to parse from filename
     filename = document.filename.lower()
 
     # Common patterns: "october_2024", "2024-10", "oct24", etc.
-    import re
-
     # Try YYYY-MM pattern
-    match = re.search(r'(\d{4})-(\d{2})', filename)
+    match = _YYYY_MM_RE.search(filename)
     if match:
         year, month = match.groups()
-        from datetime import datetime
         try:
             date = datetime.strptime(f"{year}-{month}", "%Y-%m")
             return date.strftime("%B %Y")
@@ -384,16 +433,13 @@ def _extract_period_label(document: Document) -> str:
             pass
 
     # Try month name pattern
-    months = ['january', 'february', 'march', 'april', 'may', 'june',
-              'july', 'august', 'september', 'october', 'november', 'december']
-
-    for month in months:
+    for month, month_title in _MONTHS.items():
         if month in filename:
             # Try to find year
-            year_match = re.search(r'20\d{2}', filename)
+            year_match = _YEAR_RE.search(filename)
             if year_match:
-                return f"{month.title()} {year_match.group()}"
-            return month.title()
+                return f"{month_title} {year_match.group()}"
+            return month_title
 
     # Default to upload date
     if document.created_at:
@@ -2,7 +2,7 @@
 API Usage Monitoring Endpoints
 """
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
 from pydantic import BaseModel
 from typing import Dict, List, Optional
 from app.services.usage_tracker import usage_tracker
@@ -20,7 +20,7 @@ class UsageStatsResponse(BaseModel):
 
 
 @router.get("/stats", response_model=UsageStatsResponse)
-async def get_usage_stats(days: int = 30):
+async def get_usage_stats(response: Response, days: int = 30):
     """
     Get API usage statistics for the specified period
 
@@ -32,6 +32,8 @@ async def get_usage_stats(days: int = 30):
     """
     try:
         stats = usage_tracker.get_usage_stats(days=days)
+        # UI polls this; let the browser reuse a response for a short while
+        response.headers['Cache-Control'] = 'private, max-age=30'
         return UsageStatsResponse(**stats)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching usage stats: {str(e)}")
@@ -58,36 +60,6 @@ async def get_live_stats():
     Useful for real-time monitoring in the UI
     """
     try:
-        stats = usage_tracker.get_usage_stats(days=1)
-
-        # Calculate costs for display
-        total_cost = stats["total_stats"]["cost"]
-        period_cost = stats["period_stats"]["cost"]
-
-        # Get most used model
-        by_model = stats["by_model"]
-        most_used_model = None
-        max_requests = 0
-
-        for model, data in by_model.items():
-            if data["requests"] > max_requests:
-                max_requests = data["requests"]
-                most_used_model = model
-
-        # Get budget info
-        budget_info = stats.get("budget_info", {})
-
-        return {
-            "total_requests_24h": stats["period_stats"]["requests"],
-            "total_cost_24h": round(period_cost, 4),
-            "total_cost_alltime": round(total_cost, 2),
-            "total_tokens_24h": stats["period_stats"]["input_tokens"] + stats["period_stats"]["output_tokens"],
-            "most_used_model": most_used_model,
-            "monthly_budget": budget_info.get("monthly_budget", 10.0),
-            "remaining_credits": round(budget_info.get("remaining_credits", 0), 2),
-            "usage_percentage": round(budget_info.get("usage_percentage", 0), 1),
-            "month_cost": round(budget_info.get("month_cost", 0), 4),
-            "recent_requests": stats["recent_requests"][:5]  # Last 5 requests
-        }
+        return usage_tracker.get_live_snapshot()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching live stats: {str(e)}")
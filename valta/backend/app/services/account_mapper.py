@@ -6,10 +6,18 @@ P&L categories, with fuzzy matching fallback for uncertain classifications.
 """
 
 import os
+import re
+import hashlib
+import threading
+import time
 from typing import List, Dict, Tuple
 from rapidfuzz import fuzz, process
+import numpy as np
 import json
 
+from app.database import SessionLocal, engine
+from app.models.document import AccountMapping
+
 
 # Standard chart of accounts template
 STANDARD_ACCOUNTS = {
@@ -45,13 +53,203 @@ STANDARD_ACCOUNTS = {
     ]
 }
 
+# Flattened (category, subcategory) pairs and their lower-cased names, built
+# once at import in STANDARD_ACCOUNTS order so ties resolve to the same match
+STD_FLAT = tuple((category, account) for category, accounts in STANDARD_ACCOUNTS.items() for account in accounts)
+STD_NAMES = tuple(account.lower() for _, account in STD_FLAT)
+
+# Static part of the Claude categorization prompt, sent as the system prompt so
+# only the account list varies per call. Not marked for prompt caching: with the
+# tool schema it is ~700 tokens, below the API's minimum cacheable prefix.
+CLAUDE_CATEGORIZE_SYSTEM_PROMPT = f"""You are a financial accounting expert. Categorize the account names from a P&L statement given by the user into standard categories.
+
+Standard Categories:
+- Revenue (Sales, Service Revenue, Other Income, etc.)
+- Cost of Goods Sold (COGS, Direct Costs, Cost of Sales, etc.)
+- Operating Expenses (SG&A, R&D, Marketing, Salaries, Rent, etc.)
+- Financial Items (Interest Income/Expense, Bank Charges, FX Gain/Loss)
+- Non-Operating Items (Gains/Losses on Asset Sales, Extraordinary Items)
+- Tax (Income Tax, Tax Provision, etc.)
+
+Standard chart of accounts (prefer these subcategory names where they fit):
+{chr(10).join(f"- {category}: {', '.join(accounts)}" for category, accounts in STANDARD_ACCOUNTS.items())}
+
+Record every account with the categorize tool, using each account name exactly as given: its category, a more specific subcategory, whether it is a subtotal (is_subtotal is true if the account name indicates it's a total/subtotal line) and your confidence (0-1).
+"""
+
+# Structured output schema shared by the Claude tool and OpenAI strict JSON schema
+CATEGORIZE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "accounts": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "account_name": {"type": "string"},
+                    "category": {"type": "string", "enum": list(STANDARD_ACCOUNTS)},
+                    "subcategory": {"type": "string"},
+                    "is_subtotal": {"type": "boolean"},
+                    "confidence": {"type": "number"}
+                },
+                "required": ["account_name", "category", "subcategory", "is_subtotal", "confidence"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["accounts"],
+    "additionalProperties": False
+}
+
+CATEGORIZE_TOOL = {
+    "name": "categorize",
+    "description": "Record the category of each P&L account name",
+    "input_schema": CATEGORIZE_SCHEMA
+}
+
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_account_name(account_name) -> str:
+    """Lower-case and collapse whitespace so trivial variations share a mapping"""
+    return _WHITESPACE_RE.sub(' ', str(account_name).strip().lower())
+
+
+class CategoryCache:
+    """In-process cache of AI categorizations keyed by (model, normalized account name)"""
+
+    def __init__(self, ttl_seconds: int = 30 * 24 * 3600, max_entries: int = 50000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: Dict[Tuple[str, str], Tuple[float, Dict]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(model: str, account_name: str) -> Tuple[str, str]:
+        normalized = normalize_account_name(account_name)
+        return model, hashlib.sha1(normalized.encode()).hexdigest()
+
+    def get_many(self, model: str, account_names: List[str]) -> Dict[str, Dict]:
+        """Return cached categorizations for the names that have one"""
+        now = time.monotonic()
+        hits = {}
+        with self._lock:
+            for name in account_names:
+                entry = self._entries.get(self._key(model, name))
+                if entry and now - entry[0] <= self.ttl_seconds:
+                    hits[name] = dict(entry[1])
+        return hits
+
+    def set_many(self, model: str, mappings: Dict[str, Dict]):
+        """Store categorizations, dropping the oldest entries when full"""
+        now = time.monotonic()
+        with self._lock:
+            for name, mapping in mappings.items():
+                self._entries[self._key(model, name)] = (now, dict(mapping))
+            overflow = len(self._entries) - self.max_entries
+            if overflow > 0:
+                for key in list(self._entries)[:overflow]:
+                    del self._entries[key]
+
+
+# Shared across mapper instances so repeated account names skip the AI call
+category_cache = CategoryCache()
+
+
+def load_persisted_mappings(model: str, account_names: List[str]) -> Dict[str, Dict]:
+    """Return categorizations stored in account_mapping_cache for the given names"""
+    names_by_norm: Dict[str, List[str]] = {}
+    for name in account_names:
+        names_by_norm.setdefault(normalize_account_name(name), []).append(name)
+
+    if not names_by_norm:
+        return {}
+
+    db = SessionLocal()
+    try:
+        rows = db.query(AccountMapping).filter(
+            AccountMapping.source == model,
+            AccountMapping.name_norm.in_(list(names_by_norm))
+        ).all()
+    finally:
+        db.close()
+
+    hits = {}
+    for row in rows:
+        for name in names_by_norm[row.name_norm]:
+            hits[name] = {
+                'category': row.category,
+                'subcategory': row.subcategory or '',
+                'is_subtotal': bool(row.is_subtotal),
+                'confidence': row.confidence if row.confidence is not None else 0.9,
+                'method': 'ai'
+            }
+    return hits
+
+
+def persist_mappings(model: str, mappings: Dict[str, Dict]):
+    """Insert new categorizations into account_mapping_cache, keeping existing rows"""
+    rows = {}
+    for name, mapping in mappings.items():
+        rows[normalize_account_name(name)] = {
+            'name_norm': normalize_account_name(name),
+            'source': model,
+            'category': mapping['category'],
+            'subcategory': mapping.get('subcategory', ''),
+            'is_subtotal': bool(mapping.get('is_subtotal', False)),
+            'confidence': mapping.get('confidence'),
+        }
+
+    if not rows:
+        return
+
+    if engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    db = SessionLocal()
+    try:
+        db.execute(insert(AccountMapping).values(list(rows.values())).on_conflict_do_nothing())
+        db.commit()
+    finally:
+        db.close()
+
+
+# Mappers are created per request; reuse SDK clients (and their keep-alive
+# connection pools) keyed by provider and API key
+_shared_clients: Dict[Tuple[str, str], object] = {}
+_shared_clients_lock = threading.Lock()
+
+
+def _get_shared_client(provider: str, api_key: str):
+    """Return a long-lived AI client for the provider/key pair"""
+    with _shared_clients_lock:
+        client = _shared_clients.get((provider, api_key))
+        if client is None:
+            if provider == 'claude':
+                import anthropic
+                client = anthropic.Anthropic(api_key=api_key)
+            else:
+                import openai
+                client = openai.OpenAI(api_key=api_key)
+            _shared_clients[(provider, api_key)] = client
+        return client
+
 
 class AccountMapper:
     """Map account names to standard P&L categories using AI and fuzzy matching"""
 
+    AI_MODELS = {
+        'claude': 'claude-sonnet-4-20250514',
+        'openai': 'gpt-4o'
+    }
+
     def __init__(self, use_ai: bool = True, ai_provider: str = 'claude'):
         self.use_ai = use_ai
         self.ai_provider = ai_provider
+        self.ai_model = self.AI_MODELS['claude' if ai_provider == 'claude' else 'openai']
         self._init_ai_client()
 
     def _init_ai_client(self):
@@ -60,26 +258,17 @@ class AccountMapper:
             self.ai_client = None
             return
 
-        if self.ai_provider == 'claude':
-            try:
-                import anthropic
-                api_key = os.getenv('ANTHROPIC_API_KEY', '')
-                if api_key and len(api_key) > 20:
-                    self.ai_client = anthropic.Anthropic(api_key=api_key)
-                else:
-                    self.ai_client = None
-            except ImportError:
-                self.ai_client = None
-        else:  # openai
+        provider = 'claude' if self.ai_provider == 'claude' else 'openai'
+        env_var = 'ANTHROPIC_API_KEY' if provider == 'claude' else 'OPENAI_API_KEY'
+        api_key = os.getenv(env_var, '')
+
+        if api_key and len(api_key) > 20:
             try:
-                import openai
-                api_key = os.getenv('OPENAI_API_KEY', '')
-                if api_key and len(api_key) > 20:
-                    self.ai_client = openai.OpenAI(api_key=api_key)
-                else:
-                    self.ai_client = None
+                self.ai_client = _get_shared_client(provider, api_key)
             except ImportError:
                 self.ai_client = None
+        else:
+            self.ai_client = None
 
     def categorize_accounts(self, account_names: List[str]) -> Dict[str, Dict]:
         """
@@ -95,20 +284,45 @@ class AccountMapper:
         """
         results = {}
 
-        # Try AI first
+        # Try AI first, only for names we haven't categorized before (in this
+        # process, then in the persistent account_mapping_cache table)
         if self.ai_client:
-            try:
-                ai_results = self._ai_categorize(account_names)
-                results.update(ai_results)
-            except Exception as e:
-                print(f"AI categorization failed: {e}")
+            results.update(category_cache.get_many(self.ai_model, account_names))
+            misses = list(dict.fromkeys(name for name in account_names if name not in results))
+
+            if misses:
+                try:
+                    persisted = load_persisted_mappings(self.ai_model, misses)
+                    results.update(persisted)
+                    category_cache.set_many(self.ai_model, persisted)
+                    misses = [name for name in misses if name not in persisted]
+                except Exception as e:
+                    print(f"Loading stored account mappings failed: {e}")
+
+            if misses:
+                try:
+                    ai_results = self._ai_categorize(misses)
+                    results.update(ai_results)
+                    new_mappings = {name: ai_results[name] for name in misses if name in ai_results}
+                    category_cache.set_many(self.ai_model, new_mappings)
+                except Exception as e:
+                    print(f"AI categorization failed: {e}")
+                    new_mappings = {}
+
+                try:
+                    persist_mappings(self.ai_model, new_mappings)
+                except Exception as e:
+                    print(f"Storing account mappings failed: {e}")
 
         # Fill in missing with fuzzy matching
-        for account_name in account_names:
-            if account_name not in results or results[account_name]['confidence'] < 0.7:
-                fuzzy_result = self._fuzzy_match(account_name)
-                if account_name not in results or fuzzy_result['confidence'] > results[account_name]['confidence']:
-                    results[account_name] = fuzzy_result
+        needs_fuzzy = [
+            name for name in account_names
+            if name not in results or results[name]['confidence'] < 0.7
+        ]
+        fuzzy_results = self._fuzzy_match_many(needs_fuzzy)
+        for account_name, fuzzy_result in fuzzy_results.items():
+            if account_name not in results or fuzzy_result['confidence'] > results[account_name]['confidence']:
+                results[account_name] = fuzzy_result
 
         return results
 
@@ -121,62 +335,25 @@ class AccountMapper:
 
     def _claude_categorize(self, account_names: List[str]) -> Dict[str, Dict]:
         """Use Claude to categorize accounts"""
-        prompt = f"""You are a financial accounting expert. Categorize these account names from a P&L statement into standard categories.
-
-Account Names:
-{chr(10).join(f"- {name}" for name in account_names)}
-
-Standard Categories:
-- Revenue (Sales, Service Revenue, Other Income, etc.)
-- Cost of Goods Sold (COGS, Direct Costs, Cost of Sales, etc.)
-- Operating Expenses (SG&A, R&D, Marketing, Salaries, Rent, etc.)
-- Financial Items (Interest Income/Expense, Bank Charges, FX Gain/Loss)
-- Non-Operating Items (Gains/Losses on Asset Sales, Extraordinary Items)
-- Tax (Income Tax, Tax Provision, etc.)
-
-Return ONLY a JSON object mapping each account to its category and a more specific subcategory. Mark is_subtotal as true if the account name indicates it's a total/subtotal line.
-
-Format:
-{{
-    "Account Name Here": {{
-        "category": "Revenue",
-        "subcategory": "Service Revenue",
-        "is_subtotal": false,
-        "confidence": 0.95
-    }}
-}}
-"""
+        # Only the account list varies per call; the static instructions are the
+        # system prompt
+        prompt = f"""Account Names:
+{chr(10).join(f"- {name}" for name in account_names)}"""
 
         message = self.ai_client.messages.create(
-            model="claude-sonnet-4-20250514",
+            model=self.ai_model,
             max_tokens=4096,
+            system=CLAUDE_CATEGORIZE_SYSTEM_PROMPT,
+            tools=[CATEGORIZE_TOOL],
+            tool_choice={"type": "tool", "name": CATEGORIZE_TOOL["name"]},
             messages=[
                 {"role": "user", "content": prompt}
             ]
         )
 
-        # Parse JSON response
-        response_text = message.content[0].text
-
-        # Extract JSON from response (might be wrapped in markdown)
-        json_match = re.search(r'\{[\s\S]*\}', response_text)
-        if json_match:
-            ai_mapping = json.loads(json_match.group())
-        else:
-            ai_mapping = json.loads(response_text)
-
-        # Convert to standard format
-        results = {}
-        for account_name, data in ai_mapping.items():
-            results[account_name] = {
-                'category': data.get('category', 'Unknown'),
-                'subcategory': data.get('subcategory', ''),
-                'is_subtotal': data.get('is_subtotal', False),
-                'confidence': data.get('confidence', 0.9),
-                'method': 'ai'
-            }
-
-        return results
+        # Forced tool call: the input is already a dict matching CATEGORIZE_SCHEMA
+        tool_input = next(block.input for block in message.content if block.type == "tool_use")
+        return self._to_results(tool_input.get("accounts", []))
 
     def _openai_categorize(self, account_names: List[str]) -> Dict[str, Dict]:
         """Use OpenAI to categorize accounts"""
@@ -193,23 +370,29 @@ Standard Categories:
 - Non-Operating Items
 - Tax
 
-Return a JSON object mapping each account name to its category, subcategory, whether it's a subtotal, and confidence score (0-1)."""
+For each account (name exactly as given) give its category, subcategory, whether it's a subtotal, and confidence score (0-1)."""
 
         response = self.ai_client.chat.completions.create(
-            model="gpt-4o",
+            model=self.ai_model,
             messages=[
                 {"role": "system", "content": "You are a financial statement analysis expert."},
                 {"role": "user", "content": prompt}
             ],
-            response_format={"type": "json_object"}
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "categorize", "strict": True, "schema": CATEGORIZE_SCHEMA}
+            }
         )
 
         ai_mapping = json.loads(response.choices[0].message.content)
+        return self._to_results(ai_mapping.get("accounts", []))
 
-        # Convert to standard format
+    @staticmethod
+    def _to_results(accounts: List[Dict]) -> Dict[str, Dict]:
+        """Convert structured-output account entries to the standard result format"""
         results = {}
-        for account_name, data in ai_mapping.items():
-            results[account_name] = {
+        for data in accounts:
+            results[data['account_name']] = {
                 'category': data.get('category', 'Unknown'),
                 'subcategory': data.get('subcategory', ''),
                 'is_subtotal': data.get('is_subtotal', False),
@@ -226,37 +409,48 @@ Return a JSON object mapping each account name to its category, subcategory, whe
         Returns:
             Dict with category, subcategory, confidence, method
         """
-        all_matches = []
+        return self._fuzzy_match_many([account_name], threshold)[account_name]
+
+    def _fuzzy_match_many(self, account_names: List[str], threshold: int = 70) -> Dict[str, Dict]:
+        """
+        Fuzzy match many account names in one rapidfuzz cdist call
 
-        for category, accounts in STANDARD_ACCOUNTS.items():
-            for std_account in accounts:
-                score = fuzz.token_sort_ratio(account_name.lower(), std_account.lower())
-                all_matches.append((category, std_account, score))
+        Returns:
+            Dict mapping account_name -> category, subcategory, confidence, method
+        """
+        if not account_names:
+            return {}
+
+        scores = process.cdist(
+            [str(name).lower() for name in account_names],
+            STD_NAMES,
+            scorer=fuzz.token_sort_ratio,
+            dtype=np.float64,
+            workers=-1
+        )
+        best_indices = scores.argmax(axis=1)
+        best_scores = scores.max(axis=1)
 
-        # Get best match
-        best_match = max(all_matches, key=lambda x: x[2])
-        category, subcategory, score = best_match
+        results = {}
+        for account_name, index, score in zip(account_names, best_indices, best_scores):
+            # Normalize score to 0-1 confidence
+            confidence = float(score) / 100.0
 
-        # Normalize score to 0-1 confidence
-        confidence = score / 100.0
+            if score >= threshold:
+                category, subcategory = STD_FLAT[index]
+            else:
+                # Low confidence - return as uncategorized
+                category, subcategory = 'Uncategorized', ''
 
-        if score >= threshold:
-            return {
+            results[account_name] = {
                 'category': category,
                 'subcategory': subcategory,
                 'is_subtotal': False,
                 'confidence': confidence,
                 'method': 'fuzzy'
             }
-        else:
-            # Low confidence - return as uncategorized
-            return {
-                'category': 'Uncategorized',
-                'subcategory': '',
-                'is_subtotal': False,
-                'confidence': confidence,
-                'method': 'fuzzy'
-            }
+
+        return results
 
     def batch_categorize_dataframe(self, df, account_column: str) -> 'pd.DataFrame':
         """
@@ -284,6 +478,3 @@ Return a JSON object mapping each account name to its category, subcategory, whe
 
         return df
 
-
-# Import re for regex in claude method
-import re
@@ -8,11 +8,124 @@ Creates plain-English explanations of startup metrics for:
 - Internal dashboards
 """
 
+import asyncio
+import logging
 import os
-from typing import Dict, List, Optional
-from anthropic import Anthropic
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from anthropic import AsyncAnthropic
 import json
 
+logger = logging.getLogger(__name__)
+
+METRICS_TABLE_HEADER = "| Metric | Value |\n|--------|-------|"
+
+# Section text when the metrics have nothing for the model to analyze
+NO_SECTION_DATA = {
+    'burn_analysis': "No burn rate data available.",
+    'growth_analysis': "No growth data available.",
+    'runway_analysis': "Cash balance not provided - runway cannot be calculated.",
+    'expense_analysis': "No expense data available.",
+}
+
+COMMENTARY_MODEL = "claude-sonnet-4-20250514"
+SECTION_MAX_TOKENS = {
+    'executive_summary': 500,
+    'burn_analysis': 400,
+    'growth_analysis': 400,
+    'runway_analysis': 400,
+    'expense_analysis': 400,
+}
+
+# Below this many jobs the live concurrent path is used; batches trade latency
+# (minutes to hours) for half-price tokens
+BATCH_MIN_JOBS = 4
+BATCH_POLL_SECONDS = 30
+
+
+@dataclass(slots=True)
+class MetricsView:
+    """Metric groups and the formatted values shared by prompts, exports and fallbacks"""
+    metrics: Dict
+    burn: Dict
+    growth: Dict
+    runway: Optional[Dict]
+    drivers: Dict
+    net_burn_avg_str: str  # "12,345" (whole dollars)
+    mom_growth_latest: float
+    mom_growth_latest_str: str  # "3.2" (percent)
+    burn_trend_direction: str
+    runway_months_str: Optional[str]  # "8.5", or None without a runway figure
+
+    @classmethod
+    def from_metrics(cls, metrics: Dict) -> "MetricsView":
+        burn = metrics.get('burn_rate', {})
+        growth = metrics.get('growth', {})
+        runway = metrics.get('runway')
+        mom_growth_latest = growth.get('mom_growth_latest', 0)
+        months_remaining = runway.get('months_remaining') if runway else None
+
+        return cls(
+            metrics=metrics,
+            burn=burn,
+            growth=growth,
+            runway=runway,
+            drivers=metrics.get('expense_drivers', {}),
+            net_burn_avg_str=f"{burn.get('net_burn_avg', 0):,.0f}",
+            mom_growth_latest=mom_growth_latest,
+            mom_growth_latest_str=f"{mom_growth_latest:.1f}",
+            burn_trend_direction=burn.get('burn_rate_trend_direction', 'stable'),
+            runway_months_str=f"{months_remaining:.1f}" if months_remaining else None
+        )
+
+
+class CommentaryCache:
+    """LRU + TTL cache of generated commentary keyed by exact metrics content"""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: int = 24 * 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(
+        metrics: Dict,
+        company_name: Optional[str] = None,
+        period_label: Optional[str] = None
+    ) -> str:
+        """Digest of the metrics plus the personalization inputs of the prompts"""
+        payload = json.dumps(metrics, sort_keys=True, default=str)
+        payload += f"|{company_name or ''}|{period_label or ''}"
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return cached commentary or None if missing/expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            stored_at, commentary = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return commentary
+
+    def set(self, key: str, commentary: Dict):
+        """Store commentary, evicting the least recently used entry if full"""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), commentary)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
 
 class CommentaryGenerator:
     """Generate investor-ready commentary from startup metrics"""
@@ -21,15 +134,16 @@ class CommentaryGenerator:
         """Initialize with API keys"""
         self.anthropic_key = os.getenv('ANTHROPIC_API_KEY')
         if self.anthropic_key:
-            self.client = Anthropic(api_key=self.anthropic_key)
+            self.client = AsyncAnthropic(api_key=self.anthropic_key)
         else:
             self.client = None
 
-    def generate_full_commentary(
+    async def generate_full_commentary(
         self,
         metrics: Dict,
         company_name: Optional[str] = None,
-        period_label: Optional[str] = None
+        period_label: Optional[str] = None,
+        use_cache: bool = True
     ) -> Dict:
         """
         Generate complete investor update commentary
@@ -38,6 +152,7 @@ class CommentaryGenerator:
             metrics: Output from StartupMetricsCalculator
             company_name: Company name for personalization
             period_label: Period label (e.g., "October 2024")
+            use_cache: Serve/refresh commentary for identical inputs from commentary_cache
 
         Returns:
             Dict with executive summary, detailed analysis, and formatted outputs
@@ -45,78 +160,256 @@ class CommentaryGenerator:
         if not self.client:
             return self._generate_fallback_commentary(metrics)
 
-        # Generate executive summary
-        exec_summary = self._generate_executive_summary(metrics, company_name, period_label)
+        cache_key = CommentaryCache.make_key(metrics, company_name, period_label)
+        cached = commentary_cache.get(cache_key) if use_cache else None
+        if cached is not None:
+            return cached
+
+        # Generate the executive summary and detailed sections concurrently; a
+        # section that fails falls back on its own without affecting the others
+        view = MetricsView.from_metrics(metrics)
+        prompts = self._section_prompts(view, company_name, period_label)
+        results = await asyncio.gather(
+            *(self._generate_section(section, prompt) for section, prompt in prompts.items()),
+            return_exceptions=True
+        )
+        sections = dict(zip(prompts, results))
+        failed = [section for section, result in sections.items() if isinstance(result, Exception)]
+        if failed:
+            fallback = self._fallback_sections(view)
+            for section in failed:
+                logger.error(f"Error generating {section}: {sections[section]}")
+                sections[section] = fallback[section]
+
+        commentary = self._assemble_commentary(sections, view, company_name, period_label)
+        if not failed:
+            # Fallback text from a transient API error isn't kept for the TTL
+            commentary_cache.set(cache_key, commentary)
+        return commentary
+
+    async def generate_full_commentary_batch(
+        self,
+        jobs: List[Tuple[Dict, Optional[str], Optional[str]]]
+    ) -> List[Dict]:
+        """
+        Generate commentary for many (metrics, company_name, period_label) jobs,
+        e.g. a nightly portfolio refresh, through the Message Batches API
+
+        Batches cost half as much but can take minutes to hours, so this is for
+        offline jobs only. Fewer than BATCH_MIN_JOBS jobs, or a batch that cannot
+        be submitted, use the live concurrent path instead.
 
-        # Generate detailed sections
-        burn_analysis = self._generate_burn_analysis(metrics)
-        growth_analysis = self._generate_growth_analysis(metrics)
-        runway_analysis = self._generate_runway_analysis(metrics)
-        expense_analysis = self._generate_expense_analysis(metrics)
+        Returns:
+            Commentary dicts in job order
+        """
+        if not self.client:
+            return [self._generate_fallback_commentary(metrics) for metrics, _, _ in jobs]
+
+        results: List[Optional[Dict]] = [None] * len(jobs)
+        cache_keys = [CommentaryCache.make_key(*job) for job in jobs]
+        pending = []
+        for index, cache_key in enumerate(cache_keys):
+            results[index] = commentary_cache.get(cache_key)
+            if results[index] is None:
+                pending.append(index)
+
+        texts = None
+        if len(pending) >= BATCH_MIN_JOBS:
+            views = {index: MetricsView.from_metrics(jobs[index][0]) for index in pending}
+            prompts = {index: self._section_prompts(views[index], *jobs[index][1:]) for index in pending}
+            requests = [
+                {
+                    "custom_id": f"{index}-{section}",
+                    "params": {
+                        "model": COMMENTARY_MODEL,
+                        "max_tokens": SECTION_MAX_TOKENS[section],
+                        "temperature": 0.7,
+                        "system": self._get_system_prompt(),
+                        "messages": [{"role": "user", "content": prompt}]
+                    }
+                }
+                for index, section_prompts in prompts.items()
+                for section, prompt in section_prompts.items()
+                if prompt is not None
+            ]
+
+            try:
+                texts = await self._run_batch(requests)
+            except Exception as e:
+                logger.error(f"Error running commentary batch, generating live: {e}")
+
+        if texts is None:
+            generated = await asyncio.gather(*(self.generate_full_commentary(*jobs[index]) for index in pending))
+            for index, commentary in zip(pending, generated):
+                results[index] = commentary
+            return results
+
+        for index, section_prompts in prompts.items():
+            _, company_name, period_label = jobs[index]
+            sections = {}
+            fallback = None
+            for section, prompt in section_prompts.items():
+                if prompt is None:
+                    sections[section] = NO_SECTION_DATA[section]
+                    continue
+                text = texts.get(f"{index}-{section}")
+                if not text:
+                    fallback = fallback or self._fallback_sections(views[index])
+                    text = fallback[section]
+                sections[section] = text
+            results[index] = self._assemble_commentary(sections, views[index], company_name, period_label)
+            if fallback is None:
+                commentary_cache.set(cache_keys[index], results[index])
+
+        return results
+
+    async def _run_batch(self, requests: List[Dict]) -> Dict[str, str]:
+        """Submit a message batch, wait for it to end, and return text by custom_id for succeeded requests"""
+        batch = await self.client.messages.batches.create(requests=requests)
+        while batch.processing_status != "ended":
+            await asyncio.sleep(BATCH_POLL_SECONDS)
+            batch = await self.client.messages.batches.retrieve(batch.id)
+
+        texts = {}
+        async for entry in await self.client.messages.batches.results(batch.id):
+            if entry.result.type == "succeeded":
+                texts[entry.custom_id] = entry.result.message.content[0].text.strip()
+            else:
+                logger.warning(f"Commentary batch request {entry.custom_id} {entry.result.type}")
+        return texts
+
+    def _section_prompts(
+        self,
+        view: MetricsView,
+        company_name: Optional[str],
+        period_label: Optional[str]
+    ) -> Dict[str, Optional[str]]:
+        """Prompt per commentary section (None where there is no data to analyze)"""
+        return {
+            'executive_summary': self._build_executive_summary_prompt(view, company_name, period_label),
+            'burn_analysis': self._build_burn_analysis_prompt(view),
+            'growth_analysis': self._build_growth_analysis_prompt(view),
+            'runway_analysis': self._build_runway_analysis_prompt(view),
+            'expense_analysis': self._build_expense_analysis_prompt(view),
+        }
 
-        # Combine into full commentary
-        commentary = {
+    def _assemble_commentary(
+        self,
+        sections: Dict[str, str],
+        view: MetricsView,
+        company_name: Optional[str],
+        period_label: Optional[str]
+    ) -> Dict:
+        """Combine section texts into the full commentary with its export formats"""
+        exec_summary = sections['executive_summary']
+        burn_analysis = sections['burn_analysis']
+        growth_analysis = sections['growth_analysis']
+        runway_analysis = sections['runway_analysis']
+        expense_analysis = sections['expense_analysis']
+
+        return {
             'executive_summary': exec_summary,
             'burn_analysis': burn_analysis,
             'growth_analysis': growth_analysis,
             'runway_analysis': runway_analysis,
             'expense_analysis': expense_analysis,
-            'key_takeaways': self._generate_key_takeaways(metrics),
+            'key_takeaways': self._generate_key_takeaways(view),
             'formatted_outputs': self._format_for_export(
                 exec_summary,
                 burn_analysis,
                 growth_analysis,
                 runway_analysis,
                 expense_analysis,
-                metrics,
+                view,
                 company_name,
                 period_label
             )
         }
 
-        return commentary
+    async def _generate_section(self, section: str, prompt: Optional[str]) -> str:
+        """Generate one commentary section (NO_SECTION_DATA text when there is no prompt)"""
+        if prompt is None:
+            return NO_SECTION_DATA[section]
+
+        response = await self.client.messages.create(
+            model=COMMENTARY_MODEL,
+            max_tokens=SECTION_MAX_TOKENS[section],
+            temperature=0.7,
+            system=self._get_system_prompt(),
+            messages=[{"role": "user", "content": prompt}]
+        )
+
+        return response.content[0].text.strip()
+
+    def _generate_key_takeaways(self, view: MetricsView) -> List[str]:
+        """Generate bullet-point key takeaways"""
+        takeaways = []
+
+        insights = view.metrics.get('insights', [])
+        for insight in insights[:5]:  # Top 5 insights
+            takeaways.append(insight['message'])
+
+        if not takeaways:
+            # Generate basic takeaways from metrics
+            if view.burn.get('net_burn_avg'):
+                takeaways.append(f"Burning ${view.net_burn_avg_str}/month on average")
+
+            if view.mom_growth_latest:
+                takeaways.append(f"Revenue grew {view.mom_growth_latest_str}% last month")
+
+            if view.runway_months_str:
+                takeaways.append(f"{view.runway_months_str} months of runway remaining")
+
+        return takeaways
 
-    def _generate_executive_summary(
+    def _build_executive_summary_prompt(
         self,
-        metrics: Dict,
+        view: MetricsView,
         company_name: Optional[str],
         period_label: Optional[str]
     ) -> str:
-        """Generate 2-3 sentence executive summary"""
-        if not self.client:
-            return self._fallback_executive_summary(metrics)
+        """Build prompt for executive summary generation"""
+        company = company_name or "the company"
+        period = period_label or "this period"
+        runway = view.runway
 
-        prompt = self._build_executive_summary_prompt(metrics, company_name, period_label)
+        metrics_summary = f"""
+Company: {company}
+Period: {period}
 
-        try:
-            response = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=500,
-                temperature=0.7,
-                system=self._get_system_prompt(),
-                messages=[{"role": "user", "content": prompt}]
-            )
+Financial Metrics:
+- Net Burn Rate: ${view.net_burn_avg_str}/month
+- Revenue Growth (MoM): {view.mom_growth_latest_str}%
+- Runway: {runway.get('months_remaining', 'N/A') if runway else 'N/A'} months
+- Burn Trend: {view.burn_trend_direction}
+"""
 
-            return response.content[0].text.strip()
-        except Exception as e:
-            print(f"Error generating executive summary: {e}")
-            return self._fallback_executive_summary(metrics)
+        prompt = f"""{metrics_summary}
 
-    def _generate_burn_analysis(self, metrics: Dict) -> str:
-        """Generate detailed burn rate analysis"""
-        if not self.client:
-            return self._fallback_burn_analysis(metrics)
+Write a concise 2-3 sentence executive summary for an investor update that:
+1. Highlights the most important financial metric
+2. Mentions any significant changes or trends
+3. Provides context on company health
+4. Uses plain English, not financial jargon
+5. Is optimistic but honest
 
-        burn = metrics.get('burn_rate', {})
+Do not use phrases like "I" or "we". Write in third person or describe the company directly.
+"""
+
+        return prompt
+
+    def _build_burn_analysis_prompt(self, view: MetricsView) -> Optional[str]:
+        """Build prompt for burn rate analysis (None when the metrics have no burn rate data)"""
+        burn = view.burn
         if not burn:
-            return "No burn rate data available."
+            return None
 
         prompt = f"""Analyze this burn rate data and explain it in plain English for investors:
 
 Gross Burn (Average Monthly Expenses): ${burn.get('gross_burn_avg', 0):,.0f}
-Net Burn (Expenses - Revenue): ${burn.get('net_burn_avg', 0):,.0f}
+Net Burn (Expenses - Revenue): ${view.net_burn_avg_str}
 Latest Month Net Burn: ${burn.get('net_burn_latest', 0):,.0f}
-Burn Trend: {burn.get('burn_rate_trend_direction', 'stable')} ({burn.get('burn_rate_trend', 0):.1f}% change)
+Burn Trend: {view.burn_trend_direction} ({burn.get('burn_rate_trend', 0):.1f}% change)
 
 Write 2-3 sentences explaining:
 1. What the current burn rate means
@@ -124,32 +417,17 @@ Write 2-3 sentences explaining:
 3. Context for why this is typical/atypical for an early-stage startup
 """
 
-        try:
-            response = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=400,
-                temperature=0.7,
-                system=self._get_system_prompt(),
-                messages=[{"role": "user", "content": prompt}]
-            )
-
-            return response.content[0].text.strip()
-        except Exception as e:
-            print(f"Error generating burn analysis: {e}")
-            return self._fallback_burn_analysis(metrics)
-
-    def _generate_growth_analysis(self, metrics: Dict) -> str:
-        """Generate revenue growth analysis"""
-        if not self.client:
-            return self._fallback_growth_analysis(metrics)
+        return prompt
 
-        growth = metrics.get('growth', {})
+    def _build_growth_analysis_prompt(self, view: MetricsView) -> Optional[str]:
+        """Build prompt for revenue growth analysis (None when the metrics have no revenue growth data)"""
+        growth = view.growth
         if not growth:
-            return "No growth data available."
+            return None
 
         prompt = f"""Analyze this revenue growth data for an investor update:
 
-Latest Month-over-Month Growth: {growth.get('mom_growth_latest', 0):.1f}%
+Latest Month-over-Month Growth: {view.mom_growth_latest_str}%
 Average Monthly Growth: {growth.get('mom_growth_avg', 0):.1f}%
 Overall Growth (Period): {growth.get('overall_growth', 0):.1f}%
 Compound Monthly Growth Rate: {growth.get('cmgr', 0):.1f}%
@@ -161,28 +439,13 @@ Write 2-3 sentences explaining:
 3. Any concerns or positive signals for investors
 """
 
-        try:
-            response = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=400,
-                temperature=0.7,
-                system=self._get_system_prompt(),
-                messages=[{"role": "user", "content": prompt}]
-            )
-
-            return response.content[0].text.strip()
-        except Exception as e:
-            print(f"Error generating growth analysis: {e}")
-            return self._fallback_growth_analysis(metrics)
-
-    def _generate_runway_analysis(self, metrics: Dict) -> str:
-        """Generate runway and cash position analysis"""
-        if not self.client:
-            return self._fallback_runway_analysis(metrics)
+        return prompt
 
-        runway = metrics.get('runway')
-        if not runway or not runway.get('months_remaining'):
-            return "Cash balance not provided - runway cannot be calculated."
+    def _build_runway_analysis_prompt(self, view: MetricsView) -> Optional[str]:
+        """Build prompt for runway analysis (None when the metrics have no runway data)"""
+        runway = view.runway
+        if not view.runway_months_str:
+            return None
 
         prompt = f"""Analyze this runway data for an investor update:
 
@@ -198,28 +461,13 @@ Write 2-3 sentences explaining:
 3. Any recommendations for cash management
 """
 
-        try:
-            response = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=400,
-                temperature=0.7,
-                system=self._get_system_prompt(),
-                messages=[{"role": "user", "content": prompt}]
-            )
-
-            return response.content[0].text.strip()
-        except Exception as e:
-            print(f"Error generating runway analysis: {e}")
-            return self._fallback_runway_analysis(metrics)
-
-    def _generate_expense_analysis(self, metrics: Dict) -> str:
-        """Generate expense driver analysis"""
-        if not self.client:
-            return self._fallback_expense_analysis(metrics)
+        return prompt
 
-        drivers = metrics.get('expense_drivers', {})
+    def _build_expense_analysis_prompt(self, view: MetricsView) -> Optional[str]:
+        """Build prompt for expense driver analysis (None when the metrics have no expense driver data)"""
+        drivers = view.drivers
         if not drivers.get('top_expenses'):
-            return "No expense data available."
+            return None
 
         top_expenses = drivers['top_expenses'][:3]
         expense_list = "\n".join([
@@ -235,82 +483,6 @@ Write 2-3 sentences explaining:
 1. Where the majority of spend is going
 2. Whether this allocation is typical for an early-stage startup
 3. Any notable changes or concerns
-"""
-
-        try:
-            response = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=400,
-                temperature=0.7,
-                system=self._get_system_prompt(),
-                messages=[{"role": "user", "content": prompt}]
-            )
-
-            return response.content[0].text.strip()
-        except Exception as e:
-            print(f"Error generating expense analysis: {e}")
-            return self._fallback_expense_analysis(metrics)
-
-    def _generate_key_takeaways(self, metrics: Dict) -> List[str]:
-        """Generate bullet-point key takeaways"""
-        takeaways = []
-
-        insights = metrics.get('insights', [])
-        for insight in insights[:5]:  # Top 5 insights
-            takeaways.append(insight['message'])
-
-        if not takeaways:
-            # Generate basic takeaways from metrics
-            burn = metrics.get('burn_rate', {})
-            growth = metrics.get('growth', {})
-            runway = metrics.get('runway')
-
-            if burn.get('net_burn_avg'):
-                takeaways.append(f"Burning ${burn['net_burn_avg']:,.0f}/month on average")
-
-            if growth.get('mom_growth_latest'):
-                takeaways.append(f"Revenue grew {growth['mom_growth_latest']:.1f}% last month")
-
-            if runway and runway.get('months_remaining'):
-                takeaways.append(f"{runway['months_remaining']:.1f} months of runway remaining")
-
-        return takeaways
-
-    def _build_executive_summary_prompt(
-        self,
-        metrics: Dict,
-        company_name: Optional[str],
-        period_label: Optional[str]
-    ) -> str:
-        """Build prompt for executive summary generation"""
-        company = company_name or "the company"
-        period = period_label or "this period"
-
-        burn = metrics.get('burn_rate', {})
-        growth = metrics.get('growth', {})
-        runway = metrics.get('runway')
-
-        metrics_summary = f"""
-Company: {company}
-Period: {period}
-
-Financial Metrics:
-- Net Burn Rate: ${burn.get('net_burn_avg', 0):,.0f}/month
-- Revenue Growth (MoM): {growth.get('mom_growth_latest', 0):.1f}%
-- Runway: {runway.get('months_remaining', 'N/A') if runway else 'N/A'} months
-- Burn Trend: {burn.get('burn_rate_trend_direction', 'stable')}
-"""
-
-        prompt = f"""{metrics_summary}
-
-Write a concise 2-3 sentence executive summary for an investor update that:
-1. Highlights the most important financial metric
-2. Mentions any significant changes or trends
-3. Provides context on company health
-4. Uses plain English, not financial jargon
-5. Is optimistic but honest
-
-Do not use phrases like "I" or "we". Write in third person or describe the company directly.
 """
 
         return prompt
@@ -339,7 +511,7 @@ Tone: Professional, confident, but not overly promotional. Sound like a trusted
         growth_analysis: str,
         runway_analysis: str,
         expense_analysis: str,
-        metrics: Dict,
+        view: MetricsView,
         company_name: Optional[str],
         period_label: Optional[str]
     ) -> Dict:
@@ -347,56 +519,62 @@ Tone: Professional, confident, but not overly promotional. Sound like a trusted
         company = company_name or "Your Company"
         period = period_label or "Recent Period"
 
-        # Markdown format (for emails)
-        markdown = f"""# Financial Update - {period}
-
-## Executive Summary
-
-{exec_summary}
-
-## Key Metrics
-
-"""
-
-        # Add metrics table
-        burn = metrics.get('burn_rate', {})
-        growth = metrics.get('growth', {})
-        runway = metrics.get('runway')
-        efficiency = metrics.get('efficiency', {})
-
-        markdown += "| Metric | Value |\n|--------|-------|\n"
-        markdown += f"| **Net Burn Rate** | ${burn.get('net_burn_avg', 0):,.0f}/month |\n"
-        markdown += f"| **Revenue Growth (MoM)** | {growth.get('mom_growth_latest', 0):.1f}% |\n"
+        burn = view.burn
+        growth = view.growth
+        runway = view.runway
+        efficiency = view.metrics.get('efficiency', {})
 
-        if runway and runway.get('months_remaining'):
-            markdown += f"| **Runway** | {runway['months_remaining']:.1f} months |\n"
+        # Markdown format (for emails)
+        md_parts = [
+            f"# Financial Update - {period}",
+            "",
+            "## Executive Summary",
+            "",
+            exec_summary,
+            "",
+            "## Key Metrics",
+            "",
+            METRICS_TABLE_HEADER,
+            f"| **Net Burn Rate** | ${view.net_burn_avg_str}/month |",
+            f"| **Revenue Growth (MoM)** | {view.mom_growth_latest_str}% |",
+        ]
+
+        if view.runway_months_str:
+            md_parts.append(f"| **Runway** | {view.runway_months_str} months |")
 
         if efficiency and efficiency.get('burn_multiple'):
-            markdown += f"| **Burn Multiple** | {efficiency['burn_multiple']}x |\n"
+            md_parts.append(f"| **Burn Multiple** | {efficiency['burn_multiple']}x |")
 
-        markdown += f"\n## Detailed Analysis\n\n"
-        markdown += f"### Burn Rate\n\n{burn_analysis}\n\n"
-        markdown += f"### Growth\n\n{growth_analysis}\n\n"
+        md_parts += [
+            "",
+            "## Detailed Analysis",
+            "",
+            "### Burn Rate", "", burn_analysis, "",
+            "### Growth", "", growth_analysis, "",
+        ]
 
         if runway:
-            markdown += f"### Runway & Cash Position\n\n{runway_analysis}\n\n"
+            md_parts += ["### Runway & Cash Position", "", runway_analysis, ""]
 
-        markdown += f"### Expense Breakdown\n\n{expense_analysis}\n\n"
+        md_parts += ["### Expense Breakdown", "", expense_analysis, "", ""]
+        markdown = "\n".join(md_parts)
 
         # Plain text format (for copy-paste)
-        plain_text = f"""FINANCIAL UPDATE - {period.upper()}
-
-{exec_summary}
-
-KEY METRICS:
-• Net Burn: ${burn.get('net_burn_avg', 0):,.0f}/month
-• Revenue Growth: {growth.get('mom_growth_latest', 0):.1f}% MoM
-"""
-
-        if runway and runway.get('months_remaining'):
-            plain_text += f"• Runway: {runway['months_remaining']:.1f} months\n"
-
-        plain_text += f"\n{burn_analysis}\n\n{growth_analysis}\n"
+        text_parts = [
+            f"FINANCIAL UPDATE - {period.upper()}",
+            "",
+            exec_summary,
+            "",
+            "KEY METRICS:",
+            f"• Net Burn: ${view.net_burn_avg_str}/month",
+            f"• Revenue Growth: {view.mom_growth_latest_str}% MoM",
+        ]
+
+        if view.runway_months_str:
+            text_parts.append(f"• Runway: {view.runway_months_str} months")
+
+        text_parts += ["", burn_analysis, "", growth_analysis, ""]
+        plain_text = "\n".join(text_parts)
 
         # JSON format (for API/programmatic use)
         json_format = {
@@ -426,51 +604,70 @@ KEY METRICS:
 
     def _generate_fallback_commentary(self, metrics: Dict) -> Dict:
         """Generate basic commentary without AI"""
+        view = MetricsView.from_metrics(metrics)
         return {
-            'executive_summary': self._fallback_executive_summary(metrics),
-            'burn_analysis': self._fallback_burn_analysis(metrics),
-            'growth_analysis': self._fallback_growth_analysis(metrics),
-            'runway_analysis': self._fallback_runway_analysis(metrics),
-            'expense_analysis': self._fallback_expense_analysis(metrics),
-            'key_takeaways': self._generate_key_takeaways(metrics),
+            **self._fallback_sections(view),
+            'key_takeaways': self._generate_key_takeaways(view),
             'formatted_outputs': {}
         }
 
-    def _fallback_executive_summary(self, metrics: Dict) -> str:
-        burn = metrics.get('burn_rate', {})
-        growth = metrics.get('growth', {})
-        runway = metrics.get('runway')
+    def _fallback_sections(self, view: MetricsView) -> Dict[str, str]:
+        """Template text for every section"""
+        return {
+            'executive_summary': self._fallback_executive_summary(view),
+            'burn_analysis': self._fallback_burn_analysis(view),
+            'growth_analysis': self._fallback_growth_analysis(view),
+            'runway_analysis': self._fallback_runway_analysis(view.runway),
+            'expense_analysis': self._fallback_expense_analysis(view.drivers),
+        }
 
-        summary = f"The company is currently burning ${burn.get('net_burn_avg', 0):,.0f} per month "
+    def _fallback_executive_summary(self, view: MetricsView) -> str:
+        summary = f"The company is currently burning ${view.net_burn_avg_str} per month "
 
-        if growth.get('mom_growth_latest', 0) > 0:
-            summary += f"with revenue growing {growth['mom_growth_latest']:.1f}% month-over-month. "
+        if view.mom_growth_latest > 0:
+            summary += f"with revenue growing {view.mom_growth_latest_str}% month-over-month. "
         else:
             summary += "with flat revenue. "
 
-        if runway and runway.get('months_remaining'):
-            summary += f"There are {runway['months_remaining']:.1f} months of runway remaining."
+        if view.runway_months_str:
+            summary += f"There are {view.runway_months_str} months of runway remaining."
 
         return summary
 
-    def _fallback_burn_analysis(self, metrics: Dict) -> str:
-        burn = metrics.get('burn_rate', {})
-        return f"Net burn is ${burn.get('net_burn_avg', 0):,.0f}/month, trending {burn.get('burn_rate_trend_direction', 'stable')}."
+    def _fallback_burn_analysis(self, view: MetricsView) -> str:
+        return f"Net burn is ${view.net_burn_avg_str}/month, trending {view.burn_trend_direction}."
 
-    def _fallback_growth_analysis(self, metrics: Dict) -> str:
-        growth = metrics.get('growth', {})
-        return f"Revenue grew {growth.get('mom_growth_latest', 0):.1f}% last month, with an average of {growth.get('mom_growth_avg', 0):.1f}% monthly growth."
+    def _fallback_growth_analysis(self, view: MetricsView) -> str:
+        return f"Revenue grew {view.mom_growth_latest_str}% last month, with an average of {view.growth.get('mom_growth_avg', 0):.1f}% monthly growth."
 
-    def _fallback_runway_analysis(self, metrics: Dict) -> str:
-        runway = metrics.get('runway')
+    def _fallback_runway_analysis(self, runway: Optional[Dict]) -> str:
         if not runway:
             return "Runway data not available."
         return f"With {runway.get('months_remaining', 'N/A')} months of runway, the company is in {runway.get('status', 'unknown')} position."
 
-    def _fallback_expense_analysis(self, metrics: Dict) -> str:
-        drivers = metrics.get('expense_drivers', {})
+    def _fallback_expense_analysis(self, drivers: Dict) -> str:
         if not drivers.get('top_expenses'):
             return "Expense breakdown not available."
 
         top = drivers['top_expenses'][0]
         return f"The largest expense is {top['account']} at ${top['latest_amount']:,.0f}/month."
+
+
+# Global cache instance
+commentary_cache = CommentaryCache()
+
+_generator: Optional[CommentaryGenerator] = None
+_generator_lock = threading.Lock()
+
+
+def get_commentary_generator() -> CommentaryGenerator:
+    """
+    Shared CommentaryGenerator (and its Anthropic client connection pool)
+
+    Rebuilt when ANTHROPIC_API_KEY changes, e.g. after an update via /api/settings.
+    """
+    global _generator
+    with _generator_lock:
+        if _generator is None or _generator.anthropic_key != os.getenv('ANTHROPIC_API_KEY'):
+            _generator = CommentaryGenerator()
+        return _generator
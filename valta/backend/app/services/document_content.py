@@ -0,0 +1,79 @@
+"""
+Document Content Rendering
+Turns a document's structured sheet data into the plain-text form the AI
+prompts use. The result is stored on Document.rendered_content so it is
+built once per document rather than on every question.
+"""
+
+from typing import Any, Dict, Optional
+
+
+def render_structured_data(structured_data: Optional[Dict[str, Any]]) -> str:
+    """Render every sheet row as 'Row N: column: value | ...' ('' when there are no sheets)"""
+    if not structured_data or "sheets" not in structured_data:
+        return ""
+
+    parts = ["\n\n=== STRUCTURED DATA ===\n"]
+    for sheet in structured_data.get("sheets", []):
+        parts.append(f"\nSheet: {sheet['name']}\nColumns: {', '.join(sheet.get('column_names', []))}\n")
+        # data_sample holds ALL rows, not just the first 10
+        for idx, row in enumerate(sheet.get('data_sample', []), 1):
+            cells = []
+            for k, v in row.items():
+                if v is None:
+                    continue
+                # str() each value once, and not at all for strings
+                text = v if type(v) is str else str(v)
+                if text.strip():
+                    cells.append(f"{k}: {text}")
+            if cells:
+                parts.append(f"Row {idx}: {' | '.join(cells)}\n")
+
+    return "".join(parts)
+
+
+def render_structured_data_columnar(structured_data: Optional[Dict[str, Any]], max_chars: int) -> str:
+    """
+    Render sheet rows pipe-delimited with the column names stated once per sheet
+
+    Row-per-line 'column: value' text repeats every column name on every row;
+    this form carries the same cells in roughly half the tokens.
+
+    Args:
+        structured_data: Document.structured_data (NaN-free, e.g. parsed from structured_data_json)
+        max_chars: Stop adding rows once the output would exceed this length
+
+    Returns:
+        'Sheet: ...' / 'Columns: Row|...' blocks with one 'N|v1|v2' line per row ('' when there are no sheets)
+    """
+    if not structured_data or "sheets" not in structured_data:
+        return ""
+
+    parts = []
+    length = 0
+    for sheet in structured_data.get("sheets", []):
+        columns = sheet.get('column_names', [])
+        header = f"Sheet: {sheet['name']}\nColumns: Row|{'|'.join(columns)}\n"
+        if length + len(header) > max_chars:
+            break
+        parts.append(header)
+        length += len(header)
+
+        for idx, row in enumerate(sheet.get('data_sample', []), 1):
+            cells = [_pipe_cell(row.get(column)) for column in columns]
+            if not any(cells):
+                continue
+            line = f"{idx}|{'|'.join(cells)}\n"
+            if length + len(line) > max_chars:
+                return "".join(parts)
+            parts.append(line)
+            length += len(line)
+
+    return "".join(parts)
+
+
+def _pipe_cell(value: Any) -> str:
+    if value is None:
+        return ""
+    text = value if type(value) is str else str(value)
+    return text.strip().replace("|", "/").replace("\n", " ")
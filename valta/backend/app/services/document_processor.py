@@ -1,33 +1,139 @@
 import asyncio
+import functools
+import importlib.util
 import json
 import logging
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import TYPE_CHECKING, Dict, List, Optional, Any
 from datetime import datetime
 
-from docling.document_converter import DocumentConverter
+import numpy as np
 import pandas as pd
 import openpyxl
+import orjson
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
 from app.database import SessionLocal
 from app.models.document import Document, DocumentChunk
+from app.services.document_content import render_structured_data
+from app.services.pl_parser import promote_header_row
+
+if TYPE_CHECKING:
+    from docling.document_converter import DocumentConverter
 
 logger = logging.getLogger(__name__)
 
+# Text-based metric extraction: a keyword followed (on the same line) by an
+# amount. Keywords are tried in order per metric; the earliest match of the
+# first keyword that matches anywhere wins.
+_METRIC_KEYWORDS = (
+    ('revenue', ('revenue', 'net sales')),
+    ('eps', ('earnings per share', 'eps')),
+)
+_AMOUNT_AFTER_KEYWORD = r".*?\$?(?P<amount>[\d,]+\.?\d*)\s*(?P<unit>million|billion|thousand)?"
+_KEYWORD_RES = {
+    keyword: re.compile(re.escape(keyword) + _AMOUNT_AFTER_KEYWORD, re.IGNORECASE)
+    for _, keywords in _METRIC_KEYWORDS
+    for keyword in keywords
+}
+# Section headings that mark the income statement in converted documents
+_INCOME_STATEMENT_RE = re.compile(r"income statements?|statements? of (?:consolidated )?(?:operations|income)", re.IGNORECASE)
+_UNIT_MULTIPLIERS = {'thousand': 1000, 'million': 1000000, 'billion': 1000000000}
+
+# Excel metrics taken from the last matching cell; the rest keep the largest magnitude
+_LAST_VALUE_METRICS = ('eps', 'operating_cash_flow')
+
+
+def _excel_metric_for_column(col_lower: str) -> Optional[str]:
+    """Metric a financial column feeds in _extract_excel_metrics, if any"""
+    if 'revenue' in col_lower or 'sales' in col_lower:
+        return 'revenue'
+    if 'net income' in col_lower or 'profit' in col_lower:
+        return 'net_income'
+    if 'eps' in col_lower or 'earnings per share' in col_lower:
+        return 'eps'
+    if 'assets' in col_lower and 'total' in col_lower:
+        return 'total_assets'
+    if 'debt' in col_lower and 'total' in col_lower:
+        return 'total_debt'
+    if 'cash flow' in col_lower and 'operating' in col_lower:
+        return 'operating_cash_flow'
+    return None
+
+def _numeric_block(df: pd.DataFrame, columns: List[int]) -> tuple[np.ndarray, np.ndarray]:
+    """Float values and number mask (ints, floats incl. NaN, bools) for the given column positions"""
+    values = np.full((len(df), len(columns)), np.nan)
+    is_number = np.zeros(values.shape, dtype=bool)
+    for i, position in enumerate(columns):
+        series = df.iloc[:, position]
+        if series.dtype.kind in 'biuf':
+            values[:, i] = series.to_numpy(dtype=float)
+            is_number[:, i] = True
+        elif series.dtype == object:
+            cells = series.to_numpy()
+            mask = _is_number(cells).astype(bool)
+            values[mask, i] = cells[mask].astype(float)
+            is_number[:, i] = mask
+    return values, is_number
+
+# Opt-in calamine (Rust) Excel reader (DOCUMENT_FAST_EXCEL=1), used only when
+# python-calamine is installed
+FAST_EXCEL = os.getenv('DOCUMENT_FAST_EXCEL') == '1' and importlib.util.find_spec('python_calamine') is not None
+
+# Column-name keywords, matched in one pass with a single alternation
+_FINANCIAL_KEYWORDS = (
+    'revenue', 'income', 'expense', 'cost', 'profit', 'loss', 'sales',
+    'cash', 'assets', 'liabilities', 'equity', 'debt', 'margin',
+    'ebitda', 'eps', 'roi', 'price', 'amount', 'value', 'total',
+    'gross', 'net', 'operating', 'interest', 'tax', 'dividend'
+)
+_FINANCIAL_KEYWORD_RE = re.compile('|'.join(map(re.escape, _FINANCIAL_KEYWORDS)))
+
+_WORD_RE = re.compile(r'\S+')
+
+# Elementwise str() over object arrays, without pandas re-boxing the values
+_to_str = np.frompyfunc(str, 1, 1)
+_is_number = np.frompyfunc(lambda value: isinstance(value, (int, float)), 1, 1)
+_is_datetime = np.frompyfunc(lambda value: isinstance(value, datetime), 1, 1)
+
+
+@functools.lru_cache(maxsize=1)
+def _get_converter() -> "DocumentConverter":
+    # Docling pulls in its model stack on import and may load layout/OCR models
+    # here, so it's imported on first conversion (not at app startup) and the
+    # converter is built once per process
+    from docling.document_converter import DocumentConverter
+    return DocumentConverter()
+
+
 class DocumentProcessor:
     """Service for processing documents using Docling"""
 
-    def __init__(self):
-        self.converter = DocumentConverter()
+    @property
+    def converter(self) -> "DocumentConverter":
+        """Process-wide Docling converter, loaded on first conversion"""
+        return _get_converter()
 
     async def process_document_async(self, document_id: int, file_path: str):
         """Process document asynchronously in background"""
+        executor = _get_executor()
         try:
-            # Run the synchronous processing in a thread pool
-            await asyncio.get_event_loop().run_in_executor(
-                None, self._process_document_sync, document_id, file_path
+            # Parsing/conversion is CPU-bound, so run it in a worker process
+            await asyncio.get_running_loop().run_in_executor(
+                executor, _process_document_in_worker, document_id, file_path
             )
+        except BrokenProcessPool as e:
+            # A worker died (e.g. Docling ran out of memory); the pool can't take
+            # more work, so the next document starts a fresh one
+            logger.error(f"Document worker pool broke while processing document {document_id}: {str(e)}")
+            _discard_executor(executor)
+            self._update_document_status(document_id, "failed", "Document processing worker stopped unexpectedly")
         except Exception as e:
             logger.error(f"Error processing document {document_id}: {str(e)}")
             self._update_document_status(document_id, "failed", str(e))
@@ -36,45 +142,36 @@ class DocumentProcessor:
         """Synchronous document processing logic"""
         db = SessionLocal()
         try:
-            # Update status to processing
-            self._update_document_status(document_id, "processing", progress=10.0)
-
-            file_extension = Path(file_path).suffix.lower()
-
-            if file_extension in ['.xlsx', '.xls']:
-                # Process Excel file
-                logger.info(f"Starting Excel processing of document {document_id}")
-                raw_text, structured_data = self._process_excel_file(file_path)
-                page_count = structured_data.get("summary", {}).get("total_sheets", 1)
-            else:
-                # Process with Docling (PDF, DOCX)
-                logger.info(f"Starting Docling conversion of document {document_id}")
-                result = self.converter.convert(file_path)
-                raw_text, page_metadata = self._extract_text_with_pages(result)
-                structured_data = self._extract_structured_data(result)
-                structured_data["page_metadata"] = page_metadata
-                page_count = len(result.document.pages)
-
-            # Update progress
-            self._update_document_status(document_id, "processing", progress=50.0)
-
-            # Update progress
-            self._update_document_status(document_id, "processing", progress=70.0)
+            # Mark as processing on this session; the results land in one final commit
+            document = db.query(Document).filter(Document.id == document_id).first()
+            if document:
+                document.status = "processing"
+                document.processing_progress = 10.0
+                db.commit()
 
-            # Extract financial metrics
-            financial_metrics = self._extract_financial_metrics(raw_text, structured_data)
+            # Excel sheet DataFrames, reused for metric extraction
+            sheet_frames: Dict[str, pd.DataFrame] = {}
 
-            # Update progress
-            self._update_document_status(document_id, "processing", progress=90.0)
+            step, handler = _FORMAT_HANDLERS.get(Path(file_path).suffix.lower(), _DEFAULT_FORMAT_HANDLER)
+            logger.info(f"Starting {step} of document {document_id}")
+            raw_text, structured_data, page_count = handler(self, file_path, sheet_frames)
+
+            # Extract financial metrics
+            financial_metrics = self._extract_financial_metrics(raw_text, structured_data, sheet_frames)
 
             # Create document chunks for vector search
             chunks = self._create_document_chunks(raw_text, document_id)
 
             # Save results to database
-            document = db.query(Document).filter(Document.id == document_id).first()
             if document:
                 document.raw_text = raw_text
                 document.structured_data = structured_data
+                document.structured_data_json = orjson.dumps(
+                    structured_data,
+                    option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+                    default=str
+                ).decode()
+                document.rendered_content = render_structured_data(structured_data)
                 document.extracted_metrics = financial_metrics
                 document.document_metadata = {
                     "page_count": page_count,
@@ -85,26 +182,43 @@ class DocumentProcessor:
                 document.processing_progress = 100.0
                 document.processed_at = datetime.utcnow()
 
-                # Save chunks
-                for chunk in chunks:
-                    db_chunk = DocumentChunk(
-                        document_id=document_id,
-                        chunk_index=chunk["index"],
-                        content=chunk["content"],
-                        page_number=chunk.get("page_number"),
-                        section_title=chunk.get("section_title")
-                    )
-                    db.add(db_chunk)
+                # Save chunks in one executemany (same transaction as the document update)
+                if chunks:
+                    db.execute(insert(DocumentChunk), [
+                        {
+                            "document_id": document_id,
+                            "chunk_index": chunk["index"],
+                            "content": chunk["content"],
+                            "page_number": chunk.get("page_number"),
+                            "section_title": chunk.get("section_title")
+                        }
+                        for chunk in chunks
+                    ])
 
                 db.commit()
                 logger.info(f"Successfully processed document {document_id}")
 
         except Exception as e:
             logger.error(f"Error in document processing: {str(e)}")
+            # Release this session's transaction before the status update takes its own
+            db.rollback()
             self._update_document_status(document_id, "failed", str(e))
         finally:
             db.close()
 
+    def _convert_excel(self, file_path: str, sheet_frames: Dict[str, pd.DataFrame]) -> tuple[str, Dict[str, Any], int]:
+        """Excel handler: (raw_text, structured_data, page_count)"""
+        raw_text, structured_data = self._process_excel_file(file_path, sheet_frames)
+        return raw_text, structured_data, structured_data.get("summary", {}).get("total_sheets", 1)
+
+    def _convert_with_docling(self, file_path: str, sheet_frames: Dict[str, pd.DataFrame]) -> tuple[str, Dict[str, Any], int]:
+        """Docling handler (PDF, DOCX): (raw_text, structured_data, page_count)"""
+        result = self.converter.convert(file_path)
+        raw_text, page_metadata = self._extract_text_with_pages(result)
+        structured_data = self._extract_structured_data(result)
+        structured_data["page_metadata"] = page_metadata
+        return raw_text, structured_data, len(result.document.pages)
+
     def _extract_text_with_pages(self, result) -> tuple[str, List[Dict[str, Any]]]:
         """Extract text with page boundaries and metadata"""
         full_text = []
@@ -114,17 +228,21 @@ class DocumentProcessor:
         for page in result.document.pages:
             page_text = page.export_to_text()
             page_num = page.page_no
+            header = f"[Page {page_num}]\n"
+            page_len = len(page_text)
 
+            # Positions are offsets of the page text in the joined output
+            start_position = current_position + len(header)
             page_info = {
                 "page_number": page_num,
-                "start_position": current_position,
-                "end_position": current_position + len(page_text),
-                "text_length": len(page_text)
+                "start_position": start_position,
+                "end_position": start_position + page_len,
+                "text_length": page_len
             }
 
             page_metadata.append(page_info)
-            full_text.append(f"[Page {page_num}]\n{page_text}")
-            current_position += len(page_text) + len(f"[Page {page_num}]\n")
+            full_text.append(header + page_text)
+            current_position = start_position + page_len + 2  # "\n\n" separator
 
         return "\n\n".join(full_text), page_metadata
 
@@ -167,7 +285,12 @@ class DocumentProcessor:
             logger.error(f"Error extracting structured data: {str(e)}")
             return {}
 
-    def _extract_financial_metrics(self, text: str, structured_data: Dict) -> Dict[str, Any]:
+    def _extract_financial_metrics(
+        self,
+        text: str,
+        structured_data: Dict,
+        sheet_frames: Optional[Dict[str, pd.DataFrame]] = None
+    ) -> Dict[str, Any]:
         """Extract common financial metrics from text and structured data"""
         metrics = {
             "revenue": None,
@@ -182,84 +305,149 @@ class DocumentProcessor:
 
         # If structured data contains Excel sheets, try to extract from there first
         if "sheets" in structured_data:
-            excel_metrics = self._extract_excel_metrics(structured_data)
+            excel_metrics = self._extract_excel_metrics(structured_data, sheet_frames)
             if excel_metrics:
                 metrics.update(excel_metrics)
                 metrics["extracted_from"] = "excel"
                 return metrics
 
-        # Fallback to text-based extraction
-        import re
+        # Fallback to text-based extraction, scoped to the income statement pages
+        # when the document has them; anything not found there comes from the
+        # whole text
+        found = {}
+        statement_text = self._income_statement_text(text, structured_data)
+        if statement_text:
+            found = self._find_metric_amounts(statement_text)
+        if len(found) < len(_METRIC_KEYWORDS):
+            found = {**self._find_metric_amounts(text, skip=found), **found}
 
-        # Revenue patterns
-        revenue_patterns = [
-            r"revenue.*?\$?([\d,]+\.?\d*)\s*(million|billion|thousand)?",
-            r"net sales.*?\$?([\d,]+\.?\d*)\s*(million|billion|thousand)?",
-            r"total revenue.*?\$?([\d,]+\.?\d*)\s*(million|billion|thousand)?"
-        ]
+        if 'revenue' in found:
+            unit = found['revenue'].group('unit')
+            multiplier = _UNIT_MULTIPLIERS.get(unit.lower(), 1) if unit else 1
+            metrics["revenue"] = float(found['revenue'].group('amount').replace(',', '')) * multiplier
 
-        for pattern in revenue_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                amount = match.group(1).replace(',', '')
-                unit = match.group(2)
-                multiplier = {'thousand': 1000, 'million': 1000000, 'billion': 1000000000}.get(unit, 1)
-                metrics["revenue"] = float(amount) * multiplier
-                break
-
-        # EPS patterns
-        eps_patterns = [
-            r"earnings per share.*?\$?([\d,]+\.?\d*)",
-            r"eps.*?\$?([\d,]+\.?\d*)",
-            r"diluted earnings per share.*?\$?([\d,]+\.?\d*)"
-        ]
-
-        for pattern in eps_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                metrics["eps"] = float(match.group(1).replace(',', ''))
-                break
+        if 'eps' in found:
+            metrics["eps"] = float(found['eps'].group('amount').replace(',', ''))
 
         return metrics
 
-    def _extract_excel_metrics(self, structured_data: Dict) -> Dict[str, Any]:
-        """Extract financial metrics from Excel structured data"""
+    def _find_metric_amounts(self, text: str, skip: Optional[Dict[str, re.Match]] = None) -> Dict[str, re.Match]:
+        """
+        First '<keyword> ... <amount>' match per metric (metrics in skip are not searched).
+        Keyword occurrences are located with str.find on a lower-cased copy (a C-speed
+        literal scan) and the regex only runs anchored at those positions, instead of
+        the backtracking engine walking the whole text for each pattern
+        """
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # Lower-casing changed offsets (rare non-ASCII cases); search directly
+            lowered = None
+
+        found = {}
+        for metric, keywords in _METRIC_KEYWORDS:
+            if skip and metric in skip:
+                continue
+            for keyword in keywords:
+                match = self._find_keyword_amount(text, lowered, keyword)
+                if match:
+                    found[metric] = match
+                    break
+        return found
+
+    @staticmethod
+    def _income_statement_text(text: str, structured_data: Dict) -> Optional[str]:
+        """Text of the pages holding income statement headings (plus the page after each), if any"""
+        pages = {
+            section.get("page") for section in structured_data.get("sections", [])
+            if _INCOME_STATEMENT_RE.search(section.get("title") or "")
+        }
+        if not pages:
+            return None
+
+        # Statements often run onto the next page
+        pages |= {page + 1 for page in pages if isinstance(page, int)}
+        windows = [
+            text[page["start_position"]:page["end_position"]]
+            for page in structured_data.get("page_metadata", [])
+            if page.get("page_number") in pages
+        ]
+        return "\n\n".join(windows) or None
+
+    @staticmethod
+    def _find_keyword_amount(text: str, lowered: Optional[str], keyword: str) -> Optional[re.Match]:
+        """Earliest '<keyword> ... <amount>' match in text (lowered: text.lower(), or None to search without it)"""
+        pattern = _KEYWORD_RES[keyword]
+        if lowered is None:
+            return pattern.search(text)
+
+        position = lowered.find(keyword)
+        while position != -1:
+            match = pattern.match(text, position)
+            if match:
+                return match
+            position = lowered.find(keyword, position + 1)
+        return None
+
+    def _extract_excel_metrics(
+        self,
+        structured_data: Dict,
+        sheet_frames: Optional[Dict[str, pd.DataFrame]] = None
+    ) -> Dict[str, Any]:
+        """
+        Extract financial metrics from Excel structured data
+
+        Works column-wise on each sheet's DataFrame (sheet_frames, as filled by
+        _process_excel_file, or rebuilt from data_sample). Cells are considered
+        record by record, as in data_sample: magnitude metrics keep the first
+        largest |value|, eps and operating cash flow the last value.
+        """
         metrics = {}
 
         try:
             for sheet in structured_data.get("sheets", []):
                 financial_columns = sheet.get("financial_columns", [])
-                data_sample = sheet.get("data_sample", [])
+                df = (sheet_frames or {}).get(sheet.get("name"))
+                if df is None:
+                    data_sample = sheet.get("data_sample", [])
+                    df = pd.DataFrame.from_records(data_sample) if data_sample else None
 
-                if not data_sample or not financial_columns:
+                if df is None or df.empty or not financial_columns:
                     continue
 
-                # Look for common financial metrics in the data
-                for record in data_sample:
-                    for col in financial_columns:
-                        col_lower = str(col).lower()
-                        value = record.get(col)
-
-                        if value is None or not isinstance(value, (int, float)):
+                # Map columns to metrics based on keywords once per sheet, not per cell
+                # (a repeated label resolves to its last column, like a records dict)
+                positions = {col: i for i, col in enumerate(df.columns)}
+                columns_by_metric: Dict[str, List[int]] = {}
+                for col in financial_columns:
+                    metric = _excel_metric_for_column(str(col).lower())
+                    if metric and col in positions:
+                        columns_by_metric.setdefault(metric, []).append(positions[col])
+
+                for metric, columns in columns_by_metric.items():
+                    values, is_number = _numeric_block(df, columns)
+                    # Row-major flattening keeps the record-by-record order
+                    cells = np.flatnonzero(is_number.ravel())
+                    if not len(cells):
+                        continue
+                    numbers = values.ravel()[cells]
+
+                    if metric in _LAST_VALUE_METRICS:
+                        pick = cells[-1]
+                    else:
+                        current = metrics.get(metric)
+                        if current is None and np.isnan(numbers[0]):
+                            # A leading NaN sticks: nothing compares greater
+                            pick = cells[0]
+                        elif np.isnan(numbers).all():
                             continue
+                        else:
+                            pick = cells[int(np.nanargmax(np.abs(numbers)))]
+                            if current is not None and not abs(values.ravel()[pick]) > abs(current):
+                                continue
 
-                        # Map columns to metrics based on keywords
-                        if 'revenue' in col_lower or 'sales' in col_lower:
-                            if metrics.get("revenue") is None or abs(value) > abs(metrics.get("revenue", 0)):
-                                metrics["revenue"] = value
-                        elif 'net income' in col_lower or 'profit' in col_lower:
-                            if metrics.get("net_income") is None or abs(value) > abs(metrics.get("net_income", 0)):
-                                metrics["net_income"] = value
-                        elif 'eps' in col_lower or 'earnings per share' in col_lower:
-                            metrics["eps"] = value
-                        elif 'assets' in col_lower and 'total' in col_lower:
-                            if metrics.get("total_assets") is None or abs(value) > abs(metrics.get("total_assets", 0)):
-                                metrics["total_assets"] = value
-                        elif 'debt' in col_lower and 'total' in col_lower:
-                            if metrics.get("total_debt") is None or abs(value) > abs(metrics.get("total_debt", 0)):
-                                metrics["total_debt"] = value
-                        elif 'cash flow' in col_lower and 'operating' in col_lower:
-                            metrics["operating_cash_flow"] = value
+                    row, col = divmod(int(pick), len(columns))
+                    value = df.iat[row, columns[col]]
+                    metrics[metric] = value.item() if isinstance(value, np.generic) else value
 
         except Exception as e:
             logger.warning(f"Error extracting Excel metrics: {str(e)}")
@@ -273,14 +461,19 @@ class DocumentProcessor:
         overlap = 200
         chunks = []
 
-        words = text.split()
         current_chunk = []
+        # len(' '.join(current_chunk)) + 1, kept as a running total
+        current_len = 0
         chunk_index = 0
 
-        for i, word in enumerate(words):
+        # Words are pulled lazily (same split as str.split()) so only the
+        # current chunk's words are held, not a list of every word in the text
+        for match in _WORD_RE.finditer(text):
+            word = match.group()
             current_chunk.append(word)
+            current_len += len(word) + 1
 
-            if len(' '.join(current_chunk)) >= chunk_size:
+            if current_len - 1 >= chunk_size:
                 chunk_text = ' '.join(current_chunk)
                 chunks.append({
                     "index": chunk_index,
@@ -292,6 +485,7 @@ class DocumentProcessor:
                 # Keep overlap for next chunk
                 overlap_words = current_chunk[-overlap//10:] if len(current_chunk) > overlap//10 else []
                 current_chunk = overlap_words
+                current_len = sum(len(w) + 1 for w in overlap_words)
                 chunk_index += 1
 
         # Add remaining content as final chunk
@@ -323,11 +517,15 @@ class DocumentProcessor:
         finally:
             db.close()
 
-    def _process_excel_file(self, file_path: str) -> tuple[str, Dict[str, Any]]:
-        """Process Excel file and extract text and structured data"""
+    def _process_excel_file(
+        self,
+        file_path: str,
+        sheet_frames: Optional[Dict[str, pd.DataFrame]] = None
+    ) -> tuple[str, Dict[str, Any]]:
+        """Process Excel file and extract text and structured data (each sheet's frame goes into sheet_frames if given)"""
         try:
             # Read Excel file with all sheets
-            xl_file = pd.ExcelFile(file_path)
+            xl_file = pd.ExcelFile(file_path, engine='calamine' if FAST_EXCEL else None)
             all_text = []
             structured_data = {
                 "sheets": [],
@@ -335,71 +533,17 @@ class DocumentProcessor:
                 "summary": {}
             }
 
+            # Sequential on purpose: openpyxl parsing holds the GIL and a calamine
+            # workbook can't be shared across threads
             for sheet_name in xl_file.sheet_names:
-                try:
-                    # Read sheet without forcing headers initially
-                    df_raw = pd.read_excel(file_path, sheet_name=sheet_name, header=None)
-
-                    # Find the header row by looking for the row with most non-null, non-numeric values
-                    header_row_idx = 0
-                    max_text_cols = 0
-
-                    for idx in range(min(10, df_raw.shape[0])):  # Check first 10 rows
-                        row = df_raw.iloc[idx]
-                        # Count non-null cells that contain text (potential headers)
-                        text_count = sum(1 for val in row if pd.notna(val) and not isinstance(val, (int, float)))
-                        if text_count > max_text_cols:
-                            max_text_cols = text_count
-                            header_row_idx = idx
-
-                    # Now read with the detected header row
-                    df = pd.read_excel(file_path, sheet_name=sheet_name, header=header_row_idx)
-
-                    # Clean up column names - keep original names, just ensure they're strings
-                    df.columns = [str(col) if pd.notna(col) else f'Column_{i}' for i, col in enumerate(df.columns)]
-
-                    # Convert to text representation
-                    sheet_text = f"\n=== Sheet: {sheet_name} ===\n"
-
-                    # Add column headers
-                    if not df.empty:
-                        headers = [str(col) for col in df.columns]
-                        sheet_text += "Columns: " + ", ".join(headers) + "\n\n"
-
-                        # Add all data rows
-                        for idx, row in df.iterrows():
-                            # Create a more structured representation
-                            row_data = []
-                            for i, val in enumerate(row.values):
-                                col_name = headers[i] if i < len(headers) else f"Col_{i}"
-                                if pd.notna(val) and str(val).strip():
-                                    row_data.append(f"{col_name}: {val}")
-
-                            if row_data:  # Only add rows with actual data
-                                sheet_text += f"Row {idx + 1}: " + " | ".join(row_data) + "\n"
-
+                sheet_text, df, sheet_data = self._process_sheet(xl_file, sheet_name)
+                if sheet_text is not None:
                     all_text.append(sheet_text)
-
-                    # Store structured data - include ALL rows for AI analysis
-                    sheet_data = {
-                        "name": sheet_name,
-                        "rows": len(df),
-                        "columns": len(df.columns),
-                        "column_names": list(df.columns),
-                        "data_sample": df.to_dict('records') if not df.empty else []  # All rows, not just sample
-                    }
-
-                    # Identify potential financial data
-                    financial_columns = self._identify_financial_columns(df)
-                    if financial_columns:
-                        sheet_data["financial_columns"] = financial_columns
-
+                if sheet_data is not None:
+                    if sheet_frames is not None:
+                        sheet_frames[sheet_name] = df
                     structured_data["sheets"].append(sheet_data)
 
-                except Exception as e:
-                    logger.warning(f"Error processing sheet {sheet_name}: {str(e)}")
-                    continue
-
             # Generate summary
             structured_data["summary"] = {
                 "total_sheets": len(xl_file.sheet_names),
@@ -415,29 +559,182 @@ class DocumentProcessor:
             logger.error(f"Error processing Excel file: {str(e)}")
             return f"Error processing Excel file: {str(e)}", {"error": str(e)}
 
+    def _process_sheet(
+        self,
+        xl_file: pd.ExcelFile,
+        sheet_name: str
+    ) -> tuple[Optional[str], Optional[pd.DataFrame], Optional[Dict[str, Any]]]:
+        """
+        Text, DataFrame and structured data for one sheet. On failure the sheet is
+        logged and skipped (its text is still kept if it was already rendered)
+        """
+        sheet_text = None
+        try:
+            # Read sheet without forcing headers initially (the workbook is opened once)
+            df_raw = xl_file.parse(sheet_name, header=None)
+
+            # Find the header row by looking for the row with most non-null, non-numeric values
+            header_row_idx = self._detect_header_row(df_raw.head(10))  # Check first 10 rows
+
+            # Re-slice at the detected header row instead of parsing the sheet again
+            df = promote_header_row(df_raw, header_row_idx)
+
+            # Clean up column names - keep original names, just ensure they're strings
+            df.columns = [str(col) if pd.notna(col) else f'Column_{i}' for i, col in enumerate(df.columns)]
+
+            # Convert to text representation
+            sheet_parts = [f"\n=== Sheet: {sheet_name} ===\n"]
+
+            # Add column headers
+            if not df.empty:
+                headers = [str(col) for col in df.columns]
+                sheet_parts.append("Columns: " + ", ".join(headers) + "\n\n")
+
+                # Add all data rows
+                sheet_parts.extend(self._format_rows(df, headers))
+
+            sheet_text = "".join(sheet_parts)
+
+            # Store structured data - include ALL rows for AI analysis
+            sheet_data = {
+                "name": sheet_name,
+                "rows": len(df),
+                "columns": len(df.columns),
+                "column_names": list(df.columns),
+                "data_sample": df.to_dict('records') if not df.empty else []  # All rows, not just sample
+            }
+
+            # Identify potential financial data
+            financial_columns = self._identify_financial_columns(df)
+            if financial_columns:
+                sheet_data["financial_columns"] = financial_columns
+
+            return sheet_text, df, sheet_data
+
+        except Exception as e:
+            logger.warning(f"Error processing sheet {sheet_name}: {str(e)}")
+            return sheet_text, None, None
+
+    @staticmethod
+    def _detect_header_row(head: pd.DataFrame) -> int:
+        """Index of the first row with the most non-null, non-numeric cells (0 if none)"""
+        if head.empty:
+            return 0
+
+        # Numeric as a row read through iloc would see it: all-numeric frames
+        # upcast to one dtype, mixed frames keep numpy scalars (only floats count)
+        values = head.to_numpy()
+        if values.dtype != object:
+            is_number = np.full(head.shape, values.dtype.kind == 'f')
+        else:
+            is_number = _is_number(values).astype(bool)
+            kinds = np.array([dtype.kind for dtype in head.dtypes])
+            typed = kinds != 'O'
+            is_number[:, typed] = kinds[typed] == 'f'
+
+        text_counts = (head.notna().to_numpy() & ~is_number).sum(axis=1)
+        return int(text_counts.argmax())
+
+    @staticmethod
+    def _format_rows(df: pd.DataFrame, headers: List[str]) -> List[str]:
+        """
+        Render rows as 'Row N: col: val | ...' lines, skipping blank cells and
+        rows; cells are stringified a column at a time instead of per row
+        """
+        # Same cell values iterrows() would yield: numeric frames share one dtype
+        # and rows holding only dates come back as numpy datetime64
+        values = df.to_numpy()
+        if values.dtype.kind in 'mM':
+            values = df.astype(object).to_numpy()
+        if values.dtype == object and values.size:
+            is_date = _is_datetime(values).astype(bool)
+            date_rows = (is_date | pd.isna(values)).all(axis=1) & is_date.any(axis=1)
+            if date_rows.any():
+                values = values.copy()
+                cells = is_date & date_rows[:, None]
+                values[cells] = [np.datetime64(v, 'ns') for v in values[cells]]
+
+        columns = []
+        for i, header in enumerate(headers):
+            col = values[:, i]
+            text = pd.Series(col.astype(str) if col.dtype.kind in 'biuf' else _to_str(col), dtype=object)
+            keep = pd.notna(col) & (text.str.strip() != '').to_numpy()
+            columns.append(np.where(keep, header + ": " + text, None))
+
+        lines = []
+        for idx, cells in enumerate(zip(*columns)):
+            row_data = [cell for cell in cells if cell is not None]
+            if row_data:  # Only add rows with actual data
+                lines.append(f"Row {idx + 1}: " + " | ".join(row_data) + "\n")
+        return lines
+
     def _identify_financial_columns(self, df: pd.DataFrame) -> List[str]:
         """Identify columns that likely contain financial data"""
-        financial_keywords = [
-            'revenue', 'income', 'expense', 'cost', 'profit', 'loss', 'sales',
-            'cash', 'assets', 'liabilities', 'equity', 'debt', 'margin',
-            'ebitda', 'eps', 'roi', 'price', 'amount', 'value', 'total',
-            'gross', 'net', 'operating', 'interest', 'tax', 'dividend'
-        ]
-
         financial_columns = []
 
         for column in df.columns:
             column_str = str(column).lower()
             # Check if column name contains financial keywords
-            if any(keyword in column_str for keyword in financial_keywords):
+            if _FINANCIAL_KEYWORD_RE.search(column_str):
                 financial_columns.append(column)
             # Check if column contains mostly numeric data
             elif df[column].dtype in ['int64', 'float64']:
-                # Check if values look like financial data (not just sequential numbers)
-                non_null_values = df[column].dropna()
+                # Check if values look like financial data (not just sequential numbers),
+                # on the raw array to skip per-column Series overhead on wide sheets
+                non_null_values = df[column].to_numpy()
+                if non_null_values.dtype.kind == 'f':
+                    non_null_values = non_null_values[~np.isnan(non_null_values)]
                 if len(non_null_values) > 0:
                     # If values are generally large or have decimal places, likely financial
-                    if non_null_values.abs().mean() > 100 or any('.' in str(val) for val in non_null_values.head(5)):
+                    if np.abs(non_null_values).mean() > 100 or any('.' in str(val) for val in non_null_values[:5]):
                         financial_columns.append(column)
 
-        return financial_columns
\ No newline at end of file
+        return financial_columns
+
+
+# File extension -> (step name for logs, handler); other formats go through Docling
+_FORMAT_HANDLERS = {
+    '.xlsx': ("Excel processing", DocumentProcessor._convert_excel),
+    '.xls': ("Excel processing", DocumentProcessor._convert_excel),
+}
+_DEFAULT_FORMAT_HANDLER = ("Docling conversion", DocumentProcessor._convert_with_docling)
+
+
+# Worker processes for document processing. Each loads the Docling converter
+# (and its models) on its first PDF/DOCX and keeps it, and all of them write to
+# the same database, so the default is a single worker
+DOCUMENT_WORKERS = int(os.getenv('DOCUMENT_WORKERS', '1')) or 1
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: don't fork the server process with its event loop and DB pool
+        _executor = ProcessPoolExecutor(
+            max_workers=DOCUMENT_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _executor
+
+
+def _discard_executor(executor: ProcessPoolExecutor):
+    """Drop a broken pool (unless it was already replaced) so _get_executor builds a new one"""
+    global _executor
+    if _executor is executor:
+        _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_executor():
+    """Stop the worker pool (app shutdown); queued documents are cancelled"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _process_document_in_worker(document_id: int, file_path: str):
+    """Process a document inside a pool worker"""
+    DocumentProcessor()._process_document_sync(document_id, file_path)
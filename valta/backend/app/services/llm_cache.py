@@ -0,0 +1,69 @@
+"""
+LLM Response Cache
+Persists completions in the llm_cache table keyed by a hash of the prompt
+inputs and the prompt version, so an unchanged document or question is
+never sent to the API twice within the TTL.
+"""
+
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from sqlalchemy.orm import Session
+
+from app.models.document import LLMCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = timedelta(days=7)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def make_input_hash(*parts: str) -> str:
+    """128-bit blake2b digest of the prompt inputs"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def get_cached_response(db: Session, input_hash: str, prompt_version: str) -> Optional[Any]:
+    """Return the cached payload, or None if missing/expired"""
+    try:
+        row = db.query(LLMCache.response_json).filter(
+            LLMCache.input_hash == input_hash,
+            LLMCache.prompt_version == prompt_version,
+            LLMCache.expires_at > _utcnow()
+        ).first()
+    except Exception as e:
+        logger.warning(f"LLM cache lookup failed: {str(e)}")
+        return None
+
+    return json.loads(row.response_json) if row else None
+
+
+def store_response(
+    db: Session,
+    input_hash: str,
+    prompt_version: str,
+    payload: Any,
+    ttl: timedelta = DEFAULT_TTL
+):
+    """Insert or refresh a cached payload"""
+    try:
+        db.merge(LLMCache(
+            input_hash=input_hash,
+            prompt_version=prompt_version,
+            response_json=json.dumps(payload),
+            expires_at=_utcnow() + ttl
+        ))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"LLM cache write failed: {str(e)}")
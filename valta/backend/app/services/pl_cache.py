@@ -0,0 +1,91 @@
+"""
+P&L Result Cache
+Keeps parsed + account-mapped P&L DataFrames in memory so that the
+parse / waterfall / export endpoints don't re-run the parser and the
+AI account mapping for a file that has already been processed, and the
+raw parser line items so startup metric recalculations skip parsing.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+# Bump whenever PLParser or AccountMapper output changes shape so stale
+# entries are never served
+PL_CACHE_VERSION = "1"
+
+
+class PLCache:
+    """LRU + TTL cache of (mapped_df, parse_metadata) keyed by file digest"""
+
+    def __init__(self, max_entries: int = 32, ttl_seconds: int = 7 * 24 * 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, pd.DataFrame, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(
+        file_path: str,
+        user_hints: Optional[Dict] = None,
+        content_hash: Optional[str] = None
+    ) -> str:
+        """
+        Build a cache key from the file contents, parser hints and cache version
+
+        Args:
+            file_path: Path to the P&L file
+            user_hints: Optional parser hints (header_row, account_column, ...)
+            content_hash: sha256 of the file recorded at upload, if known
+
+        Returns:
+            Hex digest identifying this parse
+        """
+        if not content_hash:
+            digest = hashlib.sha256()
+            with open(file_path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(block)
+            content_hash = digest.hexdigest()
+
+        hints = json.dumps(user_hints or {}, sort_keys=True, default=str)
+        return f"{PL_CACHE_VERSION}:{content_hash}:{hashlib.sha256(hints.encode()).hexdigest()[:16]}"
+
+    def get(self, key: str) -> Optional[Tuple[pd.DataFrame, Dict]]:
+        """Return cached (mapped_df, metadata) or None if missing/expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            stored_at, mapped_df, metadata = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return mapped_df, metadata
+
+    def set(self, key: str, mapped_df: pd.DataFrame, metadata: Dict):
+        """Store a parse result, evicting the least recently used entry if full"""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), mapped_df, metadata)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all cached results"""
+        with self._lock:
+            self._entries.clear()
+
+
+# Global cache instances
+pl_cache = PLCache()
+# PLParser line_items + metadata (no account mapping), used by startup analytics
+parsed_pl_cache = PLCache()
@@ -9,11 +9,150 @@ Intelligently parses financial P&L statements from Excel/CSV files with:
 - Month-on-month variance calculations
 """
 
+import os
+import importlib.util
+import numpy as np
 import pandas as pd
 import re
+from pandas.io.parsers import TextParser
 from typing import Dict, List, Tuple, Optional
 from datetime import datetime
-import openpyxl
+
+# Opt-in pyarrow CSV reader (PL_PARSER_FAST=1), and Arrow strings for the
+# account-name string ops (subtotal/hierarchy detection). pyarrow is in
+# requirements.txt; without it both fall back to the default pandas paths
+PL_PARSER_FAST = os.getenv('PL_PARSER_FAST') == '1'
+FAST_CSV = PL_PARSER_FAST and importlib.util.find_spec('pyarrow') is not None
+ARROW_STRINGS = importlib.util.find_spec('pyarrow') is not None
+# Excel goes through calamine (Rust) whenever python-calamine is installed;
+# openpyxl remains the fallback
+FAST_EXCEL = importlib.util.find_spec('python_calamine') is not None
+
+_CURRENCY_RE = re.compile(r'[$€£¥,\s]')
+_is_number = np.frompyfunc(lambda value: isinstance(value, (int, float)), 1, 1)
+_is_text = np.frompyfunc(lambda value: isinstance(value, str), 1, 1)
+_DATE_PATTERNS = [
+    re.compile(r'\d{4}-\d{2}'), re.compile(r'\d{2}/\d{4}'),
+    re.compile(r'(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)'),
+    re.compile(r'\d{1,2}/\d{1,2}/\d{2,4}')
+]
+_YYYY_MM_RE = re.compile(r'(\d{4})-(\d{2})')
+
+
+def _parse_period(val) -> Optional[str]:
+    """Format one date-like value as YYYY-MM, or None if it isn't one"""
+    if pd.isna(val):
+        return None
+
+    # Try pandas automatic parsing first
+    try:
+        dt = pd.to_datetime(val, errors='coerce')
+        if pd.notna(dt):
+            return dt.strftime('%Y-%m')
+    except Exception:
+        pass
+
+    # Handle text formats like "Jan 2024" or "January 2024"
+    val_str = str(val)
+
+    # Try "MMM YYYY" format
+    for fmt in ['%b %Y', '%B %Y', '%b-%Y', '%B-%Y']:
+        try:
+            dt = datetime.strptime(val_str, fmt)
+            return dt.strftime('%Y-%m')
+        except ValueError:
+            pass
+
+    # Try to extract YYYY-MM pattern
+    match = _YYYY_MM_RE.search(val_str)
+    if match:
+        return f"{match.group(1)}-{match.group(2)}"
+
+    return None
+
+
+def _parse_amount(value) -> Optional[float]:
+    """Parse one text amount: '$1,234.50' -> 1234.5, '(500)' -> -500.0, else None"""
+    # Remove currency symbols, commas, spaces
+    val_str = _CURRENCY_RE.sub('', str(value))
+
+    # Handle parentheses as negative (accounting format)
+    if '(' in val_str and ')' in val_str:
+        val_str = '-' + val_str.replace('(', '').replace(')', '')
+
+    try:
+        return float(val_str)
+    except ValueError:
+        return None
+
+
+def promote_header_row(df_raw: pd.DataFrame, header_row: int, text_labels: bool = False) -> pd.DataFrame:
+    """
+    Frame equivalent to reading with header=header_row, built from a header=None
+    read: blank labels become 'Unnamed: i', repeats get '.1', '.2' suffixes and
+    column dtypes are inferred from the data rows only
+
+    Args:
+        df_raw: Table read with header=None
+        header_row: Position of the header row in df_raw
+        text_labels: CSV semantics - labels are strings and numeric text in
+            data columns is converted to numbers
+    """
+    labels = []
+    seen = {}
+    for i, value in enumerate(df_raw.iloc[header_row].tolist() if len(df_raw) > header_row else []):
+        if pd.isna(value):
+            label = f"Unnamed: {i}"
+        elif isinstance(value, float) and value.is_integer():
+            # Whole-number labels come back as floats from all-numeric columns
+            label = int(value)
+        else:
+            label = value
+        if text_labels:
+            label = str(label)
+        key = str(label)
+        if key in seen:
+            seen[key] += 1
+            label = f"{key}.{seen[key]}"
+            seen[label] = 0
+        else:
+            seen[key] = 0
+        labels.append(label)
+
+    df = df_raw.iloc[header_row + 1:].reset_index(drop=True)
+    if not labels:
+        return df
+    if not len(df):
+        # Header was the last row: no data, untyped columns (as a header read gives)
+        return pd.DataFrame(columns=labels, dtype=object)
+    if not text_labels:
+        # Excel: run the data rows back through the parser read_excel uses, so
+        # numeric text cells are converted the way a header=header_row read
+        # converts them (the header=None read kept them as text when the
+        # column's header or title cells were text)
+        df = TextParser(df.astype(object).values.tolist(), header=None).read()
+    df.columns = labels
+    df = df.infer_objects()
+
+    for i, dtype in enumerate(df.dtypes):
+        values = df.iloc[:, i]
+        if text_labels and dtype == object:
+            # The header text kept the whole column as strings
+            try:
+                values = pd.to_numeric(values)
+            except (ValueError, TypeError):
+                continue
+            df.isetitem(i, values)
+            dtype = values.dtype
+
+        # The header cell skewed some column dtypes: empty columns read as
+        # float64 and whole-number columns as int64
+        if values.isna().all():
+            if dtype.kind != 'f':
+                df.isetitem(i, pd.Series(float('nan'), index=df.index))
+        elif dtype.kind == 'f' and values.notna().all() and (values % 1 == 0).all():
+            df.isetitem(i, values.astype('int64'))
+    return df
 
 
 class PLParser:
@@ -25,6 +164,13 @@ class PLParser:
         'operating profit', 'profit before tax', 'earnings'
     ]
 
+    HEADER_KEYWORDS = [
+        'account', 'description', 'date', 'amount',
+        'debit', 'credit', 'balance', 'revenue', 'expense',
+        'jan', 'feb', 'mar', 'apr', 'may', 'jun',
+        'jul', 'aug', 'sep', 'oct', 'nov', 'dec'
+    ]
+
     SECTION_PATTERNS = {
         'revenue': r'(revenue|sales|income)(?!.*expense)',
         'cogs': r'(cost of (goods )?sold|cogs|cost of sales|direct cost)',
@@ -42,35 +188,40 @@ class PLParser:
         self.df = None
         self.metadata = {}
 
-    def parse_file(self, file_path: str, user_hints: Optional[Dict] = None) -> Dict:
+    def parse_file(
+        self,
+        file_path: str,
+        user_hints: Optional[Dict] = None,
+        chunksize: Optional[int] = None
+    ) -> Dict:
         """
         Main parsing pipeline
 
         Args:
             file_path: Path to Excel/CSV file
             user_hints: Optional dict with header_row, account_column, date_columns
+            chunksize: Read CSVs this many rows at a time (large exports)
 
         Returns:
             Dict with 'data' (DataFrame) and 'metadata' (parsing info)
         """
         # Step 1: Initial load
-        if file_path.endswith('.csv'):
-            self.df = pd.read_csv(file_path, header=None)
+        is_csv = file_path.endswith('.csv')
+        header_row = user_hints.get('header_row') if user_hints else None
+        if is_csv and chunksize:
+            head_rows = max(15, (header_row or 0) + 1)
+            self.df = self._read_csv_chunked(file_path, chunksize, head_rows)
         else:
-            self.df = pd.read_excel(file_path, header=None, engine='openpyxl')
+            self.df = self._read_table(file_path)
 
         # Step 2: Detect header row
-        header_row = user_hints.get('header_row') if user_hints else None
         if header_row is None:
             header_row = self._detect_header_row()
 
         self.metadata['header_row'] = header_row
 
-        # Step 3: Re-read with correct header
-        if file_path.endswith('.csv'):
-            self.df = pd.read_csv(file_path, header=header_row, skiprows=range(header_row))
-        else:
-            self.df = pd.read_excel(file_path, header=header_row, skiprows=range(header_row), engine='openpyxl')
+        # Step 3: Promote the header row of the loaded table (no second read)
+        self.df = promote_header_row(self.df, header_row, text_labels=is_csv)
 
         # Step 4: Clean data
         self.df = self._remove_empty_rows_cols()
@@ -86,26 +237,25 @@ class PLParser:
 
         # Step 7: Clean numeric columns
         if column_types['values']:
-            for col in column_types['values']:
-                self.df[col] = self._clean_numeric_column(self.df[col])
+            self._clean_numeric_columns(column_types['values'])
 
         # Step 8: Detect subtotals and structure
-        account_col = column_types['account']
-        subtotal_rows = self._detect_subtotal_rows(account_col)
-        sections = self._identify_sections(account_col)
-        hierarchy = self._detect_hierarchy(account_col)
+        account_names = self._account_names(column_types['account'])
+        subtotal_rows = self._detect_subtotal_rows(account_names)
+        sections = self._identify_sections(account_names)
+        hierarchy = self._detect_hierarchy(account_names)
 
         self.metadata['subtotal_rows'] = subtotal_rows
         self.metadata['sections'] = sections
         self.metadata['hierarchy'] = hierarchy
 
         # Step 9: Separate line items from subtotals
-        line_items_df = self.df[~self.df.index.isin(subtotal_rows)].copy()
-        subtotals_df = self.df[self.df.index.isin(subtotal_rows)].copy()
+        subtotal_mask = self.df.index.isin(subtotal_rows)
+        line_items_df = self.df[~subtotal_mask].copy()
+        subtotals_df = self.df[subtotal_mask].copy()
 
         # Step 10: Add row classification
-        self.df['row_type'] = 'line_item'
-        self.df.loc[subtotal_rows, 'row_type'] = 'subtotal'
+        self.df['row_type'] = np.where(subtotal_mask, 'subtotal', 'line_item').astype(object)
 
         # Step 11: Calculate month-on-month changes if we have date columns
         if column_types['dates'] and column_types['values']:
@@ -118,31 +268,46 @@ class PLParser:
             'metadata': self.metadata
         }
 
+    def _read_table(self, file_path: str) -> pd.DataFrame:
+        """Read a CSV/Excel file without a header, using the fast readers when enabled"""
+        if file_path.endswith('.csv'):
+            if FAST_CSV:
+                return pd.read_csv(file_path, header=None, engine='pyarrow')
+            return pd.read_csv(file_path, header=None)
+
+        engine = 'calamine' if FAST_EXCEL else 'openpyxl'
+        return pd.read_excel(file_path, header=None, engine=engine)
+
+    def _read_csv_chunked(self, file_path: str, chunksize: int, head_rows: int) -> pd.DataFrame:
+        """
+        Read a CSV without a header in chunks so parser buffers stay bounded.
+        Blank rows are dropped as each chunk arrives, except within the first
+        head_rows where header detection needs the original row positions.
+        """
+        with pd.read_csv(file_path, header=None, chunksize=chunksize) as reader:
+            parts = [reader.get_chunk(max(chunksize, head_rows))]
+            parts.extend(chunk.dropna(how='all') for chunk in reader)
+        return pd.concat(parts, ignore_index=True)
+
     def _detect_header_row(self) -> int:
         """Detect header row by analyzing text density and keywords"""
-        header_keywords = ['account', 'description', 'date', 'amount',
-                          'debit', 'credit', 'balance', 'revenue', 'expense',
-                          'jan', 'feb', 'mar', 'apr', 'may', 'jun',
-                          'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
-
-        best_row = 0
-        best_score = 0
+        head = self.df.head(15)
+        if head.empty:
+            return 0
 
-        for idx, row in self.df.head(15).iterrows():
-            # Count text cells vs numeric cells
-            text_count = sum(isinstance(val, str) for val in row)
-            keyword_matches = sum(
-                any(keyword in str(val).lower() for keyword in header_keywords)
-                for val in row if pd.notna(val)
-            )
+        # Cells as iterrows() would see them, scored for the whole block at once
+        values = head.to_numpy(dtype=object)
+        text_count = _is_text(values).astype(bool).sum(axis=1)
 
-            score = (text_count * 0.5) + (keyword_matches * 2)
+        cells = pd.Series(values.ravel()).astype(str).str.lower()
+        has_keyword = cells.str.contains(_HEADER_RE, na=False).to_numpy().reshape(values.shape)
+        keyword_matches = (has_keyword & head.notna().to_numpy()).sum(axis=1)
 
-            if score > best_score:
-                best_score = score
-                best_row = idx
+        scores = (text_count * 0.5) + (keyword_matches * 2)
+        if scores.max() <= 0:
+            return 0
 
-        return int(best_row)
+        return int(head.index[scores.argmax()])
 
     def _remove_empty_rows_cols(self) -> pd.DataFrame:
         """Remove completely empty rows and columns"""
@@ -199,135 +364,153 @@ class PLParser:
 
     def _looks_like_dates(self, series: pd.Series) -> bool:
         """Check if a series looks like it contains dates"""
-        date_patterns = [
-            r'\d{4}-\d{2}', r'\d{2}/\d{4}', r'(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)',
-            r'\d{1,2}/\d{1,2}/\d{2,4}'
-        ]
-
         # Check first few values
         for val in series.head(5):
             val_str = str(val).lower()
-            if any(re.search(pattern, val_str) for pattern in date_patterns):
+            if any(pattern.search(val_str) for pattern in _DATE_PATTERNS):
                 return True
 
         return False
 
     def _normalize_date_column(self, col: pd.Series) -> pd.Series:
         """Convert various date formats to YYYY-MM format"""
-        def parse_date(val):
-            if pd.isna(val):
-                return None
-
-            # Try pandas automatic parsing first
-            try:
-                dt = pd.to_datetime(val, errors='coerce')
-                if pd.notna(dt):
-                    return dt.strftime('%Y-%m')
-            except:
-                pass
-
-            # Handle text formats like "Jan 2024" or "January 2024"
-            val_str = str(val)
-
-            # Try "MMM YYYY" format
-            for fmt in ['%b %Y', '%B %Y', '%b-%Y', '%B-%Y']:
-                try:
-                    dt = datetime.strptime(val_str, fmt)
-                    return dt.strftime('%Y-%m')
-                except:
-                    pass
-
-            # Try to extract YYYY-MM pattern
-            match = re.search(r'(\d{4})-(\d{2})', val_str)
-            if match:
-                return f"{match.group(1)}-{match.group(2)}"
-
-            return None
-
-        return col.apply(parse_date)
-
-    def _clean_numeric_column(self, col: pd.Series) -> pd.Series:
-        """Clean numeric values (remove currency symbols, handle negatives)"""
-        def clean_value(val):
-            if pd.isna(val):
-                return None
-
-            # Already a number
-            if isinstance(val, (int, float)):
-                return float(val)
-
-            # Convert to string and clean
-            val_str = str(val)
-
-            # Remove currency symbols, commas, spaces
-            val_str = re.sub(r'[$€£¥,\s]', '', val_str)
-
-            # Handle parentheses as negative (accounting format)
-            if '(' in val_str and ')' in val_str:
-                val_str = '-' + val_str.replace('(', '').replace(')', '')
-
-            # Convert to float
-            try:
-                return float(val_str)
-            except ValueError:
-                return None
+        # Each distinct value is parsed once, in one vectorized to_datetime call
+        codes, uniques = pd.factorize(col)
+        if not len(uniques):
+            return col.apply(_parse_period)
+
+        uniques = pd.Series(np.asarray(uniques, dtype=object))
+        try:
+            periods = pd.to_datetime(uniques, errors='coerce', format='mixed').dt.strftime('%Y-%m')
+            periods = periods.astype(object).where(periods.notna(), None)
+        except (ValueError, TypeError, OverflowError, AttributeError):
+            # e.g. mixed timezones - parse value by value
+            periods = pd.Series([None] * len(uniques), dtype=object)
+
+        # Text formats pandas can't parse ("Jan-2024", "FY 2024-03")
+        missing = periods.isna().to_numpy()
+        if missing.any():
+            periods[missing] = [_parse_period(value) for value in uniques[missing]]
+
+        result = periods.to_numpy()[codes]
+        result[codes < 0] = None
+        return pd.Series(result, index=col.index, dtype=object)
+
+    def _clean_numeric_columns(self, columns: List):
+        """Clean all value columns, parsing each distinct text amount once across them"""
+        text_columns = [col for col in columns if self.df[col].dtype.kind not in 'biuf']
+        amounts = None
+        if text_columns:
+            cells = self.df[text_columns].to_numpy(dtype=object).ravel()
+            is_text = pd.notna(cells) & ~_is_number(cells).astype(bool)
+            amounts = {value: _parse_amount(value) for value in pd.unique(cells[is_text])}
+
+        for col in columns:
+            self.df[col] = self._clean_numeric_column(self.df[col], amounts)
+
+    def _clean_numeric_column(self, col: pd.Series, amounts: Optional[Dict] = None) -> pd.Series:
+        """
+        Clean numeric values (remove currency symbols, handle negatives)
 
-        return col.apply(clean_value)
+        Args:
+            col: Column to clean
+            amounts: Already parsed text amounts, keyed by cell value
+        """
+        if col.empty:
+            return col.copy()
 
-    def _detect_subtotal_rows(self, account_col: str) -> List[int]:
+        if col.dtype.kind in 'biuf':
+            # Already numbers
+            values = col.to_numpy(dtype=float)
+            parsed = ~np.isnan(values)
+        else:
+            cells = col.to_numpy(dtype=object)
+            values = np.full(len(cells), np.nan)
+            present = pd.notna(cells)
+            parsed = present & _is_number(cells).astype(bool)
+            values[parsed] = cells[parsed].astype(float)
+
+            # Text cells: clean each distinct value once and broadcast back
+            is_text = present & ~parsed
+            if is_text.any():
+                codes, uniques = pd.factorize(cells[is_text])
+                known = amounts or {}
+                parsed_amounts = [
+                    known[value] if value in known else _parse_amount(value)
+                    for value in uniques
+                ]
+                values[is_text] = np.array([np.nan if a is None else a for a in parsed_amounts], dtype=float)[codes]
+                parsed[is_text] = np.array([a is not None for a in parsed_amounts], dtype=bool)[codes]
+
+        if not parsed.any():
+            # Nothing parsed: an all-None column, as per-cell cleaning produced
+            return pd.Series([None] * len(col), index=col.index, name=col.name, dtype=object)
+        return pd.Series(values, index=col.index, name=col.name)
+
+    def _account_names(self, account_col: str) -> pd.Series:
+        """Account column as text ('nan' for blanks), Arrow-backed when pyarrow is installed"""
+        account_names = self.df[account_col].astype(str)
+        if ARROW_STRINGS:
+            account_names = account_names.astype('string[pyarrow]')
+        return account_names
+
+    def _detect_subtotal_rows(self, account_names: pd.Series) -> List[int]:
         """Identify rows that are subtotals based on keywords"""
-        subtotal_rows = []
+        # Pattern text rather than the compiled regex so Arrow strings match natively
+        is_subtotal = account_names.str.lower().str.contains(_SUBTOTAL_RE.pattern)
+        return self.df.index[is_subtotal.to_numpy(dtype=bool)].tolist()
 
-        for idx, row in self.df.iterrows():
-            account_name = str(row[account_col]).lower()
-
-            # Check for subtotal keywords
-            if any(keyword in account_name for keyword in self.SUBTOTAL_KEYWORDS):
-                subtotal_rows.append(idx)
-
-        return subtotal_rows
-
-    def _identify_sections(self, account_col: str) -> Dict[str, List[int]]:
+    def _identify_sections(self, account_names: pd.Series) -> Dict[str, List[int]]:
         """Identify major P&L sections using pattern matching"""
-        sections = {key: [] for key in self.SECTION_PATTERNS.keys()}
-
-        for idx, row in self.df.iterrows():
-            account_name = str(row[account_col]).lower()
+        # Lower-cased once; the patterns carry capture groups and lookaheads, so
+        # they're applied with re directly rather than through str.contains
+        rows = list(zip(self.df.index.tolist(), account_names.str.lower().tolist()))
+        return {
+            section: [idx for idx, account_name in rows if pattern.search(account_name)]
+            for section, pattern in _SECTION_RES.items()
+        }
 
-            for section, pattern in self.SECTION_PATTERNS.items():
-                if re.search(pattern, account_name, re.IGNORECASE):
-                    sections[section].append(idx)
+    def _detect_hierarchy(self, account_names: pd.Series) -> List[Tuple[int, int, str]]:
+        """Detect parent-child relationships from indentation"""
+        # Leading spaces -> hierarchy level (2 spaces = 1 level)
+        indent_levels = account_names.str.len() - account_names.str.lstrip().str.len()
+        levels = list(map(int, (indent_levels // 2).tolist()))
 
-        return sections
+        return list(zip(map(int, self.df.index), levels, account_names.str.strip().tolist()))
 
-    def _detect_hierarchy(self, account_col: str) -> List[Tuple[int, int, str]]:
-        """Detect parent-child relationships from indentation"""
-        hierarchy = []
+    def _calculate_mom_changes(self, value_cols: List[str]):
+        """Calculate month-on-month percentage and dollar changes"""
+        if len(value_cols) < 2:
+            return
 
-        for idx, row in self.df.iterrows():
-            account_name = str(row[account_col])
+        values = self.df[value_cols].to_numpy()
+        if values.dtype.kind not in 'iuf':
+            values = values.astype(np.float64)
 
-            # Count leading spaces
-            indent_level = len(account_name) - len(account_name.lstrip())
-            clean_name = account_name.strip()
+        previous = values[:, :-1]
+        changes = values[:, 1:] - previous
+        # A zero previous month has no percentage change (NaN, never inf)
+        pcts = np.full(changes.shape, np.nan)
+        np.divide(changes, np.abs(previous), out=pcts, where=previous != 0)
+        pcts *= 100
 
-            # Convert spaces to hierarchy level
-            level = indent_level // 2  # 2 spaces = 1 level
+        # Interleave <col>_mom_change / <col>_mom_pct as the columns are added
+        derived = {}
+        for i, col in enumerate(value_cols[1:]):
+            derived[f'{col}_mom_change'] = changes[:, i]
+            derived[f'{col}_mom_pct'] = pcts[:, i]
 
-            hierarchy.append((int(idx), level, clean_name))
+        self.df = pd.concat([self.df, pd.DataFrame(derived, index=self.df.index)], axis=1)
 
-        return hierarchy
 
-    def _calculate_mom_changes(self, value_cols: List[str]):
-        """Calculate month-on-month percentage and dollar changes"""
-        for col_idx, col in enumerate(value_cols):
-            if col_idx > 0:
-                prev_col = value_cols[col_idx - 1]
+# Any PLParser.SUBTOTAL_KEYWORDS substring, as one alternation
+_SUBTOTAL_RE = re.compile('|'.join(map(re.escape, PLParser.SUBTOTAL_KEYWORDS)))
 
-                # Dollar change
-                self.df[f'{col}_mom_change'] = self.df[col] - self.df[prev_col]
+# Any PLParser.HEADER_KEYWORDS substring, as one alternation
+_HEADER_RE = re.compile('|'.join(map(re.escape, PLParser.HEADER_KEYWORDS)))
 
-                # Percentage change
-                self.df[f'{col}_mom_pct'] = (
-                    (self.df[col] - self.df[prev_col]) / self.df[prev_col].abs() * 100
-                ).replace([float('inf'), float('-inf')], None)
+# PLParser.SECTION_PATTERNS, compiled once
+_SECTION_RES = {
+    section: re.compile(pattern, re.IGNORECASE)
+    for section, pattern in PLParser.SECTION_PATTERNS.items()
+}
@@ -0,0 +1,148 @@
+"""
+Semantic Answer Cache
+Serves previously generated answers for identical or near-identical
+questions about the same document(s) without another LLM round trip.
+"""
+
+import re
+import threading
+import time
+import weakref
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+EmbedFn = Callable[[List[str]], Awaitable[Optional[np.ndarray]]]
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# Tokens that change what a question asks for while barely moving its embedding
+# ("March 2024" vs "April 2024"); a semantic match needs the same set of them
+_SPECIFIC_TOKEN_RE = re.compile(
+    r'\d+(?:[.,]\d+)*'
+    r'|\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\b'
+    r'|\b(?:q[1-4]|h[12]|fy\d*)\b'
+)
+
+# Every cache instance, so document changes can evict from all of them
+_caches: "weakref.WeakSet[SemanticAnswerCache]" = weakref.WeakSet()
+
+
+def document_cache_key(document) -> str:
+    """Scope key for a document's answers: its content hash, so a reused id can't match"""
+    return document.content_hash or f"document:{document.id}"
+
+
+def invalidate_document(document_key: Any):
+    """
+    Drop cached answers that may depend on a document
+
+    Removes the document's own scope and every multi-document scope (a frozenset
+    of document keys) from all caches; call on upload and delete.
+    """
+    for cache in list(_caches):
+        cache.invalidate(document_key)
+
+
+class SemanticAnswerCache:
+    """Per-scope answer cache matched on exact text first, then embedding similarity"""
+
+    def __init__(
+        self,
+        embed_fn: Optional[EmbedFn] = None,
+        similarity_threshold: float = 0.95,
+        ttl_seconds: int = 3600,
+        max_entries_per_scope: int = 256
+    ):
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries_per_scope = max_entries_per_scope
+        # scope -> list of (stored_at, normalized_question, specific tokens, unit embedding or None, answer)
+        self._entries: Dict[Any, List[Tuple[float, str, FrozenSet[str], Optional[np.ndarray], Any]]] = {}
+        self._lock = threading.Lock()
+        _caches.add(self)
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        """Lower-case and collapse whitespace so trivial variations hit exactly"""
+        return _WHITESPACE_RE.sub(' ', question.strip().lower())
+
+    @staticmethod
+    def specific_tokens(normalized_question: str) -> FrozenSet[str]:
+        """Numbers, months and period names in a normalized question"""
+        return frozenset(_SPECIFIC_TOKEN_RE.findall(normalized_question))
+
+    async def lookup(self, scope: Any, question: str) -> Tuple[Optional[Any], Optional[np.ndarray]]:
+        """
+        Find a cached answer for the question
+
+        Args:
+            scope: Cache partition (a document's content hash, or a frozenset of
+                them for multi-document questions)
+            question: The user's question
+
+        Returns:
+            (cached answer or None, question embedding to pass to store())
+        """
+        normalized = self.normalize(question)
+        entries = self._live_entries(scope)
+
+        for _, cached_question, _, _, answer in entries:
+            if cached_question == normalized:
+                return answer, None
+
+        embedding = await self._embed(normalized)
+        if embedding is None:
+            return None, None
+
+        # Near matches only count when they ask about the same numbers and periods
+        tokens = self.specific_tokens(normalized)
+        candidates = [
+            (vector, answer)
+            for _, _, cached_tokens, vector, answer in entries
+            if vector is not None and cached_tokens == tokens
+        ]
+        if candidates:
+            matrix = np.vstack([vector for vector, _ in candidates])
+            scores = matrix @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] >= self.similarity_threshold:
+                return candidates[best][1], embedding
+
+        return None, embedding
+
+    def store(self, scope: Any, question: str, answer: Any, embedding: Optional[np.ndarray] = None):
+        """Cache an answer for the question in the given scope"""
+        normalized = self.normalize(question)
+        entry = (time.monotonic(), normalized, self.specific_tokens(normalized), embedding, answer)
+        with self._lock:
+            entries = self._entries.setdefault(scope, [])
+            entries.append(entry)
+            if len(entries) > self.max_entries_per_scope:
+                del entries[:len(entries) - self.max_entries_per_scope]
+
+    def invalidate(self, document_key: Any):
+        """Drop the document's scope and all multi-document scopes"""
+        with self._lock:
+            for scope in list(self._entries):
+                if scope == document_key or isinstance(scope, frozenset):
+                    del self._entries[scope]
+
+    def _live_entries(self, scope: Any) -> List[Tuple[float, str, FrozenSet[str], Optional[np.ndarray], Any]]:
+        cutoff = time.monotonic() - self.ttl_seconds
+        with self._lock:
+            entries = [entry for entry in self._entries.get(scope, []) if entry[0] >= cutoff]
+            if entries:
+                self._entries[scope] = entries
+            else:
+                self._entries.pop(scope, None)
+            return list(entries)
+
+    async def _embed(self, text: str) -> Optional[np.ndarray]:
+        if self.embed_fn is None:
+            return None
+        vectors = await self.embed_fn([text])
+        if vectors is None or len(vectors) == 0:
+            return None
+        return vectors[0]
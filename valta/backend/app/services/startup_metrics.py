@@ -9,12 +9,104 @@ Calculates startup-specific financial metrics from P&L data:
 - Expense drivers and anomalies
 """
 
+import re
 import pandas as pd
 import numpy as np
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 
+REVENUE_KEYWORDS = [
+    'revenue', 'sales', 'income', 'subscription', 'recurring',
+    'arr', 'mrr', 'services revenue'
+]
+
+# Expense-related terms that disqualify an otherwise revenue-looking account
+REVENUE_EXCLUDE_KEYWORDS = ['expense', 'cost', 'cogs']
+
+EXPENSE_KEYWORDS = [
+    'expense', 'cost', 'salaries', 'wages', 'payroll', 'marketing',
+    'advertising', 'rent', 'software', 'consulting', 'fees',
+    'depreciation', 'amortization', 'interest', 'tax', 'utilities',
+    'travel', 'insurance', 'benefits', 'hosting', 'cloud', 'aws',
+    'engineering', 'r&d', 'research', 'development'
+]
+
+INSIGHT_PRIORITIES = ('high', 'medium', 'low')
+
+
+def _keyword_re(keywords: List[str]) -> re.Pattern:
+    return re.compile('|'.join(re.escape(kw) for kw in keywords))
+
+
+_REVENUE_RE = _keyword_re(REVENUE_KEYWORDS)
+_REVENUE_EXCLUDE_RE = _keyword_re(REVENUE_EXCLUDE_KEYWORDS)
+_EXPENSE_RE = _keyword_re(EXPENSE_KEYWORDS)
+
+
+def calculate_runway(cash_balance: float, avg_net_burn: float) -> Dict:
+    """
+    Calculate runway metrics
+
+    Args:
+        cash_balance: Current cash on hand
+        avg_net_burn: Average monthly net burn rate
+
+    Returns:
+        Dict with runway calculations
+    """
+    runway_metrics = {}
+
+    if avg_net_burn <= 0:
+        # Company is profitable or break-even
+        runway_metrics['months_remaining'] = float('inf')
+        runway_metrics['zero_cash_date'] = None
+        runway_metrics['status'] = 'profitable'
+        runway_metrics['urgency'] = 'none'
+    else:
+        months_remaining = cash_balance / avg_net_burn
+        runway_metrics['months_remaining'] = round(months_remaining, 1)
+
+        # Estimate zero cash date
+        today = datetime.now()
+        zero_date = today + relativedelta(months=int(months_remaining))
+        runway_metrics['zero_cash_date'] = zero_date.strftime('%Y-%m-%d')
+
+        # Classify urgency
+        if months_remaining < 6:
+            runway_metrics['status'] = 'critical'
+            runway_metrics['urgency'] = 'high'
+        elif months_remaining < 12:
+            runway_metrics['status'] = 'concerning'
+            runway_metrics['urgency'] = 'medium'
+        elif months_remaining < 18:
+            runway_metrics['status'] = 'comfortable'
+            runway_metrics['urgency'] = 'low'
+        else:
+            runway_metrics['status'] = 'strong'
+            runway_metrics['urgency'] = 'none'
+
+    runway_metrics['cash_balance'] = cash_balance
+
+    return runway_metrics
+
+
+def period_growth_rates(values: np.ndarray) -> np.ndarray:
+    """
+    Period-over-period growth in percent for a float64 series
+
+    A zero previous value yields 0 growth rather than inf/nan.
+    """
+    previous = values[:-1]
+    growth = np.zeros(len(previous), dtype=np.float64)
+    np.divide(values[1:] - previous, np.abs(previous), out=growth, where=previous != 0)
+    return growth * 100
+
+
+def _top_records(frame: pd.DataFrame, column: str, n: int = 5) -> List[Dict]:
+    """Largest n rows by column as records; ties keep statement order"""
+    return frame.sort_values(column, ascending=False, kind='stable').head(n).to_dict('records')
+
 
 class StartupMetricsCalculator:
     """Calculate startup financial metrics from parsed P&L data"""
@@ -44,23 +136,25 @@ class StartupMetricsCalculator:
         """
         metrics = {}
 
-        # Revenue and expense aggregates
-        aggregates = self._calculate_aggregates()
+        # Revenue and expense aggregates; the math below runs on the per-period
+        # arrays, the dicts are the serializable view
+        revenues, expenses = self._period_totals()
+        aggregates = self._calculate_aggregates(revenues, expenses)
         metrics['aggregates'] = aggregates
 
         # Burn rate calculations
-        burn = self._calculate_burn_rate(aggregates)
+        burn = self._calculate_burn_rate(aggregates, revenues, expenses)
         metrics['burn_rate'] = burn
 
         # Runway calculations (if cash balance provided)
         if cash_balance is not None and burn.get('net_burn_avg'):
-            runway = self._calculate_runway(cash_balance, burn['net_burn_avg'])
+            runway = calculate_runway(cash_balance, burn['net_burn_avg'])
             metrics['runway'] = runway
         else:
             metrics['runway'] = None
 
         # Growth metrics
-        growth = self._calculate_growth_metrics(aggregates)
+        growth = self._calculate_growth_metrics(aggregates, revenues)
         metrics['growth'] = growth
 
         # Expense drivers
@@ -69,7 +163,7 @@ class StartupMetricsCalculator:
 
         # Cash efficiency (if we have revenue)
         if aggregates.get('revenue_by_period'):
-            efficiency = self._calculate_cash_efficiency(aggregates, burn)
+            efficiency = self._calculate_cash_efficiency(revenues, expenses, burn)
             metrics['efficiency'] = efficiency
         else:
             metrics['efficiency'] = None
@@ -80,101 +174,58 @@ class StartupMetricsCalculator:
 
         return metrics
 
-    def _calculate_aggregates(self) -> Dict:
-        """Calculate revenue and expense totals for each period"""
+    def _period_totals(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Revenue and expense totals per value column, as float64 arrays"""
         if not self.value_columns:
-            return {}
+            return np.empty(0), np.empty(0)
 
-        aggregates = {
-            'revenue_by_period': {},
-            'expenses_by_period': {},
-            'net_income_by_period': {},
-            'periods': sorted(self.value_columns)
-        }
+        # Classify each account once, then sum whole columns per class
+        accounts = self.df[self.account_column].astype(str).str.lower()
+        revenue_mask = accounts.str.contains(_REVENUE_RE, na=False) & ~accounts.str.contains(_REVENUE_EXCLUDE_RE, na=False)
+        expense_mask = ~revenue_mask & accounts.str.contains(_EXPENSE_RE, na=False)
 
-        for period in self.value_columns:
-            revenue = 0
-            expenses = 0
+        values = self.df[self.value_columns].apply(pd.to_numeric, errors='coerce').abs()
+        revenues = values.loc[revenue_mask].sum().to_numpy(dtype=np.float64)
+        expenses = values.loc[expense_mask].sum().to_numpy(dtype=np.float64)
+        return revenues, expenses
 
-            for idx, row in self.df.iterrows():
-                account = str(row[self.account_column]).lower()
-                value = row[period]
-
-                if pd.isna(value):
-                    continue
-
-                value = float(value)
-
-                # Classify as revenue or expense
-                if self._is_revenue_account(account):
-                    revenue += abs(value)
-                elif self._is_expense_account(account):
-                    expenses += abs(value)
-
-            aggregates['revenue_by_period'][period] = revenue
-            aggregates['expenses_by_period'][period] = expenses
-            aggregates['net_income_by_period'][period] = revenue - expenses
-
-        return aggregates
-
-    def _is_revenue_account(self, account: str) -> bool:
-        """Check if account name indicates revenue"""
-        revenue_keywords = [
-            'revenue', 'sales', 'income', 'subscription', 'recurring',
-            'arr', 'mrr', 'services revenue'
-        ]
-
-        # Exclude expense-related terms
-        exclude_keywords = ['expense', 'cost', 'cogs']
-
-        account_lower = account.lower()
-        has_revenue = any(kw in account_lower for kw in revenue_keywords)
-        has_exclude = any(kw in account_lower for kw in exclude_keywords)
-
-        return has_revenue and not has_exclude
-
-    def _is_expense_account(self, account: str) -> bool:
-        """Check if account name indicates expense"""
-        expense_keywords = [
-            'expense', 'cost', 'salaries', 'wages', 'payroll', 'marketing',
-            'advertising', 'rent', 'software', 'consulting', 'fees',
-            'depreciation', 'amortization', 'interest', 'tax', 'utilities',
-            'travel', 'insurance', 'benefits', 'hosting', 'cloud', 'aws',
-            'engineering', 'r&d', 'research', 'development'
-        ]
+    def _calculate_aggregates(self, revenues: np.ndarray, expenses: np.ndarray) -> Dict:
+        """Revenue, expense and net income totals keyed by period"""
+        if not self.value_columns:
+            return {}
 
-        account_lower = account.lower()
-        return any(kw in account_lower for kw in expense_keywords)
+        return {
+            'revenue_by_period': dict(zip(self.value_columns, revenues.tolist())),
+            'expenses_by_period': dict(zip(self.value_columns, expenses.tolist())),
+            'net_income_by_period': dict(zip(self.value_columns, (revenues - expenses).tolist())),
+            'periods': sorted(self.value_columns)
+        }
 
-    def _calculate_burn_rate(self, aggregates: Dict) -> Dict:
+    def _calculate_burn_rate(self, aggregates: Dict, revenues: np.ndarray, expenses: np.ndarray) -> Dict:
         """Calculate burn rate metrics"""
         burn_metrics = {}
 
-        expenses = list(aggregates.get('expenses_by_period', {}).values())
-        revenues = list(aggregates.get('revenue_by_period', {}).values())
-        net_income = list(aggregates.get('net_income_by_period', {}).values())
-
-        if not expenses:
+        if not len(expenses):
             return burn_metrics
 
         # Gross burn (total expenses)
         burn_metrics['gross_burn_by_period'] = aggregates['expenses_by_period']
-        burn_metrics['gross_burn_avg'] = np.mean(expenses) if expenses else 0
-        burn_metrics['gross_burn_latest'] = expenses[-1] if expenses else 0
+        burn_metrics['gross_burn_avg'] = expenses.mean()
+        burn_metrics['gross_burn_latest'] = float(expenses[-1])
 
         # Net burn (expenses - revenue)
-        net_burns = [expenses[i] - revenues[i] for i in range(len(expenses))]
+        net_burns = expenses - revenues
         burn_metrics['net_burn_by_period'] = dict(zip(
             aggregates.get('periods', []),
-            net_burns
+            net_burns.tolist()
         ))
-        burn_metrics['net_burn_avg'] = np.mean(net_burns) if net_burns else 0
-        burn_metrics['net_burn_latest'] = net_burns[-1] if net_burns else 0
+        burn_metrics['net_burn_avg'] = net_burns.mean()
+        burn_metrics['net_burn_latest'] = float(net_burns[-1])
 
         # Burn rate trend
         if len(net_burns) >= 3:
-            recent_avg = np.mean(net_burns[-3:])
-            earlier_avg = np.mean(net_burns[:-3]) if len(net_burns) > 3 else net_burns[0]
+            recent_avg = net_burns[-3:].mean()
+            earlier_avg = net_burns[:-3].mean() if len(net_burns) > 3 else net_burns[0]
 
             if earlier_avg != 0:
                 burn_metrics['burn_rate_trend'] = ((recent_avg - earlier_avg) / abs(earlier_avg)) * 100
@@ -190,74 +241,21 @@ class StartupMetricsCalculator:
 
         return burn_metrics
 
-    def _calculate_runway(self, cash_balance: float, avg_net_burn: float) -> Dict:
-        """
-        Calculate runway metrics
-
-        Args:
-            cash_balance: Current cash on hand
-            avg_net_burn: Average monthly net burn rate
-
-        Returns:
-            Dict with runway calculations
-        """
-        runway_metrics = {}
-
-        if avg_net_burn <= 0:
-            # Company is profitable or break-even
-            runway_metrics['months_remaining'] = float('inf')
-            runway_metrics['zero_cash_date'] = None
-            runway_metrics['status'] = 'profitable'
-            runway_metrics['urgency'] = 'none'
-        else:
-            months_remaining = cash_balance / avg_net_burn
-            runway_metrics['months_remaining'] = round(months_remaining, 1)
-
-            # Estimate zero cash date
-            today = datetime.now()
-            zero_date = today + relativedelta(months=int(months_remaining))
-            runway_metrics['zero_cash_date'] = zero_date.strftime('%Y-%m-%d')
-
-            # Classify urgency
-            if months_remaining < 6:
-                runway_metrics['status'] = 'critical'
-                runway_metrics['urgency'] = 'high'
-            elif months_remaining < 12:
-                runway_metrics['status'] = 'concerning'
-                runway_metrics['urgency'] = 'medium'
-            elif months_remaining < 18:
-                runway_metrics['status'] = 'comfortable'
-                runway_metrics['urgency'] = 'low'
-            else:
-                runway_metrics['status'] = 'strong'
-                runway_metrics['urgency'] = 'none'
-
-        runway_metrics['cash_balance'] = cash_balance
-
-        return runway_metrics
-
-    def _calculate_growth_metrics(self, aggregates: Dict) -> Dict:
+    def _calculate_growth_metrics(self, aggregates: Dict, revenues: np.ndarray) -> Dict:
         """Calculate growth rates"""
         growth_metrics = {}
 
-        revenues = list(aggregates.get('revenue_by_period', {}).values())
         periods = aggregates.get('periods', [])
 
         if len(revenues) < 2:
             return growth_metrics
 
         # Month-over-month growth rates
-        mom_growth = []
-        for i in range(1, len(revenues)):
-            if revenues[i-1] != 0:
-                growth_pct = ((revenues[i] - revenues[i-1]) / abs(revenues[i-1])) * 100
-                mom_growth.append(growth_pct)
-            else:
-                mom_growth.append(0)
+        mom_growth = period_growth_rates(revenues)
 
-        growth_metrics['mom_growth_by_period'] = dict(zip(periods[1:], mom_growth))
-        growth_metrics['mom_growth_avg'] = np.mean(mom_growth) if mom_growth else 0
-        growth_metrics['mom_growth_latest'] = mom_growth[-1] if mom_growth else 0
+        growth_metrics['mom_growth_by_period'] = dict(zip(periods[1:], mom_growth.tolist()))
+        growth_metrics['mom_growth_avg'] = mom_growth.mean()
+        growth_metrics['mom_growth_latest'] = float(mom_growth[-1])
 
         # Overall growth (first to last period)
         if revenues[0] != 0:
@@ -276,7 +274,7 @@ class StartupMetricsCalculator:
 
         # Growth trend
         if len(mom_growth) >= 3:
-            recent_growth = np.mean(mom_growth[-3:])
+            recent_growth = mom_growth[-3:].mean()
             growth_metrics['growth_trend'] = 'accelerating' if recent_growth > growth_metrics['mom_growth_avg'] else 'decelerating'
         else:
             growth_metrics['growth_trend'] = 'stable'
@@ -298,63 +296,42 @@ class StartupMetricsCalculator:
         latest_period = self.value_columns[-1]
         prev_period = self.value_columns[-2]
 
-        expense_data = []
-
-        for idx, row in self.df.iterrows():
-            account = str(row[self.account_column])
-
-            if not self._is_expense_account(account.lower()):
-                continue
+        accounts = self.df[self.account_column].astype(str)
+        expense_mask = accounts.str.lower().str.contains(_EXPENSE_RE, na=False)
 
-            latest_val = row[latest_period]
-            prev_val = row[prev_period]
+        amounts = self.df.loc[expense_mask, [latest_period, prev_period]].apply(pd.to_numeric, errors='coerce')
+        latest = amounts[latest_period].fillna(0).abs().to_numpy(dtype=np.float64)
+        previous = amounts[prev_period].fillna(0).abs().to_numpy(dtype=np.float64)
 
-            if pd.isna(latest_val):
-                latest_val = 0
-            if pd.isna(prev_val):
-                prev_val = 0
+        change = latest - previous
+        change_pct = np.zeros(len(change), dtype=np.float64)
+        np.divide(change, previous, out=change_pct, where=previous != 0)
+        change_pct *= 100
 
-            latest_val = abs(float(latest_val))
-            prev_val = abs(float(prev_val))
+        expense_data = pd.DataFrame({
+            'account': accounts[expense_mask].to_numpy(),
+            'latest_amount': latest,
+            'previous_amount': previous,
+            'change_dollar': change,
+            'change_percent': change_pct
+        })
 
-            change = latest_val - prev_val
-            change_pct = ((change) / prev_val * 100) if prev_val != 0 else 0
+        # Top expenses by latest amount
+        drivers['top_expenses'] = _top_records(expense_data, 'latest_amount')
 
-            expense_data.append({
-                'account': account,
-                'latest_amount': latest_val,
-                'previous_amount': prev_val,
-                'change_dollar': change,
-                'change_percent': change_pct
-            })
+        # Fastest growing by percentage change
+        drivers['fastest_growing'] = _top_records(expense_data[expense_data['change_percent'] > 5], 'change_percent')
 
-        # Sort by latest amount for top expenses
-        top_by_amount = sorted(expense_data, key=lambda x: x['latest_amount'], reverse=True)[:5]
-        drivers['top_expenses'] = top_by_amount
-
-        # Sort by percentage change for fastest growing
-        fastest = sorted(
-            [e for e in expense_data if e['change_percent'] > 5],
-            key=lambda x: x['change_percent'],
-            reverse=True
-        )[:5]
-        drivers['fastest_growing'] = fastest
-
-        # Sort by dollar change for largest increases
-        largest = sorted(
-            [e for e in expense_data if e['change_dollar'] > 0],
-            key=lambda x: x['change_dollar'],
-            reverse=True
-        )[:5]
-        drivers['largest_increases'] = largest
+        # Largest increases by dollar change
+        drivers['largest_increases'] = _top_records(expense_data[expense_data['change_dollar'] > 0], 'change_dollar')
 
         return drivers
 
-    def _calculate_cash_efficiency(self, aggregates: Dict, burn: Dict) -> Dict:
+    def _calculate_cash_efficiency(self, revenues: np.ndarray, expenses: np.ndarray, burn: Dict) -> Dict:
         """Calculate cash efficiency metrics"""
         efficiency = {}
 
-        latest_revenue = list(aggregates.get('revenue_by_period', {}).values())[-1] if aggregates.get('revenue_by_period') else 0
+        latest_revenue = float(revenues[-1]) if len(revenues) else 0
         avg_burn = burn.get('net_burn_avg', 0)
 
         if avg_burn > 0:
@@ -368,7 +345,7 @@ class StartupMetricsCalculator:
                 efficiency['burn_multiple'] = None
 
         # Revenue efficiency (revenue per dollar of expense)
-        latest_expenses = list(aggregates.get('expenses_by_period', {}).values())[-1] if aggregates.get('expenses_by_period') else 0
+        latest_expenses = float(expenses[-1]) if len(expenses) else 0
         if latest_expenses > 0:
             efficiency['revenue_per_dollar_spent'] = round(latest_revenue / latest_expenses, 2)
         else:
@@ -464,8 +441,11 @@ class StartupMetricsCalculator:
                 'priority': 'medium'
             })
 
-        # Sort by priority
-        priority_order = {'high': 0, 'medium': 1, 'low': 2}
-        insights.sort(key=lambda x: priority_order.get(x['priority'], 3))
-
-        return insights
+        # Order by priority; insights are only ever tagged with INSIGHT_PRIORITIES,
+        # and grouping keeps the stable order a sort on rank would give
+        return [
+            insight
+            for priority in INSIGHT_PRIORITIES
+            for insight in insights
+            if insight['priority'] == priority
+        ]
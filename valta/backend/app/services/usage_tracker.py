@@ -3,21 +3,34 @@ API Usage Tracking Service
 Tracks token usage and costs for AI API calls (Anthropic Claude and OpenAI GPT)
 """
 
-import json
+import atexit
 import os
+import threading
+import time
+from collections import deque
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 from pathlib import Path
+from types import MappingProxyType
 import logging
 
+import orjson
+
 logger = logging.getLogger(__name__)
 
+# Pricing fallback for models missing from UsageTracker.PRICING
+_ZERO_PRICING = MappingProxyType({"input": 0, "output": 0})
+
 
 class UsageTracker:
     """Tracks API usage and costs for AI services"""
 
     # Pricing per 1M tokens (as of 2025)
     PRICING = {
+        "claude-sonnet-4-20250514": {
+            "input": 3.00,
+            "output": 15.00
+        },
         "claude-3-7-sonnet-20250219": {
             "input": 3.00,   # $3 per 1M input tokens
             "output": 15.00  # $15 per 1M output tokens
@@ -40,17 +53,79 @@ class UsageTracker:
         }
     }
 
-    def __init__(self, storage_path: str = "usage_data.json"):
-        """Initialize the usage tracker"""
+    # Anthropic prompt caching: cache reads bill at 10% and cache writes at 125%
+    # of the input price
+    CACHE_READ_PRICE_FACTOR = 0.1
+    CACHE_WRITE_PRICE_FACTOR = 1.25
+
+    # Most recent request records kept in the history
+    REQUEST_HISTORY_SIZE = 100
+
+    def __init__(
+        self,
+        storage_path: str = "usage_data.json",
+        flush_interval: float = 2.0,
+        max_pending: int = 50,
+        durable: bool = False,
+        event_log: bool = False,
+        rollup_interval: float = 300.0
+    ):
+        """
+        Initialize the usage tracker
+
+        Args:
+            storage_path: JSON file the usage data persists to
+            flush_interval: Seconds between background writes of tracked requests
+            max_pending: Unwritten requests that trigger an immediate write
+            durable: Sync each write to disk (O_DSYNC) before it replaces the file
+            event_log: Append each request to a JSONL log instead of rewriting the
+                JSON file per flush; the JSON file is rolled up every rollup_interval
+            rollup_interval: Seconds between rollups of the event log (event_log only)
+        """
         self.storage_path = Path(storage_path)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.durable = durable
+        self.rollup_interval = rollup_interval
         self.usage_data = self._load_usage_data()
 
+        # Running cost of the current calendar month, so stats don't re-add the day buckets
+        self._month_key: Optional[str] = None
+        self._month_cost_total = 0.0
+
+        # track_request only mutates memory; a daemon thread writes the file
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pending = 0
+        self._wake = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+
+        # Optional append-only event log; events past the JSON file's event_seq
+        # are replayed on startup, so a crash between rollups loses nothing
+        # that reached the log
+        self.event_log_path = self.storage_path.with_suffix('.events.jsonl')
+        self._event_log = None
+        self._event_seq = self.usage_data.get("event_seq", 0)
+        self._last_rollup = time.monotonic()
+        if event_log:
+            self._replay_event_log()
+            self._event_log = open(self.event_log_path, 'ab', buffering=65536)
+            if self._event_log.tell():
+                with open(self.event_log_path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        # Start after a torn last line rather than on it
+                        self._event_log.write(b'\n')
+
+        atexit.register(self.flush)
+
     def _load_usage_data(self) -> Dict:
         """Load usage data from file"""
         if self.storage_path.exists():
             try:
-                with open(self.storage_path, 'r') as f:
-                    return json.load(f)
+                data = orjson.loads(self.storage_path.read_bytes())
+                data["requests"] = deque(data.get("requests", []), maxlen=self.REQUEST_HISTORY_SIZE)
+                return data
             except Exception as e:
                 logger.error(f"Error loading usage data: {e}")
                 return self._create_empty_data()
@@ -66,119 +141,223 @@ class UsageTracker:
             "monthly_budget": 10.0,  # Default $10/month budget
             "by_model": {},
             "by_date": {},
-            "requests": []
+            "requests": deque(maxlen=self.REQUEST_HISTORY_SIZE)
         }
 
+    @staticmethod
+    def _empty_bucket() -> Dict:
+        """Zeroed per-model / per-day counters"""
+        return {
+            "requests": 0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "cost": 0.0
+        }
+
+    def _replay_event_log(self):
+        """Apply logged requests the JSON file doesn't include yet"""
+        if not self.event_log_path.exists():
+            return
+
+        replayed = 0
+        with open(self.event_log_path, 'rb') as f:
+            for line in f:
+                try:
+                    event = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    # Torn last line from a crash mid-append
+                    logger.warning("Skipping unreadable usage event log line")
+                    continue
+                if event["seq"] > self._event_seq:
+                    self._apply_request(event["request"])
+                    self._event_seq = event["seq"]
+                    replayed += 1
+
+        if replayed:
+            logger.info(f"Replayed {replayed} usage events from {self.event_log_path}")
+            self._pending += replayed
+            self._save_usage_data()
+
     def _save_usage_data(self):
-        """Save usage data to file"""
-        try:
-            with open(self.storage_path, 'w') as f:
-                json.dump(self.usage_data, f, indent=2)
-        except Exception as e:
-            logger.error(f"Error saving usage data: {e}")
+        """
+        Save usage data to file (temp file + rename, so readers never see a partial write)
+
+        Usage data is telemetry: without durable=True the write isn't synced, so a
+        crash can lose the last few seconds of counts but never corrupts the file.
+        """
+        with self._write_lock:
+            with self._lock:
+                if self._event_log is not None or self._event_seq:
+                    self.usage_data["event_seq"] = self._event_seq
+                data = orjson.dumps(self.usage_data, default=list, option=orjson.OPT_APPEND_NEWLINE)
+                pending = self._pending
+                self._pending = 0
+                saved_seq = self._event_seq
+
+            tmp_path = self.storage_path.with_name(self.storage_path.name + '.tmp')
+            flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+            if self.durable:
+                flags |= getattr(os, 'O_DSYNC', 0) or getattr(os, 'O_SYNC', 0)
+            try:
+                fd = os.open(tmp_path, flags, 0o644)
+                try:
+                    view = memoryview(data)
+                    while view:
+                        view = view[os.write(fd, view):]
+                finally:
+                    os.close(fd)
+                os.replace(tmp_path, self.storage_path)
+            except Exception as e:
+                logger.error(f"Error saving usage data: {e}")
+                with self._lock:
+                    self._pending += pending
+                return
+
+            self._last_rollup = time.monotonic()
+            with self._lock:
+                # Everything logged is now in the JSON file; events appended
+                # since the snapshot keep the log until the next rollup
+                if self._event_log is not None and self._event_seq == saved_seq:
+                    self._event_log.flush()
+                    self._event_log.truncate(0)
+
+    def flush(self):
+        """Write tracked requests that haven't reached disk yet"""
+        if self._pending:
+            self._save_usage_data()
+
+    def _flush_event_log(self):
+        with self._lock:
+            if self._event_log is not None:
+                self._event_log.flush()
+
+    def _schedule_save(self):
+        """Count an unwritten change (caller holds _lock) and make sure the writer will pick it up"""
+        self._pending += 1
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._run_writer, name="usage-writer", daemon=True)
+            self._writer.start()
+        if self._pending >= self.max_pending and self._event_log is None:
+            self._wake.set()
+
+    def _run_writer(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._event_log is None:
+                self.flush()
+                continue
+
+            # Event log mode: push buffered events out every tick, roll the
+            # JSON file up only every rollup_interval
+            self._flush_event_log()
+            if time.monotonic() - self._last_rollup >= self.rollup_interval:
+                self.flush()
 
     def track_request(
         self,
         model: str,
         input_tokens: int,
         output_tokens: int,
-        operation: str = "analysis"
+        operation: str = "analysis",
+        cache_read_input_tokens: int = 0,
+        cache_creation_input_tokens: int = 0
     ):
-        """Track a single API request"""
+        """Track a single API request (cache_* are Anthropic prompt-cache tokens, billed on top of input_tokens)"""
 
         # Calculate cost
-        pricing = self.PRICING.get(model, {"input": 0, "output": 0})
+        pricing = self.PRICING.get(model, _ZERO_PRICING)
         input_cost = (input_tokens / 1_000_000) * pricing["input"]
+        input_cost += (cache_read_input_tokens / 1_000_000) * pricing["input"] * self.CACHE_READ_PRICE_FACTOR
+        input_cost += (cache_creation_input_tokens / 1_000_000) * pricing["input"] * self.CACHE_WRITE_PRICE_FACTOR
         output_cost = (output_tokens / 1_000_000) * pricing["output"]
         total_cost = input_cost + output_cost
 
-        # Update totals
-        self.usage_data["total_requests"] += 1
-        self.usage_data["total_input_tokens"] += input_tokens
-        self.usage_data["total_output_tokens"] += output_tokens
-        self.usage_data["total_cost"] += total_cost
-
-        # Update by model
-        if model not in self.usage_data["by_model"]:
-            self.usage_data["by_model"][model] = {
-                "requests": 0,
-                "input_tokens": 0,
-                "output_tokens": 0,
-                "cost": 0.0
-            }
-
-        self.usage_data["by_model"][model]["requests"] += 1
-        self.usage_data["by_model"][model]["input_tokens"] += input_tokens
-        self.usage_data["by_model"][model]["output_tokens"] += output_tokens
-        self.usage_data["by_model"][model]["cost"] += total_cost
-
-        # Update by date
-        today = datetime.now().strftime("%Y-%m-%d")
-        if today not in self.usage_data["by_date"]:
-            self.usage_data["by_date"][today] = {
-                "requests": 0,
-                "input_tokens": 0,
-                "output_tokens": 0,
-                "cost": 0.0
-            }
-
-        self.usage_data["by_date"][today]["requests"] += 1
-        self.usage_data["by_date"][today]["input_tokens"] += input_tokens
-        self.usage_data["by_date"][today]["output_tokens"] += output_tokens
-        self.usage_data["by_date"][today]["cost"] += total_cost
-
-        # Add request to history (keep last 100)
+        # One clock read for the day bucket and the history timestamp
+        now = datetime.now()
         request_record = {
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": now.isoformat(),
             "model": model,
             "operation": operation,
             "input_tokens": input_tokens,
             "output_tokens": output_tokens,
             "cost": total_cost
         }
+        if cache_read_input_tokens or cache_creation_input_tokens:
+            request_record["cache_read_input_tokens"] = cache_read_input_tokens
+            request_record["cache_creation_input_tokens"] = cache_creation_input_tokens
 
-        self.usage_data["requests"].append(request_record)
-        if len(self.usage_data["requests"]) > 100:
-            self.usage_data["requests"] = self.usage_data["requests"][-100:]
+        with self._lock:
+            self._month_cost(now)  # Rolls the month counter over before adding to it
+            self._month_cost_total += total_cost
+            self._apply_request(request_record)
 
-        # Save to disk
-        self._save_usage_data()
+            if self._event_log is not None:
+                self._event_seq += 1
+                self._event_log.write(
+                    orjson.dumps({"seq": self._event_seq, "request": request_record}, option=orjson.OPT_APPEND_NEWLINE)
+                )
+
+            # Written to disk by the background writer
+            self._schedule_save()
 
         logger.info(
             f"Tracked API usage: {model} - "
-            f"{input_tokens} input + {output_tokens} output tokens - "
+            f"{input_tokens} input + {output_tokens} output tokens "
+            f"({cache_read_input_tokens} cache read, {cache_creation_input_tokens} cache write) - "
             f"${total_cost:.4f}"
         )
 
+    def _apply_request(self, request_record: Dict):
+        """Add a request record to the totals, buckets and history (caller holds _lock)"""
+        usage_data = self.usage_data
+        model = request_record["model"]
+        input_tokens = request_record["input_tokens"]
+        output_tokens = request_record["output_tokens"]
+        cost = request_record["cost"]
+
+        # Update totals
+        usage_data["total_requests"] += 1
+        usage_data["total_input_tokens"] += input_tokens
+        usage_data["total_output_tokens"] += output_tokens
+        usage_data["total_cost"] += cost
+
+        # Update by model and by date (timestamp starts with YYYY-MM-DD); a new
+        # bucket is only allocated the first time a model or day is seen
+        by_model = usage_data["by_model"]
+        by_date = usage_data["by_date"]
+        today = request_record["timestamp"][:10]
+        model_bucket = by_model.get(model)
+        if model_bucket is None:
+            model_bucket = by_model[model] = self._empty_bucket()
+        day_bucket = by_date.get(today)
+        if day_bucket is None:
+            day_bucket = by_date[today] = self._empty_bucket()
+
+        for bucket in (model_bucket, day_bucket):
+            bucket["requests"] += 1
+            bucket["input_tokens"] += input_tokens
+            bucket["output_tokens"] += output_tokens
+            bucket["cost"] += cost
+
+        # Add request to history (the deque drops the oldest past REQUEST_HISTORY_SIZE)
+        usage_data["requests"].append(request_record)
+
     def get_usage_stats(self, days: int = 30) -> Dict:
         """Get usage statistics for the last N days"""
 
-        # Calculate date range
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=days)
-
-        # Filter by date
-        filtered_requests = [
-            req for req in self.usage_data["requests"]
-            if datetime.fromisoformat(req["timestamp"]) >= start_date
-        ]
-
-        # Calculate stats for period
-        period_stats = {
-            "requests": len(filtered_requests),
-            "input_tokens": sum(r["input_tokens"] for r in filtered_requests),
-            "output_tokens": sum(r["output_tokens"] for r in filtered_requests),
-            "cost": sum(r["cost"] for r in filtered_requests)
-        }
-
-        # Calculate current month's usage
+        # Period and month totals come from the per-day buckets (YYYY-MM-DD keys
+        # compare correctly as strings), so the request history isn't scanned
         now = datetime.now()
-        month_start = datetime(now.year, now.month, 1)
-        month_requests = [
-            req for req in self.usage_data["requests"]
-            if datetime.fromisoformat(req["timestamp"]) >= month_start
-        ]
-        month_cost = sum(r["cost"] for r in month_requests)
+        cutoff = (now - timedelta(days=days)).strftime("%Y-%m-%d")
+
+        period_stats = {"requests": 0, "input_tokens": 0, "output_tokens": 0, "cost": 0}
+        with self._lock:
+            for date_key, bucket in self.usage_data["by_date"].items():
+                if date_key >= cutoff:
+                    for field in period_stats:
+                        period_stats[field] += bucket[field]
+            month_cost = self._month_cost(now)
 
         # Get budget and calculate remaining
         monthly_budget = self.usage_data.get("monthly_budget", 10.0)
@@ -201,15 +380,81 @@ class UsageTracker:
                 "usage_percentage": usage_percentage
             },
             "by_model": self.usage_data["by_model"],
-            "recent_requests": self.usage_data["requests"][-10:]  # Last 10 requests
+            "recent_requests": list(self.usage_data["requests"])[-10:]  # Last 10 requests
+        }
+
+    def _month_cost(self, now: datetime) -> float:
+        """Cost tracked so far in now's calendar month (caller holds _lock)"""
+        month_prefix = now.strftime("%Y-%m")
+        if month_prefix != self._month_key:
+            # First use or month rollover: rebuild from the day buckets
+            self._month_key = month_prefix
+            self._month_cost_total = sum(
+                bucket["cost"]
+                for date_key, bucket in self.usage_data["by_date"].items()
+                if date_key.startswith(month_prefix)
+            )
+        return self._month_cost_total
+
+    def get_live_snapshot(self) -> Dict:
+        """
+        Last-24h usage, budget and most used model for /api/usage/live
+
+        Walks back through the request history only as far as 24 hours ago
+        instead of building the full get_usage_stats() payload.
+        """
+        now = datetime.now()
+        day_start = now - timedelta(days=1)
+
+        day_requests = 0
+        day_tokens = 0
+        day_cost = 0.0
+        with self._lock:
+            # History is in tracking order, newest last
+            for req in reversed(self.usage_data["requests"]):
+                if datetime.fromisoformat(req["timestamp"]) < day_start:
+                    break
+                day_requests += 1
+                day_tokens += req["input_tokens"] + req["output_tokens"]
+                day_cost += req["cost"]
+            month_cost = self._month_cost(now)
+
+        by_model = self.usage_data["by_model"]
+        most_used_model = max(by_model, key=lambda model: by_model[model]["requests"], default=None)
+        if most_used_model is not None and by_model[most_used_model]["requests"] <= 0:
+            most_used_model = None
+
+        monthly_budget = self.usage_data.get("monthly_budget", 10.0)
+
+        return {
+            "total_requests_24h": day_requests,
+            "total_cost_24h": round(day_cost, 4),
+            "total_cost_alltime": round(self.usage_data["total_cost"], 2),
+            "total_tokens_24h": day_tokens,
+            "most_used_model": most_used_model,
+            "monthly_budget": monthly_budget,
+            "remaining_credits": round(max(0, monthly_budget - month_cost), 2),
+            "usage_percentage": round(min(100, (month_cost / monthly_budget * 100) if monthly_budget > 0 else 0), 1),
+            "month_cost": round(month_cost, 4),
+            "recent_requests": list(self.usage_data["requests"])[-5:]  # Last 5 requests
         }
 
     def reset_usage(self):
         """Reset all usage data (use with caution!)"""
-        self.usage_data = self._create_empty_data()
+        with self._lock:
+            self.usage_data = self._create_empty_data()
+            self._month_key = None
+            self._pending += 1
         self._save_usage_data()
         logger.info("Usage data reset")
 
 
+# USAGE_EVENT_LOG=1 appends each request to usage_data.events.jsonl and only
+# rolls the JSON file up periodically (see UsageTracker event_log)
+USAGE_EVENT_LOG = os.getenv('USAGE_EVENT_LOG') == '1'
+
+# USAGE_DURABLE_WRITES=1 syncs each usage data write to disk (see UsageTracker durable)
+USAGE_DURABLE_WRITES = os.getenv('USAGE_DURABLE_WRITES') == '1'
+
 # Global tracker instance
-usage_tracker = UsageTracker()
+usage_tracker = UsageTracker(durable=USAGE_DURABLE_WRITES, event_log=USAGE_EVENT_LOG)
@@ -5,10 +5,49 @@ Generates waterfall bridge chart data showing how a metric changed
 from one period to another, driven by individual account movements.
 """
 
+import functools
+
+import numpy as np
 import pandas as pd
 from typing import List, Dict, Tuple, Optional
 from datetime import datetime
 
+_NO_ROWS = np.empty(0, dtype=np.intp)
+_NO_MOVEMENTS = (np.empty(0), np.empty(0), np.empty(0))
+
+# (category, sign of its movement's impact on the metric) per derived metric
+_DERIVED_COMPONENTS = {
+    'gross_profit': ('Gross Profit', [
+        ('Revenue', 1), ('Cost of Goods Sold', -1)
+    ]),
+    'operating_profit': ('Operating Profit', [
+        ('Revenue', 1), ('Cost of Goods Sold', -1), ('Operating Expenses', -1)
+    ]),
+    'net_profit': ('Net Profit', [
+        ('Revenue', 1), ('Cost of Goods Sold', -1), ('Operating Expenses', -1),
+        ('Financial Items', 1),  # Can be positive or negative
+        ('Non-Operating Items', 1),  # Can be positive or negative
+        ('Tax', -1)
+    ]),
+}
+
+
+def _top_positions(values: np.ndarray, n: int) -> np.ndarray:
+    """Positions of the n largest values, largest first (ties keep row order)"""
+    n = min(n, len(values))
+    if n <= 0:
+        return _NO_ROWS
+
+    # Partial partition finds the n-th largest value in O(N); only the
+    # candidates at or above it get sorted
+    if n < len(values):
+        kth = np.partition(values, len(values) - n)[len(values) - n]
+        candidates = np.flatnonzero(values >= kth)
+    else:
+        candidates = np.arange(len(values))
+    order = np.lexsort((candidates, -values[candidates]))
+    return candidates[order[:n]]
+
 
 class WaterfallCalculator:
     """Calculate waterfall bridge data for period comparisons"""
@@ -25,6 +64,8 @@ class WaterfallCalculator:
         self.df = df
         self.account_col = account_col
         self.category_col = category_col
+        self._movements_cache: Dict[Tuple[Tuple[str, ...], Tuple[str, ...]], Dict] = {}
+        self._float_columns: Dict[int, np.ndarray] = {}
 
     def calculate_waterfall(
         self,
@@ -47,96 +88,35 @@ class WaterfallCalculator:
         Returns:
             Dict with waterfall chart data
         """
-        # Filter data based on metric
+        # Rows for the metric
         if metric_filter:
-            df_filtered = self.df[self.df[self.category_col] == metric_filter].copy()
-        else:
+            rows = self._rows(metric_filter)
+        elif 'row_type' in self.df.columns:
             # If no filter, use all line items (exclude subtotals)
-            df_filtered = self.df[self.df.get('row_type', 'line_item') == 'line_item'].copy()
-
-        # Calculate period totals for each account
-        df_filtered['period1_total'] = df_filtered[period1_cols].sum(axis=1)
-        df_filtered['period2_total'] = df_filtered[period2_cols].sum(axis=1)
-        df_filtered['movement'] = df_filtered['period2_total'] - df_filtered['period1_total']
-
-        # Get total for each period
-        period1_value = df_filtered['period1_total'].sum()
-        period2_value = df_filtered['period2_total'].sum()
-        total_movement = period2_value - period1_value
-
-        # Identify top N drivers by absolute movement
-        df_filtered['abs_movement'] = df_filtered['movement'].abs()
-        top_drivers = df_filtered.nlargest(top_n, 'abs_movement')
-
-        # Calculate "Other" as sum of remaining accounts
-        other_accounts = df_filtered[~df_filtered.index.isin(top_drivers.index)]
-        other_movement = other_accounts['movement'].sum()
-
-        # Build waterfall data structure
-        categories = []
-        values = []
-        colors = []
-        measures = []  # For Plotly: 'absolute', 'relative', 'total'
-
-        # Starting bar (Period 1)
-        categories.append(f'Period 1')
-        values.append(period1_value)
-        colors.append('#3b82f6')  # Blue
-        measures.append('absolute')
-
-        # Individual driver bars
-        for idx, row in top_drivers.iterrows():
-            account_name = row[self.account_col]
-            movement = row['movement']
-
-            # Truncate long names
-            display_name = account_name[:30] + '...' if len(account_name) > 30 else account_name
-
-            categories.append(display_name)
-            values.append(movement)
-
-            # Color based on positive/negative
-            if movement > 0:
-                colors.append('#10b981')  # Green
-            else:
-                colors.append('#ef4444')  # Red
-
-            measures.append('relative')
-
-        # "Other" bar
-        if abs(other_movement) > 0.01:  # Only show if non-zero
-            categories.append('Other')
-            values.append(other_movement)
-
-            if other_movement > 0:
-                colors.append('#10b981')  # Green
-            else:
-                colors.append('#ef4444')  # Red
-
-            measures.append('relative')
-
-        # Ending bar (Period 2)
-        categories.append(f'Period 2')
-        values.append(period2_value)
-        colors.append('#3b82f6')  # Blue
-        measures.append('total')
+            rows = np.flatnonzero((self.df['row_type'] == 'line_item').to_numpy())
+        else:
+            rows = np.arange(len(self.df))
 
-        # Calculate y-axis min (80% of period 1 for better visualization)
-        y_min = period1_value * 0.8 if period1_value > 0 else period1_value * 1.2
+        # Period totals for each account, and for the metric
+        if metric_filter:
+            period1_totals, period2_totals, _ = self._category_movements(
+                period1_cols, period2_cols
+            ).get(metric_filter, _NO_MOVEMENTS)
+        else:
+            period1_totals = self._row_totals(period1_cols, rows)
+            period2_totals = self._row_totals(period2_cols, rows)
+        period1_value = period1_totals.sum()
+        period2_value = period2_totals.sum()
 
-        return {
-            'categories': categories,
-            'values': values,
-            'colors': colors,
-            'measures': measures,
-            'period1_value': round(period1_value, 2),
-            'period2_value': round(period2_value, 2),
-            'total_movement': round(total_movement, 2),
-            'total_movement_pct': round((total_movement / period1_value * 100), 2) if period1_value != 0 else 0,
-            'y_min': round(y_min, 2),
-            'top_drivers_count': len(top_drivers),
-            'other_movement': round(other_movement, 2)
-        }
+        return self._build_waterfall_structure(
+            period1_value,
+            period2_value,
+            rows,
+            period2_totals - period1_totals,
+            top_n,
+            'Period 1',
+            'Period 2'
+        )
 
     def get_available_periods(self, date_suffix: str = '_normalized') -> List[str]:
         """
@@ -148,20 +128,12 @@ class WaterfallCalculator:
         Returns:
             List of period strings in YYYY-MM format
         """
-        periods = []
-
         # Find all normalized date columns
         date_cols = [col for col in self.df.columns if col.endswith(date_suffix)]
 
-        # Get unique period values
-        for col in date_cols:
-            unique_periods = self.df[col].dropna().unique()
-            periods.extend(unique_periods)
-
-        # Remove duplicates and sort
-        periods = sorted(list(set(periods)))
-
-        return periods
+        # Unique period values across all of them in one pass
+        periods = pd.unique(self.df[date_cols].to_numpy().ravel()) if date_cols else np.empty(0)
+        return sorted(periods[~pd.isna(periods)].tolist())
 
     def suggest_period_ranges(self, periods: List[str]) -> Dict[str, List[str]]:
         """
@@ -198,16 +170,17 @@ class WaterfallCalculator:
             List of dicts with 'label', 'value', 'category'
         """
         metrics = []
+        categories = self._category_rows.keys()
 
         # Standard calculated metrics
-        if 'Revenue' in self.df[self.category_col].values:
+        if 'Revenue' in categories:
             metrics.append({
                 'label': 'Total Revenue',
                 'value': 'revenue',
                 'category': 'Revenue'
             })
 
-        if 'Cost of Goods Sold' in self.df[self.category_col].values:
+        if 'Cost of Goods Sold' in categories:
             metrics.append({
                 'label': 'Cost of Goods Sold',
                 'value': 'cogs',
@@ -215,14 +188,14 @@ class WaterfallCalculator:
             })
 
             # Gross Profit if we have both revenue and COGS
-            if 'Revenue' in self.df[self.category_col].values:
+            if 'Revenue' in categories:
                 metrics.append({
                     'label': 'Gross Profit',
                     'value': 'gross_profit',
                     'category': None  # Calculated
                 })
 
-        if 'Operating Expenses' in self.df[self.category_col].values:
+        if 'Operating Expenses' in categories:
             metrics.append({
                 'label': 'Operating Expenses',
                 'value': 'opex',
@@ -230,7 +203,7 @@ class WaterfallCalculator:
             })
 
             # Operating Profit if we have revenue, COGS, and opex
-            if 'Revenue' in self.df[self.category_col].values and 'Cost of Goods Sold' in self.df[self.category_col].values:
+            if 'Revenue' in categories and 'Cost of Goods Sold' in categories:
                 metrics.append({
                     'label': 'Operating Profit (EBIT)',
                     'value': 'operating_profit',
@@ -238,7 +211,7 @@ class WaterfallCalculator:
                 })
 
         # Net Income (if we have all components)
-        if all(cat in self.df[self.category_col].values for cat in ['Revenue', 'Cost of Goods Sold', 'Operating Expenses']):
+        if all(cat in categories for cat in ['Revenue', 'Cost of Goods Sold', 'Operating Expenses']):
             metrics.append({
                 'label': 'Net Profit',
                 'value': 'net_profit',
@@ -259,187 +232,141 @@ class WaterfallCalculator:
 
         These require combining multiple categories with proper signs
         """
-        if metric == 'gross_profit':
-            # Gross Profit = Revenue - COGS
-            return self._calculate_gross_profit_waterfall(period1_cols, period2_cols, top_n)
-
-        elif metric == 'operating_profit':
-            # Operating Profit = Gross Profit - Operating Expenses
-            return self._calculate_operating_profit_waterfall(period1_cols, period2_cols, top_n)
-
-        elif metric == 'net_profit':
-            # Net Profit = Operating Profit - Non-Operating - Tax
-            return self._calculate_net_profit_waterfall(period1_cols, period2_cols, top_n)
-
-        else:
+        if metric not in _DERIVED_COMPONENTS:
             raise ValueError(f"Unknown derived metric: {metric}")
 
-    def _calculate_gross_profit_waterfall(self, period1_cols: List[str], period2_cols: List[str], top_n: int) -> Dict:
-        """Calculate waterfall for Gross Profit = Revenue - COGS"""
+        # Gross Profit = Revenue - COGS; Operating Profit = Gross Profit - OpEx;
+        # Net Profit = Operating Profit +/- financial and non-operating items - Tax
+        metric_name, components = _DERIVED_COMPONENTS[metric]
+
+        period1_value = 0
+        period2_value = 0
+        all_rows = [_NO_ROWS]
+        all_impacts = [np.empty(0)]
+        movements = self._category_movements(period1_cols, period2_cols)
+        for category, sign in components:
+            if category not in movements:
+                # Category absent from the data (e.g. no Tax line yet)
+                continue
+            period1_totals, period2_totals, movement = movements[category]
+
+            period1_value += period1_totals.sum() * sign
+            period2_value += period2_totals.sum() * sign
+            all_rows.append(self._rows(category))
+            all_impacts.append(movement * sign)
 
-        # Get revenue and COGS data
-        revenue_df = self.df[self.df[self.category_col] == 'Revenue'].copy()
-        cogs_df = self.df[self.df[self.category_col] == 'Cost of Goods Sold'].copy()
-
-        # Calculate period totals
-        revenue_df['period1_total'] = revenue_df[period1_cols].sum(axis=1)
-        revenue_df['period2_total'] = revenue_df[period2_cols].sum(axis=1)
-        revenue_df['movement'] = revenue_df['period2_total'] - revenue_df['period1_total']
-
-        cogs_df['period1_total'] = cogs_df[period1_cols].sum(axis=1)
-        cogs_df['period2_total'] = cogs_df[period2_cols].sum(axis=1)
-        cogs_df['movement'] = cogs_df['period2_total'] - cogs_df['period1_total']
-
-        # Gross profit = Revenue - COGS
-        period1_gp = revenue_df['period1_total'].sum() - cogs_df['period1_total'].sum()
-        period2_gp = revenue_df['period2_total'].sum() - cogs_df['period2_total'].sum()
-
-        # Combine dataframes with proper signs
-        revenue_df['impact_on_gp'] = revenue_df['movement']  # Positive revenue increases GP
-        cogs_df['impact_on_gp'] = -cogs_df['movement']  # Positive COGS decreases GP
-
-        all_drivers = pd.concat([revenue_df, cogs_df])
-        all_drivers['abs_impact'] = all_drivers['impact_on_gp'].abs()
-
-        # Top drivers
-        top_drivers = all_drivers.nlargest(top_n, 'abs_impact')
-        other_movement = all_drivers[~all_drivers.index.isin(top_drivers.index)]['impact_on_gp'].sum()
-
-        # Build waterfall
         return self._build_waterfall_structure(
-            period1_gp,
-            period2_gp,
-            top_drivers,
-            other_movement,
-            'Gross Profit'
+            period1_value,
+            period2_value,
+            np.concatenate(all_rows),
+            np.concatenate(all_impacts),
+            top_n,
+            f'{metric_name}\nPeriod 1',
+            f'{metric_name}\nPeriod 2'
         )
 
-    def _calculate_operating_profit_waterfall(self, period1_cols: List[str], period2_cols: List[str], top_n: int) -> Dict:
-        """Calculate waterfall for Operating Profit = Revenue - COGS - OpEx"""
-
-        revenue_df = self.df[self.df[self.category_col] == 'Revenue'].copy()
-        cogs_df = self.df[self.df[self.category_col] == 'Cost of Goods Sold'].copy()
-        opex_df = self.df[self.df[self.category_col] == 'Operating Expenses'].copy()
-
-        # Calculate totals for each category
-        for df in [revenue_df, cogs_df, opex_df]:
-            df['period1_total'] = df[period1_cols].sum(axis=1)
-            df['period2_total'] = df[period2_cols].sum(axis=1)
-            df['movement'] = df['period2_total'] - df['period1_total']
-
-        # Operating profit calculation
-        period1_op = revenue_df['period1_total'].sum() - cogs_df['period1_total'].sum() - opex_df['period1_total'].sum()
-        period2_op = revenue_df['period2_total'].sum() - cogs_df['period2_total'].sum() - opex_df['period2_total'].sum()
-
-        # Impact on operating profit
-        revenue_df['impact_on_op'] = revenue_df['movement']
-        cogs_df['impact_on_op'] = -cogs_df['movement']
-        opex_df['impact_on_op'] = -opex_df['movement']
-
-        all_drivers = pd.concat([revenue_df, cogs_df, opex_df])
-        all_drivers['abs_impact'] = all_drivers['impact_on_op'].abs()
-
-        top_drivers = all_drivers.nlargest(top_n, 'abs_impact')
-        other_movement = all_drivers[~all_drivers.index.isin(top_drivers.index)]['impact_on_op'].sum()
-
-        return self._build_waterfall_structure(
-            period1_op,
-            period2_op,
-            top_drivers,
-            other_movement,
-            'Operating Profit'
-        )
+    @functools.cached_property
+    def _category_rows(self) -> Dict[str, np.ndarray]:
+        """Row positions of each category, grouped once"""
+        return self.df.groupby(self.category_col, sort=False).indices
+
+    def _rows(self, category: str) -> np.ndarray:
+        return self._category_rows.get(category, _NO_ROWS)
+
+    @functools.cached_property
+    def _col_pos(self) -> Dict[str, int]:
+        """Column name -> position, resolved once instead of per selection"""
+        return {name: i for i, name in enumerate(self.df.columns)}
+
+    def _cols_to_idx(self, columns: List[str]) -> np.ndarray:
+        return np.fromiter((self._col_pos[col] for col in columns), dtype=np.intp, count=len(columns))
+
+    def _row_totals(self, columns: List[str], rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Per-row sum of the given period columns (blanks count as 0)"""
+        # Each column is converted to float once and reused by later selections
+        arrays = []
+        for pos in self._cols_to_idx(columns).tolist():
+            if pos not in self._float_columns:
+                self._float_columns[pos] = self.df.iloc[:, pos].to_numpy(dtype=np.float64, na_value=np.nan)
+            arrays.append(self._float_columns[pos])
+
+        values = np.column_stack(arrays) if arrays else np.zeros((len(self.df), 0))
+        if rows is not None:
+            values = values[rows]
+        return np.nansum(values, axis=1)
+
+    def _category_movements(self, period1_cols: List[str], period2_cols: List[str]) -> Dict:
+        """
+        Period totals and movement of every account, grouped by category
 
-    def _calculate_net_profit_waterfall(self, period1_cols: List[str], period2_cols: List[str], top_n: int) -> Dict:
-        """Calculate waterfall for Net Profit (all categories)"""
-
-        # Get all categories
-        revenue_df = self.df[self.df[self.category_col] == 'Revenue'].copy()
-        cogs_df = self.df[self.df[self.category_col] == 'Cost of Goods Sold'].copy()
-        opex_df = self.df[self.df[self.category_col] == 'Operating Expenses'].copy()
-        financial_df = self.df[self.df[self.category_col] == 'Financial Items'].copy()
-        nonop_df = self.df[self.df[self.category_col] == 'Non-Operating Items'].copy()
-        tax_df = self.df[self.df[self.category_col] == 'Tax'].copy()
-
-        all_dfs = []
-
-        for df, sign in [
-            (revenue_df, 1),
-            (cogs_df, -1),
-            (opex_df, -1),
-            (financial_df, 1),  # Can be positive or negative
-            (nonop_df, 1),  # Can be positive or negative
-            (tax_df, -1)
-        ]:
-            if len(df) > 0:
-                df['period1_total'] = df[period1_cols].sum(axis=1)
-                df['period2_total'] = df[period2_cols].sum(axis=1)
-                df['movement'] = df['period2_total'] - df['period1_total']
-                df['impact_on_np'] = df['movement'] * sign
-                all_dfs.append(df)
-
-        # Combine all
-        all_drivers = pd.concat(all_dfs) if all_dfs else pd.DataFrame()
-
-        # Calculate net profit
-        period1_np = sum(df['period1_total'].sum() * sign for df, sign in [
-            (revenue_df, 1), (cogs_df, -1), (opex_df, -1),
-            (financial_df, 1), (nonop_df, 1), (tax_df, -1)
-        ] if len(df) > 0)
-
-        period2_np = sum(df['period2_total'].sum() * sign for df, sign in [
-            (revenue_df, 1), (cogs_df, -1), (opex_df, -1),
-            (financial_df, 1), (nonop_df, 1), (tax_df, -1)
-        ] if len(df) > 0)
-
-        all_drivers['abs_impact'] = all_drivers['impact_on_np'].abs()
-        top_drivers = all_drivers.nlargest(top_n, 'abs_impact')
-        other_movement = all_drivers[~all_drivers.index.isin(top_drivers.index)]['impact_on_np'].sum()
+        Computed once per period selection and shared by the derived metrics,
+        which overlap on Revenue and COGS.
 
-        return self._build_waterfall_structure(
-            period1_np,
-            period2_np,
-            top_drivers,
-            other_movement,
-            'Net Profit'
-        )
+        Returns:
+            Dict of category -> (period1 totals, period2 totals, movements)
+        """
+        key = (tuple(period1_cols), tuple(period2_cols))
+        if key not in self._movements_cache:
+            period1_totals = self._row_totals(period1_cols)
+            period2_totals = self._row_totals(period2_cols)
+            movements = period2_totals - period1_totals
+            self._movements_cache[key] = {
+                category: (period1_totals[rows], period2_totals[rows], movements[rows])
+                for category, rows in self._category_rows.items()
+            }
+        return self._movements_cache[key]
 
     def _build_waterfall_structure(
         self,
         period1_value: float,
         period2_value: float,
-        top_drivers: pd.DataFrame,
-        other_movement: float,
-        metric_name: str
+        rows: np.ndarray,
+        impacts: np.ndarray,
+        top_n: int,
+        start_label: str,
+        end_label: str
     ) -> Dict:
-        """Build standardized waterfall data structure"""
+        """
+        Build standardized waterfall data structure
+
+        Args:
+            period1_value: Metric value for period 1
+            period2_value: Metric value for period 2
+            rows: Row positions of the contributing accounts
+            impacts: Each account's signed movement on the metric
+            top_n: Number of top drivers to show (the rest are grouped as Other)
+            start_label: Label of the period 1 bar
+            end_label: Label of the period 2 bar
+        """
+        # Top N drivers by absolute impact; "Other" is the sum of the rest
+        top = _top_positions(np.abs(impacts), top_n)
+        rest = np.ones(len(impacts), dtype=bool)
+        rest[top] = False
+        other_movement = impacts[rest].sum()
 
         categories = []
         values = []
         colors = []
-        measures = []
+        measures = []  # For Plotly: 'absolute', 'relative', 'total'
 
         # Period 1
-        categories.append(f'{metric_name}\nPeriod 1')
+        categories.append(start_label)
         values.append(period1_value)
-        colors.append('#3b82f6')
+        colors.append('#3b82f6')  # Blue
         measures.append('absolute')
 
-        # Drivers
-        impact_col = [col for col in top_drivers.columns if col.startswith('impact_on')][0]
-
-        for idx, row in top_drivers.iterrows():
-            account_name = row[self.account_col]
-            impact = row[impact_col]
-
-            display_name = account_name[:30] + '...' if len(account_name) > 30 else account_name
-
-            categories.append(display_name)
-            values.append(impact)
-            colors.append('#10b981' if impact > 0 else '#ef4444')
-            measures.append('relative')
+        # Drivers (only the selected rows' names are pulled from the frame)
+        driver_impacts = impacts[top]
+        categories.extend(
+            # Truncate long names
+            name[:30] + '...' if len(name) > 30 else name
+            for name in self.df[self.account_col].iloc[rows[top]].tolist()
+        )
+        values.extend(driver_impacts.tolist())
+        colors.extend(np.where(driver_impacts > 0, '#10b981', '#ef4444').tolist())  # Green / red
+        measures.extend(['relative'] * len(top))
 
-        # Other
+        # Other (only shown if non-zero)
         if abs(other_movement) > 0.01:
             categories.append('Other')
             values.append(other_movement)
@@ -447,12 +374,13 @@ class WaterfallCalculator:
             measures.append('relative')
 
         # Period 2
-        categories.append(f'{metric_name}\nPeriod 2')
+        categories.append(end_label)
         values.append(period2_value)
         colors.append('#3b82f6')
         measures.append('total')
 
         total_movement = period2_value - period1_value
+        # y-axis min (80% of period 1 for better visualization)
         y_min = period1_value * 0.8 if period1_value > 0 else period1_value * 1.2
 
         return {
@@ -465,6 +393,6 @@ class WaterfallCalculator:
             'total_movement': round(total_movement, 2),
             'total_movement_pct': round((total_movement / period1_value * 100), 2) if period1_value != 0 else 0,
             'y_min': round(y_min, 2),
-            'top_drivers_count': len(top_drivers),
+            'top_drivers_count': len(top),
             'other_movement': round(other_movement, 2)
         }
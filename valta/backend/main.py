@@ -1,4 +1,5 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Depends
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from contextlib import asynccontextmanager
@@ -10,27 +11,37 @@ load_dotenv()
 
 # Import routers
 from app.routers import documents, analysis, auth, settings, startup_analytics, usage
-from app.database import engine, Base
+from app.database import engine, async_engine, Base, sync_schema
+from app.services.usage_tracker import usage_tracker
+from app.services.document_processor import shutdown_executor
 from app.models import document as document_models
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print("Starting Valta API server...")
+    # Create database tables at process start, not on every import of main
+    Base.metadata.create_all(bind=engine)
+    sync_schema()
     yield
     # Shutdown
     print("Shutting down Valta API server...")
+    await analysis.ai_analyzer.aclose()
+    shutdown_executor()
+    usage_tracker.flush()
+    await async_engine.dispose()
 
 app = FastAPI(
     title="Valta API",
     description="AI-powered financial document analysis API",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
+# Reject oversized uploads before their body is parsed (added first so CORS wraps it)
+app.middleware("http")(documents.limit_upload_size)
+
 # CORS middleware
 allowed_origins = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000,http://localhost:3001").split(",")
 app.add_middleware(
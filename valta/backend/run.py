@@ -16,13 +16,27 @@ if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
     debug = os.getenv("DEBUG", "True").lower() == "true"
 
+    # Usage tracking (usage_data.json), API keys set through /api/settings and
+    # the P&L/answer caches all live in the server process, so it must run as a
+    # single worker until that state is moved out of process
+    if int(os.getenv("WORKERS", 1)) != 1:
+        raise SystemExit(
+            "WORKERS must be 1: usage tracking, runtime API key settings and caches "
+            "are per-process state that multiple workers would split or overwrite"
+        )
+
     print(f"Starting Valta API server on {host}:{port}")
     print(f"Debug mode: {debug}")
 
+    # uvicorn[standard] installs uvloop and httptools; "auto" uses them where
+    # available (uvloop isn't available on Windows)
     uvicorn.run(
         "main:app",
         host=host,
         port=port,
         reload=debug,
+        workers=1,
+        loop="auto",
+        http="auto",
         log_level="info" if debug else "warning"
     )
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""
+Test setup: the app's relative paths (uploads/, usage_data.json, the SQLite
+database) point at a scratch directory, and the AI clients get dummy keys.
+This runs before any app module is imported.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+WORK_DIR = tempfile.mkdtemp(prefix="valta-tests-")
+os.chdir(WORK_DIR)
+os.environ["DATABASE_URL"] = f"sqlite:///{WORK_DIR}/test.db"
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("ANTHROPIC_API_KEY", "test-key")
+
+
+@pytest.fixture(scope="session")
+def client():
+    """TestClient running the app's lifespan (which creates the tables)"""
+    from fastapi.testclient import TestClient
+    from main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def db(client):
+    from app.database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def make_document(db):
+    """Insert a completed document row (no file or processing needed)"""
+    from app.models.document import Document
+
+    def make(content_hash: str, filename: str = "report.pdf", **fields) -> Document:
+        document = Document(
+            filename=filename,
+            original_filename=filename,
+            file_path=str(Path(WORK_DIR) / filename),
+            file_size=0,
+            mime_type="application/pdf",
+            content_hash=content_hash,
+            status="completed",
+            **fields
+        )
+        db.add(document)
+        db.commit()
+        db.refresh(document)
+        return document
+
+    return make
@@ -0,0 +1,44 @@
+from app.services.account_mapper import load_persisted_mappings, persist_mappings
+
+
+def test_persisted_mappings_are_shared_by_name_variants(client):
+    persist_mappings("model-a", {
+        "Office  Rent": {"category": "Operating Expenses", "subcategory": "Rent", "confidence": 0.8},
+    })
+
+    hits = load_persisted_mappings("model-a", ["office rent", " OFFICE RENT ", "Payroll"])
+
+    assert set(hits) == {"office rent", " OFFICE RENT "}
+    assert hits["office rent"] == {
+        "category": "Operating Expenses",
+        "subcategory": "Rent",
+        "is_subtotal": False,
+        "confidence": 0.8,
+        "method": "ai"
+    }
+
+
+def test_persisted_mappings_are_scoped_to_the_model(client):
+    persist_mappings("model-b", {"Sales": {"category": "Revenue"}})
+
+    assert load_persisted_mappings("model-c", ["Sales"]) == {}
+    assert load_persisted_mappings("model-b", ["Sales"])["Sales"]["confidence"] == 0.9
+
+
+def test_persisting_keeps_the_existing_mapping(client):
+    persist_mappings("model-d", {"Freight": {"category": "Cost of Goods Sold"}})
+    persist_mappings("model-d", {
+        "freight": {"category": "Operating Expenses"},
+        "Interest": {"category": "Financial Items"},
+    })
+
+    hits = load_persisted_mappings("model-d", ["Freight", "Interest"])
+
+    assert hits["Freight"]["category"] == "Cost of Goods Sold"
+    assert hits["Interest"]["category"] == "Financial Items"
+
+
+def test_empty_inputs_skip_the_database():
+    persist_mappings("model-e", {})
+
+    assert load_persisted_mappings("model-e", []) == {}
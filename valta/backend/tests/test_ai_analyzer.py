@@ -0,0 +1,137 @@
+import asyncio
+import threading
+
+from app.services import ai_analyzer as ai_analyzer_module
+from app.services.ai_analyzer import AIAnalyzer
+from app.services.document_content import render_structured_data
+
+STRUCTURED = {
+    "sheets": [{"name": "P&L", "column_names": ["Account", "Jan"], "data_sample": [{"Account": "Revenue", "Jan": 100}]}]
+}
+
+
+def test_multi_document_content_renders_plain_values_off_thread(db, make_document, monkeypatch):
+    stale = make_document("content-stale", raw_text="Stale doc\n", structured_data=STRUCTURED)
+    fresh = make_document("content-fresh", raw_text=None, rendered_content="already rendered")
+
+    render_args = []
+
+    def recording_render(structured_data):
+        render_args.append((threading.current_thread(), structured_data))
+        return render_structured_data(structured_data)
+
+    monkeypatch.setattr(ai_analyzer_module, "render_structured_data", recording_render)
+
+    contents = asyncio.run(AIAnalyzer()._build_contents_concurrently([stale, fresh]))
+
+    expected = render_structured_data(STRUCTURED)
+    assert contents == ["Stale doc\n" + expected, "already rendered"]
+    # Only the document missing rendered_content is rendered, from a plain dict in a worker thread
+    assert [args for _, args in render_args] == [STRUCTURED]
+    assert render_args[0][0] is not threading.main_thread()
+    # ...and the result is assigned back for the caller to persist
+    assert stale.rendered_content == expected
+
+
+def test_data_location_reports_first_number_cited_in_response():
+    lines = [
+        "=== Sheet: Income ===",
+        "Row 4: Account: Rent Revenue | Jan: 1,200 | Feb: 900",
+    ]
+    response = "Rent revenue fell to $900 in February from $1,200 in January."
+
+    location = AIAnalyzer()._find_data_location(response, lines, document_id=1)
+
+    assert location["row_number"] == 4
+    assert location["cell_value"] == "$900"
+
+
+def _run_multi_document_question(db, monkeypatch, document_count, question=None, hashes=None):
+    analyzer = AIAnalyzer()
+    hashes = hashes or [f"hash-{i}" for i in range(document_count)]
+    sources = [
+        {"id": i, "name": f"doc{i}.pdf", "content": f"Revenue {i}", "content_hash": hashes[i]}
+        for i in range(document_count)
+    ]
+    calls = {"per_document": 0, "combined": 0, "searched": 0}
+
+    async def load_sources(document_id, db):
+        return sources, "\n\n".join(f"Document: {s['name']}\n{s['content']}" for s in sources)
+
+    async def across_documents(question, sources_context):
+        calls["per_document"] += 1
+        return "synthesized", "test-model"
+
+    async def single_call(question, relevant_content):
+        calls["combined"] += 1
+        return "combined", "test-model"
+
+    real_get_relevant_chunks = analyzer._get_relevant_chunks
+
+    async def get_relevant_chunks(question, document_content, document_key=None):
+        calls["searched"] += 1
+        return await real_get_relevant_chunks(question, document_content, document_key)
+
+    monkeypatch.setattr(analyzer, "_load_sources", load_sources)
+    monkeypatch.setattr(analyzer, "_answer_across_documents", across_documents)
+    monkeypatch.setattr(analyzer, "_generate_claude_response", single_call)
+    monkeypatch.setattr(analyzer, "_get_relevant_chunks", get_relevant_chunks)
+    # Distinct question per run so the llm_cache table doesn't answer it
+    question = question or f"What was revenue across {document_count} docs?"
+    asyncio.run(analyzer.analyze_question(question, None, db))
+    return calls
+
+
+def test_multi_document_fan_out_is_capped(db, monkeypatch):
+    monkeypatch.setattr(ai_analyzer_module, "MULTI_DOCUMENT_FANOUT_LIMIT", 3)
+
+    assert _run_multi_document_question(db, monkeypatch, 3) == {"per_document": 1, "combined": 0, "searched": 0}
+    assert _run_multi_document_question(db, monkeypatch, 4) == {"per_document": 0, "combined": 1, "searched": 1}
+
+
+def test_fan_out_answers_are_cached_by_document_hashes(db, monkeypatch):
+    question = "How did margins move across the fan-out docs?"
+
+    assert _run_multi_document_question(db, monkeypatch, 2, question, ["fan-a", "fan-b"])["per_document"] == 1
+    # Same documents in another order: answered from llm_cache
+    assert _run_multi_document_question(db, monkeypatch, 2, question, ["fan-b", "fan-a"])["per_document"] == 0
+    # One document's content changed: answered again
+    assert _run_multi_document_question(db, monkeypatch, 2, question, ["fan-a", "fan-c"])["per_document"] == 1
+
+
+def _chunk_index_with_fake_embeddings(monkeypatch, content, document_key):
+    import numpy as np
+
+    analyzer = AIAnalyzer()
+
+    async def embed_texts(texts):
+        return np.ones((len(texts), 4), dtype=np.float32) / 2
+
+    monkeypatch.setattr(analyzer, "embed_texts", embed_texts)
+    return asyncio.run(analyzer._get_chunk_index(content, document_key))
+
+
+def test_embeddings_persist_per_document_and_are_removed_on_delete(client, make_document, monkeypatch):
+    document = make_document("embeddings-hash")
+    directory = ai_analyzer_module.embeddings_dir(document.content_hash)
+
+    _chunk_index_with_fake_embeddings(monkeypatch, "Revenue line\n" * 2_000, document.content_hash)
+    assert list(directory.glob("*.npy"))
+
+    assert client.delete(f"/api/documents/{document.id}").status_code == 200
+    assert not directory.exists()
+
+
+def test_multi_document_embeddings_are_not_persisted(monkeypatch):
+    before = set(ai_analyzer_module.EMBEDDINGS_DIR.rglob("*.npy"))
+
+    chunks, matrix = _chunk_index_with_fake_embeddings(monkeypatch, "Combined text\n" * 2_000, None)
+
+    assert matrix.shape[0] == len(chunks)
+    assert set(ai_analyzer_module.EMBEDDINGS_DIR.rglob("*.npy")) == before
+
+
+def test_nearly_valid_model_json_is_repaired():
+    content = "Here is the analysis:\n{summary: 'Revenue grew', // model comment\n \"metrics\": [1, 2,],}\nThanks"
+
+    assert AIAnalyzer._parse_json_object(content) == {"summary": "Revenue grew", "metrics": [1, 2]}
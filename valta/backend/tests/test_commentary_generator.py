@@ -0,0 +1,141 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import commentary_generator as commentary_module
+from app.services.commentary_generator import (
+    NO_SECTION_DATA,
+    CommentaryCache,
+    CommentaryGenerator,
+    MetricsView,
+)
+
+
+def _message(text):
+    return SimpleNamespace(content=[SimpleNamespace(text=text)])
+
+
+class StubMessages:
+    """messages.create plus messages.batches create/retrieve/results"""
+
+    def __init__(self):
+        self.errored = set()
+        self.fail_prompts = set()  # Live calls whose prompt contains one of these raise
+        self.fail_batch = False
+        self.live_calls = 0
+        self.batch_requests = None
+        self.batches = self
+
+    async def create(self, requests=None, **params):
+        if requests is not None:
+            # messages.batches.create
+            if self.fail_batch:
+                raise RuntimeError("batch submission failed")
+            self.batch_requests = requests
+            return SimpleNamespace(id="batch-1", processing_status="in_progress")
+
+        self.live_calls += 1
+        prompt = params["messages"][0]["content"]
+        if any(marker in prompt for marker in self.fail_prompts):
+            raise RuntimeError("API unavailable")
+        return _message(" live text ")
+
+    async def retrieve(self, batch_id):
+        return SimpleNamespace(id=batch_id, processing_status="ended")
+
+    async def results(self, batch_id):
+        async def entries():
+            for request in self.batch_requests:
+                custom_id = request["custom_id"]
+                if custom_id in self.errored:
+                    yield SimpleNamespace(custom_id=custom_id, result=SimpleNamespace(type="errored"))
+                else:
+                    yield SimpleNamespace(
+                        custom_id=custom_id,
+                        result=SimpleNamespace(type="succeeded", message=_message(f" batch {custom_id} "))
+                    )
+        return entries()
+
+
+@pytest.fixture
+def generator(monkeypatch):
+    monkeypatch.setattr(commentary_module, "commentary_cache", CommentaryCache())
+    monkeypatch.setattr(commentary_module, "BATCH_POLL_SECONDS", 0)
+    generator = CommentaryGenerator()
+    generator.client = SimpleNamespace(messages=StubMessages())
+    return generator
+
+
+def _jobs(count):
+    # Burn and growth data only, so runway and expense sections have no prompt
+    return [
+        ({"burn_rate": {"net_burn_avg": 1000 * (i + 1)}, "growth": {"mom_growth_latest": 2.0 + i}}, f"Co {i}", "Oct 2024")
+        for i in range(count)
+    ]
+
+
+def test_batch_falls_back_per_section_for_errored_entries(generator):
+    generator.client.messages.errored = {"1-burn_analysis"}
+    jobs = _jobs(4)
+
+    results = asyncio.run(generator.generate_full_commentary_batch(jobs))
+
+    messages = generator.client.messages
+    assert messages.live_calls == 0
+    # Three sections with data per job
+    assert len(messages.batch_requests) == 12
+    assert results[0]["burn_analysis"] == "batch 0-burn_analysis"
+    assert results[0]["runway_analysis"] == NO_SECTION_DATA["runway_analysis"]
+    assert results[1]["burn_analysis"] == generator._fallback_burn_analysis(MetricsView.from_metrics(jobs[1][0]))
+    assert results[1]["growth_analysis"] == "batch 1-growth_analysis"
+    assert results[3]["executive_summary"] == "batch 3-executive_summary"
+
+
+def test_fewer_jobs_than_batch_min_jobs_generate_live(generator):
+    jobs = _jobs(commentary_module.BATCH_MIN_JOBS)
+    # One job already cached leaves too few to batch
+    asyncio.run(generator.generate_full_commentary(*jobs[0]))
+    generator.client.messages.live_calls = 0
+
+    results = asyncio.run(generator.generate_full_commentary_batch(jobs))
+
+    assert generator.client.messages.batch_requests is None
+    assert generator.client.messages.live_calls == 3 * (len(jobs) - 1)
+    assert [result["burn_analysis"] for result in results] == ["live text"] * len(jobs)
+
+
+def test_batch_submission_failure_generates_live(generator):
+    generator.client.messages.fail_batch = True
+
+    results = asyncio.run(generator.generate_full_commentary_batch(_jobs(4)))
+
+    assert generator.client.messages.live_calls == 12
+    assert all(result["executive_summary"] == "live text" for result in results)
+
+
+def test_commentary_with_failed_sections_is_not_cached(generator):
+    messages = generator.client.messages
+    messages.fail_prompts = {"burn rate data"}
+    job = _jobs(1)[0]
+
+    degraded = asyncio.run(generator.generate_full_commentary(*job))
+    messages.fail_prompts = set()
+    recovered = asyncio.run(generator.generate_full_commentary(*job))
+    cached = asyncio.run(generator.generate_full_commentary(*job))
+
+    assert degraded["burn_analysis"] == generator._fallback_burn_analysis(MetricsView.from_metrics(job[0]))
+    assert recovered["burn_analysis"] == "live text"
+    assert cached is recovered
+    assert messages.live_calls == 6
+
+
+def test_batch_commentary_with_fallback_sections_is_not_cached(generator):
+    generator.client.messages.errored = {"1-burn_analysis"}
+    jobs = _jobs(4)
+
+    asyncio.run(generator.generate_full_commentary_batch(jobs))
+
+    cache = commentary_module.commentary_cache
+    assert cache.get(CommentaryCache.make_key(*jobs[0])) is not None
+    assert cache.get(CommentaryCache.make_key(*jobs[1])) is None
@@ -0,0 +1,33 @@
+import asyncio
+import os
+import signal
+
+from app.services import document_processor as document_processor_module
+from app.services.document_processor import DocumentProcessor
+
+
+def _start_worker():
+    executor = document_processor_module._get_executor()
+    executor.submit(os.getpid).result(timeout=60)
+    return executor
+
+
+def test_killed_worker_fails_the_document_and_the_pool_is_rebuilt(db, make_document):
+    document = make_document("worker-killed")
+    broken = _start_worker()
+    try:
+        for process in list(broken._processes.values()):
+            os.kill(process.pid, signal.SIGKILL)
+            process.join()
+
+        asyncio.run(DocumentProcessor().process_document_async(document.id, document.file_path))
+
+        db.refresh(document)
+        assert document.status == "failed"
+        assert document_processor_module._executor is None
+
+        # The next document gets a working pool
+        fresh = _start_worker()
+        assert fresh is not broken
+    finally:
+        document_processor_module.shutdown_executor()
@@ -0,0 +1,42 @@
+from app.routers import documents as documents_router
+
+
+def _list(client, **params):
+    response = client.get("/api/documents/", params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+def _clear_documents(db):
+    from app.models.document import Document
+
+    db.query(Document).delete()
+    db.commit()
+    documents_router._invalidate_document_count()
+
+
+def test_list_without_limit_returns_every_document(client, db, make_document):
+    _clear_documents(db)
+    ids = [make_document(f"list-all-{i}").id for i in range(60)]
+
+    body = _list(client)
+
+    assert [doc["id"] for doc in body["documents"]] == sorted(ids, reverse=True)
+    assert body["next_cursor"] is None
+    assert body["total"] == 60
+
+
+def test_cursor_pages_cover_all_documents_once(client, db, make_document):
+    _clear_documents(db)
+    ids = [make_document(f"paged-{i}").id for i in range(7)]
+
+    seen = []
+    params = {"limit": 3}
+    while True:
+        body = _list(client, **params)
+        seen.extend(doc["id"] for doc in body["documents"])
+        if body["next_cursor"] is None:
+            break
+        params["cursor"] = body["next_cursor"]
+
+    assert seen == sorted(ids, reverse=True)
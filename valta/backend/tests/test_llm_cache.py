@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from app.services.llm_cache import get_cached_response, make_input_hash, store_response
+
+
+def test_input_hash_separates_parts():
+    assert make_input_hash("ab", "c") != make_input_hash("a", "bc")
+    assert make_input_hash("ab", "c") == make_input_hash("ab", "c")
+    assert len(make_input_hash("ab")) == 32
+
+
+def test_stored_response_round_trips_per_prompt_version(db):
+    input_hash = make_input_hash("document text", "question")
+
+    store_response(db, input_hash, "v1", {"answer": "Revenue rose 10%", "sources": [1]})
+
+    assert get_cached_response(db, input_hash, "v1") == {"answer": "Revenue rose 10%", "sources": [1]}
+    assert get_cached_response(db, input_hash, "v2") is None
+    assert get_cached_response(db, make_input_hash("other"), "v1") is None
+
+
+def test_storing_again_refreshes_the_entry(db):
+    input_hash = make_input_hash("refresh")
+
+    store_response(db, input_hash, "v1", {"answer": "old"})
+    store_response(db, input_hash, "v1", {"answer": "new"})
+
+    assert get_cached_response(db, input_hash, "v1") == {"answer": "new"}
+
+
+def test_expired_entries_are_ignored(db):
+    input_hash = make_input_hash("expired")
+
+    store_response(db, input_hash, "v1", {"answer": "stale"}, ttl=timedelta(seconds=-1))
+
+    assert get_cached_response(db, input_hash, "v1") is None
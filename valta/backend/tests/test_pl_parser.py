@@ -0,0 +1,64 @@
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from app.services.pl_parser import PLParser, promote_header_row
+
+PL_CSV = (
+    "Acme Corp,,,\n"
+    "Profit and Loss,,,\n"
+    ",,,\n"
+    "Account,Jan 2024,Feb 2024,Mar 2024\n"
+    "Revenue,1000,1200,1300\n"
+    "Cost of Goods Sold,400,450,500\n"
+    "Gross Profit,600,750,800\n"
+    "Rent,100,100,100\n"
+)
+
+
+@pytest.fixture
+def pl_csv(tmp_path):
+    path = tmp_path / "pl.csv"
+    path.write_text(PL_CSV)
+    return path
+
+
+@pytest.mark.parametrize("header_row", [0, 2, 3])
+def test_promote_header_row_matches_csv_header_read(pl_csv, header_row):
+    raw = pd.read_csv(pl_csv, header=None)
+
+    promoted = promote_header_row(raw, header_row, text_labels=True)
+
+    pdt.assert_frame_equal(promoted, pd.read_csv(pl_csv, header=header_row))
+
+
+def test_promote_header_row_labels_blank_and_repeated_columns(tmp_path):
+    path = tmp_path / "dupes.csv"
+    path.write_text("Account,Jan,,Jan\nRevenue,1,2,3\n")
+    raw = pd.read_csv(path, header=None)
+
+    promoted = promote_header_row(raw, 0, text_labels=True)
+
+    assert list(promoted.columns) == list(pd.read_csv(path, header=0).columns)
+    assert list(promoted.columns) == ["Account", "Jan", "Unnamed: 2", "Jan.1"]
+
+
+def test_promote_header_row_matches_excel_header_read(tmp_path):
+    path = tmp_path / "pl.xlsx"
+    pd.read_csv(pd.io.common.StringIO(PL_CSV), header=None).to_excel(path, header=False, index=False)
+    raw = pd.read_excel(path, header=None, engine="openpyxl")
+
+    promoted = promote_header_row(raw, 3)
+
+    pdt.assert_frame_equal(promoted, pd.read_excel(path, header=3, engine="openpyxl"))
+
+
+def test_parse_file_promotes_detected_header_row(pl_csv):
+    result = PLParser().parse_file(str(pl_csv))
+    data, metadata = result["data"], result["metadata"]
+
+    assert metadata["header_row"] == 3
+    assert metadata["columns"]["account"] == "Account"
+    assert data["Account"].tolist() == ["Revenue", "Cost of Goods Sold", "Gross Profit", "Rent"]
+    assert data["Feb 2024"].tolist() == [1200, 450, 750, 100]
+    assert data.loc[data["Account"] == "Gross Profit", "row_type"].item() == "subtotal"
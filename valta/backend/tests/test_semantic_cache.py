@@ -0,0 +1,92 @@
+import asyncio
+
+import numpy as np
+
+from app.services.semantic_cache import SemanticAnswerCache, document_cache_key, invalidate_document
+
+
+async def _same_embedding(texts):
+    # Every question embeds identically, so only the cache's own rules can tell them apart
+    return np.ones((len(texts), 4), dtype=np.float32) / 2
+
+
+def _lookup(cache, scope, question):
+    return asyncio.run(cache.lookup(scope, question))
+
+
+def _store(cache, scope, question, answer):
+    _, embedding = _lookup(cache, scope, question)
+    cache.store(scope, question, answer, embedding)
+
+
+def test_exact_and_near_match_hit():
+    cache = SemanticAnswerCache(embed_fn=_same_embedding)
+    _store(cache, "hash-a", "What was revenue in March 2024?", "answer")
+
+    assert _lookup(cache, "hash-a", "  what was REVENUE in march 2024?")[0] == "answer"
+    assert _lookup(cache, "hash-a", "Revenue for March 2024?")[0] == "answer"
+
+
+def test_near_match_with_different_period_or_number_misses():
+    cache = SemanticAnswerCache(embed_fn=_same_embedding)
+    _store(cache, "hash-a", "What was revenue in March 2024?", "march answer")
+
+    assert _lookup(cache, "hash-a", "What was revenue in April 2024?")[0] is None
+    assert _lookup(cache, "hash-a", "What was revenue in March 2023?")[0] is None
+    assert _lookup(cache, "hash-a", "What was revenue in Q1 2024?")[0] is None
+
+
+def test_scopes_are_separate():
+    cache = SemanticAnswerCache(embed_fn=_same_embedding)
+    _store(cache, "hash-a", "What was revenue?", "a")
+
+    assert _lookup(cache, "hash-b", "What was revenue?")[0] is None
+
+
+def test_invalidate_document_drops_its_scope_and_multi_document_scopes():
+    cache = SemanticAnswerCache(embed_fn=_same_embedding)
+    _store(cache, "hash-a", "What was revenue?", "a")
+    _store(cache, "hash-b", "What was revenue?", "b")
+    _store(cache, frozenset({"hash-b", "hash-c"}), "What was revenue?", "all")
+
+    invalidate_document("hash-a")
+
+    assert _lookup(cache, "hash-a", "What was revenue?")[0] is None
+    assert _lookup(cache, "hash-b", "What was revenue?")[0] == "b"
+    assert _lookup(cache, frozenset({"hash-b", "hash-c"}), "What was revenue?")[0] is None
+
+
+def test_deleted_document_answers_are_not_served(client, db, make_document):
+    from app.routers.analysis import AnalysisResponse, _cache_scope, answer_cache
+
+    document = make_document("hash-deleted")
+    scope = _cache_scope(db, document)
+    answer_cache.store(scope, "What was revenue?", AnalysisResponse(
+        answer="old", sources=[], confidence_score=1.0, processing_time=0.1
+    ))
+
+    response = client.delete(f"/api/documents/{document.id}")
+    assert response.status_code == 200
+    assert _lookup(answer_cache, scope, "What was revenue?")[0] is None
+
+    # A new upload that reuses the id gets its own scope
+    db.expunge_all()
+    replacement = make_document("hash-new")
+    assert document_cache_key(replacement) != scope
+
+
+def test_cached_answer_is_still_recorded(client, db, make_document):
+    from app.routers.analysis import AnalysisResponse, _cache_scope, answer_cache
+
+    document = make_document("hash-recorded")
+    question = "What was the gross margin in June?"
+    answer_cache.store(_cache_scope(db, document), question, AnalysisResponse(
+        answer="cached answer", sources=[], confidence_score=0.9, processing_time=0.2
+    ))
+
+    response = client.post("/api/analysis/ask", json={"question": question, "document_id": document.id})
+    assert response.status_code == 200
+    assert response.json()["answer"] == "cached answer"
+
+    recent = client.get("/api/analysis/queries/recent").json()
+    assert any(query["question"] == question for query in recent)
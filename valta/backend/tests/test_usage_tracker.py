@@ -0,0 +1,83 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import orjson
+
+from app.services.usage_tracker import UsageTracker
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+
+def _event_log_tracker(path):
+    # Rollups only when flushed explicitly
+    return UsageTracker(storage_path=str(path), event_log=True, rollup_interval=3600)
+
+
+def test_event_log_is_replayed_after_a_crash(tmp_path):
+    path = tmp_path / "usage.json"
+    tracker = _event_log_tracker(path)
+    tracker.track_request("gpt-4", 1000, 500)
+    tracker.flush()  # Rollup: JSON file has one request, log is empty
+    tracker.track_request("gpt-4", 2000, 0)
+    tracker.track_request("claude-3-5-sonnet-20240620", 100, 100)
+    tracker._flush_event_log()
+    # Crash: no further rollup; a torn half-line ends the log
+    with open(tracker.event_log_path, "ab") as f:
+        f.write(b'{"seq": 4, "requ')
+
+    assert orjson.loads(path.read_bytes())["total_requests"] == 1
+
+    restarted = _event_log_tracker(path)
+
+    assert restarted.usage_data["total_requests"] == 3
+    assert restarted.usage_data["total_input_tokens"] == 3100
+    assert restarted.usage_data["by_model"]["gpt-4"]["requests"] == 2
+    # Replayed events are rolled into the JSON file, and replaying again adds nothing
+    assert orjson.loads(path.read_bytes())["total_requests"] == 3
+    assert _event_log_tracker(path).usage_data["total_requests"] == 3
+
+
+def test_event_log_appends_after_a_torn_line(tmp_path):
+    path = tmp_path / "usage.json"
+    tracker = _event_log_tracker(path)
+    tracker.track_request("gpt-4", 10, 10)
+    tracker._flush_event_log()
+    with open(tracker.event_log_path, "ab") as f:
+        f.write(b'{"seq"')
+
+    restarted = _event_log_tracker(path)
+    restarted.track_request("gpt-4", 20, 20)
+    restarted._flush_event_log()
+
+    assert _event_log_tracker(path).usage_data["total_requests"] == 2
+
+
+def test_durable_writes_replace_the_file(tmp_path):
+    path = tmp_path / "usage.json"
+    tracker = UsageTracker(storage_path=str(path), durable=True)
+    tracker.track_request("gpt-4", 1000, 500)
+    tracker.flush()
+
+    assert orjson.loads(path.read_bytes())["total_requests"] == 1
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def _global_tracker_settings(tmp_path, **env_vars):
+    env = dict(os.environ, PYTHONPATH=str(BACKEND_DIR), **env_vars)
+    script = (
+        "from app.services.usage_tracker import usage_tracker\n"
+        "print(usage_tracker._event_log is not None, usage_tracker.durable)"
+    )
+
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=tmp_path, env=env, capture_output=True, text=True, check=True
+    )
+    return result.stdout.strip()
+
+
+def test_global_tracker_modes_come_from_the_environment(tmp_path):
+    assert _global_tracker_settings(tmp_path, USAGE_EVENT_LOG="0", USAGE_DURABLE_WRITES="0") == "False False"
+    assert _global_tracker_settings(tmp_path, USAGE_EVENT_LOG="1", USAGE_DURABLE_WRITES="0") == "True False"
+    assert _global_tracker_settings(tmp_path, USAGE_EVENT_LOG="0", USAGE_DURABLE_WRITES="1") == "False True"
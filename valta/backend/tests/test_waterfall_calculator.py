@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.waterfall_calculator import WaterfallCalculator, _top_positions
+
+PERIOD1 = ["Jan", "Feb"]
+PERIOD2 = ["Mar", "Apr"]
+
+
+@pytest.fixture
+def pl_frame():
+    return pd.DataFrame(
+        [
+            ["Product sales", "Revenue", "line_item", 100, 100, 150, 170],
+            ["Service revenue", "Revenue", "line_item", 50, 50, 40, 40],
+            ["Total Revenue", "Total", "subtotal", 150, 150, 190, 210],
+            ["Materials", "Cost of Goods Sold", "line_item", 30, 30, 40, 40],
+            ["Rent", "Operating Expenses", "line_item", 10, 10, 10, None],
+            ["Interest", "Financial Items", "line_item", -5, -5, -5, -5],
+        ],
+        columns=["Account", "category", "row_type", "Jan", "Feb", "Mar", "Apr"],
+    )
+
+
+def test_filtered_waterfall_uses_category_rows(pl_frame):
+    result = WaterfallCalculator(pl_frame, "Account").calculate_waterfall(
+        "Total Revenue", PERIOD1, PERIOD2, metric_filter="Revenue"
+    )
+
+    assert result["categories"] == ["Period 1", "Product sales", "Service revenue", "Period 2"]
+    assert result["values"] == [300, 120, -20, 400]
+    assert result["measures"] == ["absolute", "relative", "relative", "total"]
+    assert result["colors"] == ["#3b82f6", "#10b981", "#ef4444", "#3b82f6"]
+    assert result["total_movement"] == 100
+    assert result["total_movement_pct"] == 33.33
+    assert result["top_drivers_count"] == 2
+    assert result["other_movement"] == 0
+
+
+def test_unfiltered_waterfall_skips_subtotals_and_groups_the_rest(pl_frame):
+    result = WaterfallCalculator(pl_frame, "Account").calculate_waterfall(
+        "All", PERIOD1, PERIOD2, top_n=2
+    )
+
+    # Service revenue and Materials tie on |20|; the earlier row wins
+    assert result["categories"] == ["Period 1", "Product sales", "Service revenue", "Other", "Period 2"]
+    assert result["values"] == [370, 120, -20, 10, 480]
+    assert result["other_movement"] == 10
+
+
+def test_waterfall_without_row_type_uses_every_row(pl_frame):
+    result = WaterfallCalculator(pl_frame.drop(columns="row_type"), "Account").calculate_waterfall(
+        "All", PERIOD1, PERIOD2
+    )
+
+    assert result["period1_value"] == 670
+    assert result["period2_value"] == 880
+
+
+def test_unknown_filter_gives_an_empty_waterfall(pl_frame):
+    result = WaterfallCalculator(pl_frame, "Account").calculate_waterfall(
+        "Tax", PERIOD1, PERIOD2, metric_filter="Tax"
+    )
+
+    assert result["categories"] == ["Period 1", "Period 2"]
+    assert result["values"] == [0, 0]
+    assert result["top_drivers_count"] == 0
+
+
+def test_gross_profit_signs_cogs_against_revenue(pl_frame):
+    result = WaterfallCalculator(pl_frame, "Account").calculate_derived_metric(
+        "gross_profit", PERIOD1, PERIOD2
+    )
+
+    assert result["categories"] == [
+        "Gross Profit\nPeriod 1", "Product sales", "Service revenue", "Materials", "Gross Profit\nPeriod 2"
+    ]
+    assert result["values"] == [240, 120, -20, -20, 320]
+
+
+def test_net_profit_skips_absent_categories(pl_frame):
+    calculator = WaterfallCalculator(pl_frame, "Account")
+
+    operating = calculator.calculate_derived_metric("operating_profit", PERIOD1, PERIOD2)
+    net = calculator.calculate_derived_metric("net_profit", PERIOD1, PERIOD2)
+
+    assert (operating["period1_value"], operating["period2_value"]) == (220, 310)
+    # No Tax or Non-Operating Items rows; Interest adds -10 to both periods
+    assert (net["period1_value"], net["period2_value"]) == (210, 300)
+    assert net["top_drivers_count"] == 5
+    assert len(calculator._movements_cache) == 1
+
+
+def test_unknown_derived_metric_raises(pl_frame):
+    with pytest.raises(ValueError):
+        WaterfallCalculator(pl_frame, "Account").calculate_derived_metric("ebitda", PERIOD1, PERIOD2)
+
+
+def test_long_driver_names_are_truncated(pl_frame):
+    pl_frame.loc[0, "Account"] = "Product sales to enterprise customers"
+
+    result = WaterfallCalculator(pl_frame, "Account").calculate_waterfall(
+        "Total Revenue", PERIOD1, PERIOD2, metric_filter="Revenue"
+    )
+
+    assert result["categories"][1] == "Product sales to enterprise cu..."
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_top_positions_matches_a_stable_descending_sort(seed):
+    rng = np.random.default_rng(seed)
+    values = rng.integers(0, 5, size=rng.integers(0, 30)).astype(float)
+
+    for n in (0, 1, 3, len(values), len(values) + 2):
+        expected = np.argsort(-values, kind="stable")[:max(n, 0)]
+        assert _top_positions(values, n).tolist() == expected.tolist()
+
+
+def test_available_periods_are_unique_and_sorted():
+    df = pd.DataFrame({
+        "Account": ["Sales"],
+        "Feb_normalized": ["2024-02"],
+        "Jan_normalized": ["2024-01"],
+        "Jan2_normalized": ["2024-01"],
+        "Blank_normalized": [None],
+        "Jan": [1],
+    })
+    calculator = WaterfallCalculator(df, "Account")
+
+    assert calculator.get_available_periods() == ["2024-01", "2024-02"]
+    assert calculator.get_available_periods("_missing") == []
+
+
+def test_metric_options_follow_categories(pl_frame):
+    options = WaterfallCalculator(pl_frame, "Account").get_metric_options()
+    revenue_only = WaterfallCalculator(pl_frame[pl_frame["category"] == "Revenue"], "Account").get_metric_options()
+
+    assert [option["value"] for option in options] == [
+        "revenue", "cogs", "gross_profit", "opex", "operating_profit", "net_profit"
+    ]
+    assert [option["value"] for option in revenue_only] == ["revenue"]
@@ -374,10 +374,17 @@ export const exportStartupReport = async (
   content: string | any
   content_type: string
 }> => {
+  // The endpoint returns the raw report body; rebuild the envelope callers expect
   const response = await api.post(`/api/startup/export/${documentId}`, {}, {
-    params: { format }
+    params: { format },
+    responseType: 'text'
   })
-  return response.data
+  return {
+    success: true,
+    format,
+    content: format === 'json' ? JSON.parse(response.data) : response.data,
+    content_type: String(response.headers['content-type'] || '').split(';')[0]
+  }
 }
 
 export const copyToClipboard = async (text: string): Promise<void> => {